@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Convert translation graphs between pickle files and corpus directories
+
+The output format is a corpus if the output name ends in ".tgc" and a pickle
+file otherwise.
+"""
+
+import argparse
+import logging
+import os
+
+from tg.corpus import load_graphs, save_graphs
+from tg.utils import set_default_log
+
+
+log = logging.getLogger(os.path.basename(__file__))
+
+
+parser = argparse.ArgumentParser(description=__doc__)
+
+parser.add_argument(
+    "in_fname",
+    metavar="IN_FILE",
+    help="pickle file or corpus directory containing translation graphs")
+
+parser.add_argument(
+    "out_fname",
+    metavar="OUT_FILE",
+    help="output pickle file or corpus directory")
+
+parser.add_argument(
+    "-n", "--n-graphs",
+    metavar="N",
+    type=int,
+    help="convert only the first N graphs")
+
+parser.add_argument(
+    "-v", "--verbose",
+    action="store_true")
+
+args = parser.parse_args()
+
+if args.verbose:
+    set_default_log()
+
+save_graphs(load_graphs(args.in_fname, args.n_graphs), args.out_fname)
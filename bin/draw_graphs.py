@@ -11,6 +11,7 @@ import logging
 import os
 import pprint
 
+from tg.corpus import GraphCorpus, is_corpus
 from tg.draw import Draw
 from tg.utils import set_default_log
 
@@ -22,10 +23,15 @@ def draw_graphs(graphs_fname, out_format, out_dir, i, j, best_score_attr,
                 base_score_attrs):
     log.info("Settings:\n" + pprint.pformat(locals()))
     log.info("loading graphs from " + graphs_fname) 
-    graphs = cPickle.load(open(graphs_fname))  
+    
+    if is_corpus(graphs_fname):
+        # decode only the graphs in range
+        graphs = GraphCorpus(graphs_fname)[i:j]
+    else:
+        graphs = cPickle.load(open(graphs_fname))[i:j]
     
     draw = Draw()
-    draw(graphs[i:j], out_format=out_format, out_dir=out_dir,
+    draw(graphs, out_format=out_format, out_dir=out_dir,
          best_score_attr=best_score_attr, base_score_attrs=base_score_attrs)
 
 
@@ -34,7 +40,7 @@ parser = argparse.ArgumentParser(description=__doc__)
 parser.add_argument(
     "graphs_fname",
     metavar="GRAPHS_FILE",
-    help="pickle file containing translation graphs")
+    help="pickle file or corpus directory containing translation graphs")
 
 parser.add_argument(
     "-a", "--base-score-attrs",
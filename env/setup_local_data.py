@@ -13,7 +13,7 @@ from tg.transdict import TransDict, TransDictGreek
 from tg.counts import mk_counts_pkl
 from tg.eval import lemmatize
 from tg.utils import create_dirs
-from tg.exps.preproc import preprocess
+from tg.exps.preproc import preprocess_data_set
 from tg.sample import filter_sample_vocab
 
 
@@ -30,26 +30,62 @@ def create_all():
 #-----------------------------------------------------------------------------
 
 def create_dict_pkl(lang_pairs=("de-en", "en-de", "gr-de", "gr-en", "no-en",
-                                "no-de")):
+                                "no-de"),
+                    workers=1):
+    # lang pairs with the same lexicon, one of them reversed, are created 
+    # from a single parse
+    lexicons = {}
+    
     for lang_pair in lang_pairs:
-        if lang_pair.startswith("gr-"):
-            trans_dict_class = TransDictGreek
-        else:
-            trans_dict_class = TransDict
-            
         try:
             reverse = config["dict"][lang_pair].as_bool("reverse")
         except KeyError:
             reverse = False
             
         dict_fname = config["dict"][lang_pair]["xml_fname"]
-        posmap_fname = config["dict"][lang_pair]["posmap_fname"]
-        trans_dict = trans_dict_class.from_xml(dict_fname, 
-                                               reverse=reverse, 
-                                               pos_map=posmap_fname)
-        pkl_fname = config["dict"][lang_pair]["pkl_fname"]
-        create_dirs(pkl_fname)
-        trans_dict.dump(pkl_fname)
+        lexicons.setdefault(dict_fname, {})[reverse] = lang_pair
+        
+    for dict_fname, directions in lexicons.items():
+        if directions.values()[0].startswith("gr-"):
+            trans_dict_class = TransDictGreek
+        else:
+            trans_dict_class = TransDict
+            
+        pos_maps = dict( (reverse, config["dict"][lang_pair]["posmap_fname"])
+                         for reverse, lang_pair in directions.items() )
+            
+        if len(directions) == 2:
+            trans_dicts = trans_dict_class.from_xml_pair(
+                dict_fname, 
+                pos_map=pos_maps[False],
+                reverse_pos_map=pos_maps[True],
+                workers=workers)
+            trans_dicts = zip((False, True), trans_dicts)
+        else:
+            reverse = directions.keys()[0]
+            trans_dicts = [ (reverse,
+                             trans_dict_class.from_xml(
+                                 dict_fname, 
+                                 reverse=reverse, 
+                                 pos_map=pos_maps[reverse],
+                                 workers=workers)) ]
+            
+        for reverse, trans_dict in trans_dicts:
+            lang_pair = directions[reverse]
+            pkl_fname = config["dict"][lang_pair]["pkl_fname"]
+            create_dirs(pkl_fname)
+            trans_dict.dump(pkl_fname)
+            trans_dict.dump_compiled(
+                config["dict"][lang_pair]["compiled_fname"])
+
+
+def create_compiled_dicts(lang_pairs=("de-en", "en-de", "gr-de", "gr-en",
+                                      "no-en", "no-de")):
+    # compiled dictionaries from pickled ones, for when the XML lexicons
+    # are not available
+    for lang_pair in lang_pairs:
+        trans_dict = TransDict.load(config["dict"][lang_pair]["pkl_fname"])
+        trans_dict.dump_compiled(config["dict"][lang_pair]["compiled_fname"])
 
 
 #-----------------------------------------------------------------------------
@@ -74,7 +110,8 @@ def create_counts_pkl(languages=("de", "en", "gr", "no")):
 
 def create_lemma_data(data=("metis", "presemt-dev", 
                             "wmt08", "wmt09", "wmt10", "wmt11"),
-                      lang_pairs=()):
+                      lang_pairs=(),
+                      cache=config["tagger"]["cache_fname"]):
     for data_set in data:
         for lang_pair in lang_pairs or config["eval"][data_set].keys():
             target_lang = lang_pair.split("-")[1]
@@ -83,7 +120,8 @@ def create_lemma_data(data=("metis", "presemt-dev",
             lemmatize(
                 config["eval"][data_set][lang_pair]["word_ref_fname"],
                 target_lang,
-                outf=lemma_ref_fname)
+                outf=lemma_ref_fname,
+                cache=cache)
             
             
 #-----------------------------------------------------------------------------
@@ -93,10 +131,13 @@ def create_lemma_data(data=("metis", "presemt-dev",
 
 def create_graphs(data=("metis", "presemt-dev",
                         "wmt08","wmt09", "wmt10", "wmt11"),
-                  lang_pairs=()):
+                  lang_pairs=(),
+                  cache=config["tagger"]["cache_fname"]):
     for data_set in data:
-        for lang_pair in lang_pairs or config["eval"][data_set].keys():
-            preprocess(data_set, lang_pair)
+        # language pairs with the same source share its annotation
+        pairs = [ lang_pair for lang_pair in config["eval"][data_set].keys()
+                  if not lang_pairs or lang_pair in lang_pairs ]
+        preprocess_data_set(data_set, pairs, cache=cache)
             
 #-----------------------------------------------------------------------------
 # filter samples
@@ -57,7 +57,7 @@ def accuracy_score(graphs, ref_fname, score_attr):
             log.debug(u"checking source node {!r} with lemma {!r}".format(
                 u, graph.lemma(u)))
             score, v = graph.max_score(u, score_attr)
-            if v:
+            if v is not None:
                 target_lemma = graph.lemma(v)
                 log.debug("  best translation is node {!r} with lemma {!r} "
                           "({}={:.3f})".format(
@@ -6,6 +6,7 @@ import codecs
 import cPickle
 import logging
 
+from tg import symbols
 from tg.config import config
 
 log = logging.getLogger(__name__)
@@ -61,7 +62,10 @@ class AmbiguityMap():
                 if subset and source_lempos not in subset:
                     continue
     
-                source_target_map.setdefault(source_lempos, []).append(target_lempos)
+                # lempos strings are shared with graphs and dictionaries
+                source_target_map.setdefault(
+                    symbols.lempos.intern(source_lempos), []).append(
+                        symbols.lempos.intern(target_lempos))
 
         return source_target_map
     
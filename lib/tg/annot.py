@@ -8,24 +8,111 @@ constructing linguistically annotated translation graphs
 # - more documentation
 
 import codecs
+import collections
 import cStringIO
+import itertools
 import logging
+from multiprocessing.pool import ThreadPool
 import re
 import subprocess
+import threading
+import time
 import urllib
 import xml.etree.ElementTree as et
+from xml.sax.saxutils import escape
 
 import suds
 
 from tg.config import config
 from tg.transgraph import TransGraph
 from tg.exception import TGException
+from tg.taggerpool import get_pool, run_tagger
+from tg.annotcache import get_cache, cache_key
 
 
 
 log = logging.getLogger(__name__)
 
 
+# entity and character references in XML text
+XML_REF_RE = re.compile(r"&(amp|lt|gt|quot|apos|#[0-9]+|#x[0-9a-fA-F]+);")
+
+XML_ENTITIES = dict(amp=u"&", lt=u"<", gt=u">", quot=u'"', apos=u"'")
+
+
+
+class AnnotationStats(object):
+    """
+    Statistics of annotation runs
+
+    Time is recorded per stage of annotation:
+
+    - encoding: conversion of input and output to and from the tagger's
+      character encoding
+    - tagger: waiting for the external tagger or web service
+    - parsing: parsing of tagger output
+    - graphs: construction of translation graphs from tokens
+
+    Stage times are summed over threads, so with parallel annotation their
+    total exceeds wall time, and tokens per second are per thread.
+    """
+
+    stages = "encoding", "tagger", "parsing", "graphs"
+
+    counts = ( "sentences", "tokens", "cached_sentences", "unknown_lemmas",
+               "bytes_in", "bytes_out" )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.seconds = dict.fromkeys(self.stages, 0.0)
+        for name in self.counts:
+            setattr(self, name, 0)
+
+    def add(self, seconds=None, **counts):
+        """
+        add seconds per stage and counts (e.g. tokens=10)
+        """
+        with self._lock:
+            for stage, value in (seconds or {}).items():
+                self.seconds[stage] += value
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    @property
+    def total_seconds(self):
+        return sum(self.seconds.values())
+
+    @property
+    def tokens_per_second(self):
+        try:
+            return self.tokens / self.total_seconds
+        except ZeroDivisionError:
+            return 0.0
+
+    def report(self):
+        """
+        return statistics as text
+        """
+        lines = [ "{}: {}".format(name.replace("_", " "), getattr(self, name))
+                  for name in self.counts ]
+        total = self.total_seconds or 1.0
+
+        for stage in self.stages:
+            lines.append("{} time: {:.3f}s ({:.1f}%)".format(
+                stage, self.seconds[stage],
+                100 * self.seconds[stage] / total))
+
+        lines.append("tokens per second: {:.1f}".format(
+            self.tokens_per_second))
+        return "\n".join(lines)
+
+    def log(self, title="annotation statistics"):
+        log.info(title + ":\n" + self.report())
+
+
 
 class Annotator(object):
     """
@@ -36,6 +123,32 @@ class Annotator(object):
     # string value to use for unknown values (POS tag or lemma)
     unknown = "__UNKNOWN__"    
     
+    # Annotators running an external tagger can keep a pool of long-lived
+    # tagger processes (see tg.taggerpool), where pool_size is the number of
+    # processes and zero means that a new process is started for every call.
+    # Markers must be copied by the tagger to its output and flush_text
+    # pushes them through any buffers.
+    pool_size = 0
+    begin_marker = None
+    end_marker = None
+    flush_text = u""
+
+    # default number of sentences per call to the tagger when annotating
+    # incrementally (see iter_sentences)
+    batch_size = 1000
+    
+    # Optional cache of annotated sentences (see tg.annotcache), used when
+    # sentence boundaries are given, i.e. not for free text
+    cache = None
+    
+    # changed whenever the annotation of a sentence changes, so annotations
+    # cached before are not used
+    cache_version = 2
+    
+    def __init__(self):
+        # statistics of all annotation by this annotator
+        self.stats = AnnotationStats()
+
     def annot_text(self, text, encoding=None, errors='strict'):
         """
         Annotate free text
@@ -94,7 +207,7 @@ class Annotator(object):
         return self.annot_text(text)
     
     def annot_sentences(self, sentences, encoding=None, errors='strict',
-                        ids=None):
+                        ids=None, workers=1):
         """
         Annotate sentences
         
@@ -110,6 +223,8 @@ class Annotator(object):
             character encoding; if None, sentences assumed to be unicode strings
         ids: iterable of strings
             sentence identifiers
+        workers: int
+            number of shards of sentences to tag in parallel
             
         Returns
         -------
@@ -120,7 +235,10 @@ class Annotator(object):
             sentences = (s.decode(encoding, errors=errors) for s in sentences)
         # else there is no cheap way to check all sentences are unicode
         
-        return self._annot_sentences(sentences, ids)
+        if workers > 1:
+            return self._annot_shards(sentences, ids, workers)
+        
+        return self._annot_cached(sentences, ids)
     
     def annot_xml(self, source, xml_sent_tag="seg", id_attr="id"):
         """
@@ -151,7 +269,8 @@ class Annotator(object):
         inf = cStringIO.StringIO(source)
         return self.annot_xml_file(inf, xml_sent_tag, id_attr)
         
-    def annot_xml_file(self, inf, xml_sent_tag="seg", id_attr="id"):
+    def annot_xml_file(self, inf, xml_sent_tag="seg", id_attr="id",
+                       workers=1):
         """
         Annotate sentences from XML input
         
@@ -167,6 +286,8 @@ class Annotator(object):
             xml tag for sentences
         id_attr: string
             attribute of xml sentence tag that identifies the sentence
+        workers: int
+            number of shards of sentences to tag in parallel
         
         Returns
         -------
@@ -175,15 +296,312 @@ class Annotator(object):
         """
         sentences, ids = self._extract_sentences_from_xml(inf, xml_sent_tag,
                                                           id_attr)
-        return self._annot_sentences(sentences, ids)
+        if workers > 1:
+            return self._annot_shards(sentences, ids, workers)
+        
+        return self._annot_cached(sentences, ids)
+
+    def iter_sentences(self, sentences, encoding=None, errors='strict',
+                       ids=None, batch_size=None, workers=1):
+        """
+        Annotate sentences incrementally
+
+        Like annot_sentences, but sentences are read lazily and passed to
+        the tagger in batches, and graphs are yielded as soon as their batch
+        is annotated. Memory use is therefore bounded by the batch size
+        rather than the size of the input.
+
+        Parameters
+        ----------
+        sentences: iterable of unicode strings
+            sequence of sentences
+        encoding: string
+            character encoding; if None, sentences assumed to be unicode strings
+        ids: iterable of strings
+            sentence identifiers; if None, sentences are numbered from 001
+        batch_size: int
+            number of sentences per call to the tagger; if None,
+            self.batch_size is used
+        workers: int
+            number of batches to tag in parallel
+
+        Returns
+        -------
+        graphs: generator
+            generator of Transgraph instances, in order of input sentences
+        """
+        if encoding:
+            sentences = (s.decode(encoding, errors=errors) for s in sentences)
+        if ids is None:
+            ids = ( "{:03d}".format(i+1) for i in itertools.count() )
+
+        pairs = itertools.izip(sentences, ids)
+        return self._iter_batches(pairs, batch_size, workers)
+
+    def iter_xml_file(self, inf, xml_sent_tag="seg", id_attr="id",
+                      batch_size=None, workers=1):
+        """
+        Annotate sentences from XML input incrementally
+
+        Like annot_xml_file, but sentences are parsed lazily and passed to
+        the tagger in batches, and graphs are yielded as soon as their batch
+        is annotated (see iter_sentences).
+
+        Parameters
+        ----------
+        inf: file or string
+            file or filename with xml input
+        xml_sent_tag: string
+            xml tag for sentences
+        id_attr: string
+            attribute of xml sentence tag that identifies the sentence
+        batch_size: int
+            number of sentences per call to the tagger; if None,
+            self.batch_size is used
+        workers: int
+            number of batches to tag in parallel
+
+        Returns
+        -------
+        graphs: generator
+            generator of Transgraph instances, in order of input sentences
+        """
+        pairs = self._iter_sentences_from_xml(inf, xml_sent_tag, id_attr)
+        return self._iter_batches(pairs, batch_size, workers)
+
+    def iter_text_file(self, inf, encoding="utf-8", errors='strict',
+                       batch_size=None):
+        """
+        Annotate free text from file incrementally
+
+        Like annot_text_file, but text is read lazily and passed to the
+        tagger in batches, and graphs are yielded as soon as their batch is
+        annotated. As sentences may span lines, text is only split at empty
+        lines (i.e. between paragraphs), once a batch holds at least
+        batch_size lines.
+
+        Parameters
+        ----------
+        inf: file or string
+            file or filename with text input
+        encoding: string
+            character encoding
+        errors: string
+            how to handle encoding conversion errors (cf. str.encode())
+        batch_size: int
+            minimal number of lines per call to the tagger; if None,
+            self.batch_size is used
+
+        Returns
+        -------
+        graphs: generator
+            generator of Transgraph instances, in order of input sentences
+        """
+        if not hasattr(inf, "read"):
+            inf = codecs.open(inf, encoding=encoding, errors=errors)
+        batch_size = batch_size or self.batch_size
+        lines = []
+        n = 0
+
+        for line in inf:
+            lines.append(line)
+
+            if len(lines) >= batch_size and not line.strip():
+                for graph in self._annot_text(u"".join(lines)):
+                    n += 1
+                    graph.graph["n"] = n
+                    yield graph
+                lines = []
+
+        if u"".join(lines).strip():
+            for graph in self._annot_text(u"".join(lines)):
+                n += 1
+                graph.graph["n"] = n
+                yield graph
+
+    def _iter_batches(self, pairs, batch_size=None, workers=1):
+        # annotate (sentence, id) pairs in batches, numbering graphs
+        # consecutively over all batches
+        batch_size = batch_size or self.batch_size
+        batches = iter(lambda: list(itertools.islice(pairs, batch_size)), [])
+        n = 0
+
+        if workers > 1:
+            results = self._iter_parallel(batches, workers)
+        else:
+            results = itertools.imap(self._annot_batch, batches)
+
+        for graphs in results:
+            for graph in graphs:
+                n += 1
+                graph.graph["n"] = n
+                yield graph
+
+    def _iter_parallel(self, batches, workers):
+        # Annotate batches in a pool of threads, which is sufficient because
+        # the actual tagging happens in external processes, and yield results
+        # in order of input. At most 2 * workers batches are read ahead, so
+        # memory use remains bounded.
+        pool = ThreadPool(workers)
+        pending = collections.deque()
+
+        try:
+            for batch in batches:
+                pending.append(pool.apply_async(self._annot_batch, (batch,)))
+
+                if len(pending) == 2 * workers:
+                    yield pending.popleft().get()
+
+            while pending:
+                yield pending.popleft().get()
+        finally:
+            pool.terminate()
+
+    def _annot_batch(self, batch):
+        sentences, ids = zip(*batch)
+        log.info("annotating batch of {} sentences starting at {}".format(
+            len(batch), ids[0]))
+        return self._annot_cached(sentences, ids)
+
+    def _annot_shards(self, sentences, ids, workers):
+        # split sentences into one shard per worker and annotate shards in
+        # parallel
+        sentences = list(sentences)
+        if not ids:
+            ids = [ "{:03d}".format(i+1) for i in range(len(sentences)) ]
+        shard_size = max(1, -(-len(sentences) // workers))
+        pairs = itertools.izip(sentences, ids)
+        return list(self._iter_batches(pairs, shard_size, workers))
+
+    def _annot_cached(self, sentences, ids=None):
+        # annotate sentences, taking the tokens of sentences annotated before
+        # from the cache and running the tagger on the others only
+        if self.cache is None:
+            return self._annot_sentences(sentences, ids)
+        
+        sentences = list(sentences)
+        if not ids:
+            ids = [ "{:03d}".format(i+1) for i in range(len(sentences)) ]
+        keys = [ self._cache_key(sent) for sent in sentences ]
+        tokens = self.cache.get_many(keys)
+        missing = [ i for i, key in enumerate(keys) if key not in tokens ]
+        graphs = {}
+        
+        if missing:
+            log.info("tagging {} of {} sentences not in cache".format(
+                len(missing), len(sentences)))
+            new_graphs = self._annot_sentences(
+                [ sentences[i] for i in missing ],
+                [ ids[i] for i in missing ])
+            
+            # tokens must never be cached under the key of another sentence
+            if len(new_graphs) != len(missing):
+                raise TGException("annotation of {} sentences resulted in {} "
+                                  "graphs".format(len(missing), 
+                                                  len(new_graphs)))
+            
+            graphs = dict(zip(missing, new_graphs))
+            self.cache.put_many( (keys[i], self._graph_tokens(graphs[i]))
+                                 for i in missing )
+        
+        graph_list = []
+        start = time.time()
+        n_tokens = 0
+        
+        for i, (key, graph_id) in enumerate(zip(keys, ids)):
+            graph = graphs.get(i)
+            if graph is None:
+                graph = self._graph_from_tokens(tokens[key], graph_id, i + 1)
+                n_tokens += len(tokens[key])
+            else:
+                graph.graph["n"] = i + 1
+            graph_list.append(graph)
+            
+        n_cached = len(sentences) - len(missing)
+        self.stats.add({"graphs": time.time() - start}, 
+                       sentences=n_cached, 
+                       tokens=n_tokens,
+                       cached_sentences=n_cached)
+        return graph_list
+    
+    def _cache_key(self, sentence):
+        # everything that determines the annotation of a sentence
+        return cache_key(self.__class__.__name__,
+                         self.cache_version,
+                         getattr(self, "command", ""),
+                         getattr(self, "tagger_encoding", ""),
+                         getattr(self, "replace_unknown_lemma", ""),
+                         sentence)
+    
+    def _graph_tokens(self, graph):
+        return tuple( (d["word"], d["lemma"], d["pos"]) + 
+                      ((d["tag"],) if "tag" in d else ())
+                      for _, d in graph.source_nodes_iter(data=True, 
+                                                          ordered=True) )
+    
+    def _graph_from_tokens(self, tokens, graph_id, n):
+        graph = self._add_new_graph(graph_id=graph_id, n=n)
+        prev_node = None
         
+        for token in tokens:
+            attr = dict(word=token[0], lemma=token[1], pos=token[2])
+            if len(token) > 3:
+                attr["tag"] = token[3]
+            new_node = graph.add_source_node(**attr)
+            
+            if prev_node:
+                graph.add_word_order_edge(prev_node, new_node)
+            else:
+                graph.set_source_start_node(new_node)
+            prev_node = new_node
+                
+        return graph
+    
+    def _new_seconds(self):
+        return dict.fromkeys(AnnotationStats.stages, 0.0)
+    
+    def _add_stats(self, seconds, parsing, graph_list, n_tokens):
+        # add stats for a call to the tagger, where parsing is the time spent
+        # on parsing its output, excluding the other stages
+        seconds["parsing"] = parsing
+        self.stats.add(seconds, sentences=len(graph_list), tokens=n_tokens)
+    
+    def _init_cache(self, cache):
+        # cache is an AnnotationCache, a file name or None
+        if isinstance(cache, basestring):
+            cache = get_cache(cache)
+        self.cache = cache
+
     def _extract_sentences_from_xml(self, inf, xml_sent_tag, id_attr):
         # this assumes that a sentence contains no internal XML markup 
-        # (e.g. <b>...</b>)
-        pairs =  ( ( elem.text, elem.get(id_attr))
+        # (e.g. <b>...</b>); empty sentences have no text
+        pairs =  ( ( elem.text or u"", elem.get(id_attr))
                    for _, elem in et.iterparse(inf)
                    if elem.tag == xml_sent_tag )
         return zip(*pairs)
+
+    def _iter_sentences_from_xml(self, inf, xml_sent_tag, id_attr):
+        # like _extract_sentences_from_xml, but yields (sentence, id) pairs
+        # and removes elements from their parent once they are parsed, so
+        # memory use is bounded by the depth of the tree
+        stack = []
+
+        for event, elem in et.iterparse(inf, events=("start", "end")):
+            if event == "start":
+                stack.append(elem)
+                continue
+
+            stack.pop()
+
+            if elem.tag == xml_sent_tag:
+                yield elem.text or u"", elem.get(id_attr)
+
+            if stack:
+                stack[-1].remove(elem)
+
+    def _tagger_pool(self):
+        return get_pool(self.pool_size, self.command, self.tagger_encoding,
+                        self.begin_marker, self.end_marker, self.flush_text)
         
     def _add_new_graph(self, graph_id=None, n=None):
         log.info("creating graph (id={}, n={})".format(graph_id, n))
@@ -210,13 +628,22 @@ class TreeTagger(Annotator):
     # string used by TreeTagger for unknown lemmas
     unknown_lemma = u"<unknown>"
     
+    # TreeTagger copies SGML tags to its output
+    begin_marker = u"<tg-batch-begin/>"
+    end_marker = u"<tg-batch-end/>"
+    # enough tokens to fill the output buffer of the tokenizer in 
+    # TreeTagger's wrapper scripts
+    flush_text = u".\n" * 4096
+    
     def __init__(self, command, tagger_encoding, eos_pos_tag=None,
-                 replace_unknown_lemma=True):
+                 replace_unknown_lemma=True, pool_size=0, cache=None):
         Annotator.__init__(self)
         self.command = command
         self.tagger_encoding = tagger_encoding
         self.eos_pos_tag = eos_pos_tag
         self.replace_unknown_lemma = replace_unknown_lemma
+        self.pool_size = pool_size
+        self._init_cache(cache)
         
     def annot_xml(self, source, xml_sent_tag="seg", id_attr="id"):
         #  strip utf-8 byte-order-mark
@@ -228,38 +655,26 @@ class TreeTagger(Annotator):
             encoding = m.groups()[0]
         else:
             encoding = "utf-8"
-        source = source.decode(encoding)
+            
+        # recode only if tagger expects another encoding
+        if ( codecs.lookup(encoding).name != 
+             codecs.lookup(self.tagger_encoding).name ):
+            start = time.time()
+            source = source.decode(encoding)
+            self.stats.add({"encoding": time.time() - start})
         
         # run Treetagger
-        tagger_out = self._tree_tagger(source)
-        
-        # XML parser interprets "<unknown>" as an XML tag and crashes when it
-        # finds no matching "</unknown>" tag, so replace by __UNKNOWN__
-        tagger_out = tagger_out.replace(self.unknown_lemma, self.unknown)
+        seconds = self._new_seconds()
+        lines = self._tree_tagger(source, seconds)
+        return self._extract_sentences_from_output(lines, xml_sent_tag, 
+                                                   id_attr, seconds)
         
-        # Replace illegal ampercents too
-        tagger_out = tagger_out.replace(u"&", u"&amp;")
-
-        # tagger_out is unicode but XML parser expects byte string
-        # (cStringIO cannot cope with unicode either)
-        tagger_out = tagger_out.encode("utf-8")
-        graph_list = []        
-        
-        for _, elem in et.iterparse(cStringIO.StringIO(tagger_out)):
-            if elem.tag == xml_sent_tag:
-                graph = self._add_new_graph(graph_id=elem.get(id_attr),
-                                            n=len(graph_list) + 1)
-                graph_list.append(graph)
-                prev_node = None
-                text = elem.text.strip()
-                
-                if text:
-                    for line in text.split(u"\n"):
-                        prev_node, _ = self._add_new_node(line, graph, 
-                                                          prev_node)
-        return graph_list
+    def annot_xml_file(self, inf, xml_sent_tag="seg", id_attr="id",
+                       workers=1):
+        if workers > 1 or self.cache is not None:
+            return Annotator.annot_xml_file(self, inf, xml_sent_tag, id_attr,
+                                            workers)
         
-    def annot_xml_file(self, inf, xml_sent_tag="seg", id_attr="id"):
         if isinstance(inf, basestring):
             inf = open(inf)
             
@@ -267,8 +682,9 @@ class TreeTagger(Annotator):
         return self.annot_xml(source, xml_sent_tag, id_attr)
         
     def _annot_text(self, text):
-        tagger_out = self._tree_tagger(text)
-        return self._extract_sentences_from_text(tagger_out)
+        seconds = self._new_seconds()
+        lines = self._tree_tagger(text, seconds)
+        return self._extract_sentences_from_text(lines, seconds)
     
     def _annot_sentences(self, sentences, ids=None):
         xml_sent_tag = "seg"
@@ -276,61 +692,160 @@ class TreeTagger(Annotator):
         if not ids:
             ids = ("{:03d}".format(i+1) for i in range(len(sentences)))
         source = self._embed_in_xml(sentences, xml_sent_tag, id_attr, ids)
-        return self.annot_xml(source, xml_sent_tag, id_attr)
+        seconds = self._new_seconds()
+        lines = self._tree_tagger(source, seconds)
+        return self._extract_sentences_from_output(lines, xml_sent_tag, 
+                                                   id_attr, seconds)
     
     def _embed_in_xml(self, sentences, xml_sent_tag, id_attr, ids):
         # Embed sentences in a simple xml strcture.
         # Default Treetagger skips xml tags but keep them in its output,
-        # so sentence boundaries are retained.
-        text = u"<doc>\n"
+        # so sentence boundaries are retained. Sentences are escaped, so the
+        # tagger gets the same input as when tagging the XML they came from.
+        parts = [u"<doc>\n"]
             
         for sent, id in zip(sentences, ids):
-            text += u'<{0} {1}="{2}">{3}</{4}>\n'.format(xml_sent_tag,
-                                                         id_attr,
-                                                         id,
-                                                         sent, 
-                                                         xml_sent_tag)
-        text += u"</doc>\n"
-        return text.encode("utf-8")
-        
-    def _tree_tagger(self, text):
-        log.debug(u"TreeTagger input:\n" + text)
+            parts.append(u'<{0} {1}="{2}">{3}</{4}>\n'.format(
+                xml_sent_tag,
+                id_attr,
+                escape(unicode(id), {'"': "&quot;"}),
+                escape(sent), 
+                xml_sent_tag))
+        parts.append(u"</doc>\n")
+        return u"".join(parts)
         
-        # convert from unicode to given encoding
-        # we may loose some data here!
-        text = text.encode(self.tagger_encoding, "backslashreplace")
+    def _tree_tagger(self, text, seconds):
+        # Run TreeTagger on text, which is either unicode or a byte string in
+        # the tagger's encoding, and yield lines of output as unicode strings
+        # without line ends, as soon as they are read. Time spent on encoding
+        # and waiting for the tagger is added to seconds.
+        debug = log.isEnabledFor(logging.DEBUG)
+        timer = time.time
+        start = timer()
         
-        # create pipe to tagger
-        log.debug("Calling TreeTagger as " + self.command)
-        tagger_proc = subprocess.Popen(self.command, 
-                                       shell=True,
-                                       stdin=subprocess.PIPE, 
-                                       stdout=subprocess.PIPE,
-                                       stderr=subprocess.PIPE)
-
-        # send text and retrieve tagger output 
-        tagger_out, tagger_err = tagger_proc.communicate(text)
+        if isinstance(text, unicode):
+            if debug:
+                log.debug(u"TreeTagger input:\n" + text)
+            # convert from unicode to given encoding
+            # we may loose some data here!
+            text = text.encode(self.tagger_encoding, "backslashreplace")
+            
+        bytes_in = len(text)
+            
+        if self.pool_size:
+            lines = self._tagger_pool().iter_tag(text, decode=False)
+        else:
+            lines = run_tagger(self.command, text)
+            
+        lines = iter(lines)
+        bytes_out = 0
+        t0 = timer()
+        seconds["encoding"] += t0 - start
         
-        # and convert back from given encoding to unicode
-        tagger_out = tagger_out.decode(self.tagger_encoding, 
-                                       "replace")        
-        log.debug(u"TreeTagger standard output:\n" + tagger_out)
-        log.debug(u"TreeTagger standard error:\n" + tagger_err)
+        while True:
+            line = next(lines, None)
+            t1 = timer()
+            seconds["tagger"] += t1 - t0
+            if line is None:
+                break
+            bytes_out += len(line)
+            line = line.decode(self.tagger_encoding, "replace").rstrip(u"\r\n")
+            if debug:
+                log.debug(u"TreeTagger output: " + line)
+            t0 = timer()
+            seconds["encoding"] += t0 - t1
+            yield line
+            t0 = timer()
+            
+        self.stats.add(bytes_in=bytes_in, bytes_out=bytes_out)
+    
+    def _extract_sentences_from_output(self, lines, xml_sent_tag, id_attr,
+                                       seconds=None):
+        # Tagger output for XML input consists of token lines and SGML tags
+        # copied from the input, each on a line of its own, so it is parsed
+        # line by line rather than as XML. This avoids escaping "<unknown>"
+        # lemmas and ampersands in the whole output. Entities in tokens and
+        # ids are unescaped, so tokens are those of the sentence text, no
+        # matter whether the input was XML or sentences embedded in XML by
+        # _embed_in_xml. As before, tokens following markup within a
+        # sentence are ignored.
+        start_tag = re.compile(r"<{}(\s[^<>]*)?>$".format(
+            re.escape(xml_sent_tag)))
+        id_value = re.compile(r"""\s{}\s*=\s*(?:"([^"]*)"|'([^']*)')""".format(
+            re.escape(id_attr)))
+        unknown_suffix = u"\t" + self.unknown_lemma
+        seconds = seconds or self._new_seconds()
+        timer = time.time
+        start = timer()
+        n_tokens = 0
+        graph_list = []
+        graph = None
         
-        return tagger_out 
+        for line in lines:
+            if line.startswith(u"<") and u"\t" not in line:
+                # SGML tag
+                graph = None
+                m = start_tag.match(line.rstrip())
+                
+                if m:
+                    m = id_value.search(m.group(1) or u"")
+                    graph_id = m and ( m.group(1) if m.group(1) is not None 
+                                       else m.group(2) )
+                    if graph_id and u"&" in graph_id:
+                        graph_id = _unescape_xml(graph_id)
+                    graph = self._add_new_graph(graph_id=self._str(graph_id),
+                                                n=len(graph_list) + 1)
+                    graph_list.append(graph)
+                    prev_node = None
+                    
+                    if line.rstrip().endswith(u"/>"):
+                        graph = None
+            elif graph is not None and line.strip():
+                if u"&" in line:
+                    line = _unescape_xml(line)
+                if line.endswith(unknown_suffix):
+                    line = line[:-len(self.unknown_lemma)] + self.unknown
+                t = timer()
+                prev_node, _ = self._add_new_node(line, graph, prev_node)
+                seconds["graphs"] += timer() - t
+                n_tokens += 1
+                
+        # lines are read lazily, so elapsed time includes tagger and encoding
+        parsing = ( timer() - start - seconds["graphs"] - seconds["tagger"] -
+                    seconds["encoding"] )
+        self._add_stats(seconds, parsing, graph_list, n_tokens)
+        return graph_list
+    
+    @staticmethod
+    def _str(s):
+        # plain string if possible, like attribute values from ElementTree
+        try:
+            return s.encode("ascii")
+        except (AttributeError, UnicodeError):
+            return s
     
-    def _extract_sentences_from_text(self, tagger_out):
+    def _extract_sentences_from_text(self, lines, seconds=None):
+        seconds = seconds or self._new_seconds()
+        timer = time.time
+        start = timer()
+        n_tokens = 0
         graph_list = []
         start_new_graph = True
         
-        for line in tagger_out.strip().split("\n"):
+        for line in lines:
+            if not line.strip():
+                continue
+            
             if start_new_graph:
                 graph = self._add_new_graph(n=len(graph_list) + 1)
                 graph_list.append(graph)
                 start_new_graph = False
                 prev_node = None
                 
+            t = timer()
             new_node, pos_tag = self._add_new_node(line, graph, prev_node)
+            seconds["graphs"] += timer() - t
+            n_tokens += 1
             
             if pos_tag == self.eos_pos_tag:
                 start_new_graph = True
@@ -338,6 +853,10 @@ class TreeTagger(Annotator):
             else:
                 prev_node = new_node
                 
+        # lines are read lazily, so elapsed time includes tagger and encoding
+        parsing = ( timer() - start - seconds["graphs"] - seconds["tagger"] -
+                    seconds["encoding"] )
+        self._add_stats(seconds, parsing, graph_list, n_tokens)
         return graph_list
     
     def _add_new_node(self, line, graph, prev_node):
@@ -347,6 +866,9 @@ class TreeTagger(Annotator):
         word, pos, lemma = line.split("\t")
         # TODO how to handle ambiguity in lemmatization as in er|sie|Sie   
    
+        if lemma in (self.unknown, self.unknown_lemma):
+            self.stats.add(unknown_lemmas=1)
+            
         if lemma == self.unknown:
             if self.replace_unknown_lemma:
                 lemma = word
@@ -377,6 +899,8 @@ class TreeTaggerEnglish(TreeTagger):
                  tagger_encoding=config["tagger"]["en"]["encoding"], 
                  eos_pos_tag="SENT",
                  *args, **kwargs):
+        kwargs.setdefault("pool_size", 
+                          config["tagger"]["en"].as_int("pool_size"))
         TreeTagger.__init__(self, command=command, 
                             tagger_encoding=tagger_encoding,
                             eos_pos_tag=eos_pos_tag, 
@@ -394,6 +918,8 @@ class TreeTaggerGerman(TreeTagger):
                  tagger_encoding=config["tagger"]["de"]["encoding"], 
                  eos_pos_tag="$.",
                  *args, **kwargs):
+        kwargs.setdefault("pool_size", 
+                          config["tagger"]["de"].as_int("pool_size"))
         TreeTagger.__init__(self, command=command, 
                             tagger_encoding=tagger_encoding,
                             eos_pos_tag=eos_pos_tag, 
@@ -410,19 +936,41 @@ class ILSP_NLP_Greek(Annotator):
 
     wsdl_url = "http://nlp.ilsp.gr/soaplab2-axis/services/ilsp.ilsp_nlp?wsdl"
     
-    def __init__(self, *arg, **kargs):
-        self.client = suds.client.Client(self.wsdl_url)
+    # Batches of sentences are annotated in parallel by passing workers > 1
+    # to annot_sentences, iter_sentences, etc. Each batch is a job of the
+    # service, whose status is polled with exponential backoff, while
+    # max_jobs limits the number of jobs submitted at the same time.
+    max_jobs = 4
+    # initial and maximal delay in seconds between polls of job status
+    poll_delay = 0.5
+    max_poll_delay = 8.0
+    # maximal time in seconds to wait for a job to finish
+    max_wait = 3600.0
+    
+    def __init__(self, cache=None, client=None, max_jobs=None, 
+                 *arg, **kargs):
+        Annotator.__init__(self)
+        # client is a suds client for the service, or any object with the
+        # same interface
+        self.client = client or suds.client.Client(self.wsdl_url)
+        # suds clients are not thread-safe
+        self._client_lock = threading.Lock()
+        self._job_slots = threading.BoundedSemaphore(max_jobs or 
+                                                     self.max_jobs)
+        self._init_cache(cache)
         
     def _annot_text(self, text):
-        output_url = self._ilsp_nlp(text, input_type="txt")  
-        return self._parse_ilsp_nlp_output(output_url, sent_tag="s")
+        seconds = self._new_seconds()
+        output_url = self._ilsp_nlp(text, "txt", seconds)  
+        return self._parse_ilsp_nlp_output(output_url, "s", seconds)
                                       
     def _annot_sentences(self, sentences, ids=None):
         if not ids:
             ids = ("{:03d}".format(i+1) for i in range(len(sentences)))
         xml_source = self._embed_in_xml(sentences, ids)
-        output_url = self._ilsp_nlp(xml_source, input_type="xcesbasic")
-        return self._parse_ilsp_nlp_output(output_url, sent_tag="p")
+        seconds = self._new_seconds()
+        output_url = self._ilsp_nlp(xml_source, "xcesbasic", seconds)
+        return self._parse_ilsp_nlp_output(output_url, "p", seconds)
     
     def _embed_in_xml(self, sentences, ids):
         # Embed sentences in minimal XCES xml .
@@ -454,13 +1002,21 @@ class ILSP_NLP_Greek(Annotator):
             
         return param_map
 
-    def _ilsp_nlp(self, input_data, input_type):
+    def _ilsp_nlp(self, input_data, input_type, seconds):
         log.debug(u"input data:\n" + input_data)
-        param_map = self._create_map(input_data, input_type)
-        job_id = self.client.service.createAndRun(param_map)
-        log.debug("ilsp_nlp service job id:\n" + job_id)
-        self.client.service.waitFor(job_id)
-        results = self.client.service.getResults(job_id)
+        self.stats.add(bytes_in=len(input_data.encode("utf-8")))
+        start = time.time()
+        
+        with self._job_slots:
+            with self._client_lock:
+                param_map = self._create_map(input_data, input_type)
+                job_id = self.client.service.createAndRun(param_map)
+            log.debug("ilsp_nlp service job id:\n" + job_id)
+            self._wait_for(job_id)
+            with self._client_lock:
+                results = self.client.service.getResults(job_id)
+            
+        seconds["tagger"] += time.time() - start
         report = results[0][2].value
         log.debug("ilsp_nlp service report:\n" + report)
         status = results[0][1].value
@@ -472,9 +1028,33 @@ class ILSP_NLP_Greek(Annotator):
         return output_url
         # TODO: are we suppposed to call destroy(xs:string jobId, )?
     
-    def _parse_ilsp_nlp_output(self, output_url, sent_tag):
+    def _wait_for(self, job_id):
+        # poll job status rather than calling the blocking waitFor, so the
+        # client is not locked while other threads submit or poll jobs
+        delay = self.poll_delay
+        deadline = time.time() + self.max_wait
+        
+        while True:
+            with self._client_lock:
+                status = self.client.service.getStatus(job_id)
+            if status not in ("CREATED", "RUNNING"):
+                log.debug("ilsp_nlp service job status: " + status)
+                return status
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise TGException("ilsp_nlp service job {} not finished "
+                                  "after {} seconds (status {})".format(
+                                      job_id, self.max_wait, status))
+            time.sleep(min(delay, remaining))
+            delay = min(2 * delay, self.max_poll_delay)
+    
+    def _parse_ilsp_nlp_output(self, output_url, sent_tag, seconds=None):
+        seconds = seconds or self._new_seconds()
+        timer = time.time
+        start = timer()
+        n_tokens = 0
         graph_list = []
-        output = urllib.urlopen(output_url)
+        output = _CountingReader(urllib.urlopen(output_url))
         
         # some silly moves to get the root element
         context = et.iterparse(output, 
@@ -486,6 +1066,8 @@ class ILSP_NLP_Greek(Annotator):
         name_space_prefix = "{http://www.xces.org/schema/2003}"
         sent_tag = name_space_prefix + sent_tag
         token_tag = name_space_prefix + "t"
+        # parsed sentences are only retained for logging the whole result
+        debug = log.isEnabledFor(logging.DEBUG)
     
         for event, elem in context:   
             if event == "start":
@@ -495,7 +1077,10 @@ class ILSP_NLP_Greek(Annotator):
                     graph_list.append(graph)
                     prev_node = None
             elif event == "end":
-                if elem.tag == token_tag:
+                if elem.tag == sent_tag and not debug:
+                    root.clear()
+                elif elem.tag == token_tag:
+                    t = timer()
                     new_node = graph.add_source_node(
                         word=elem.get("word"), 
                         lemma=elem.get("lemma"), 
@@ -505,12 +1090,18 @@ class ILSP_NLP_Greek(Annotator):
                     else:
                         graph.set_source_start_node(new_node)
                     prev_node = new_node
+                    seconds["graphs"] += timer() - t
+                    n_tokens += 1
                     
-        if log.isEnabledFor(logging.DEBUG):
+        if debug:
             log.debug(u"result:\n" + 
                       et.tostring(root, encoding="utf-8").decode("utf-8"))
         
         output.close()
+        self.stats.add(bytes_out=output.count)
+        # parsing includes downloading the output
+        self._add_stats(seconds, timer() - start - seconds["graphs"],
+                        graph_list, n_tokens)
         return graph_list
 
     
@@ -525,51 +1116,87 @@ class OsloBergenTagger(Annotator):
     eos_line = ( u"END_OF_SENTENCE\tEND_OF_SENTENCE\tsubst_prop\n"
                  u".\t$.\t<punkt>_<<<\n" )
     
-    def __init__(self, command=config["tagger"]["no"]["command"]):
+    # words which OBT copies to its output as the start of a line
+    begin_marker = u"TGBATCHBEGIN"
+    end_marker = u"TGBATCHEND"
+    flush_text = u"TGFLUSH .\n" * 1024
+    
+    def __init__(self, command=config["tagger"]["no"]["command"],
+                 pool_size=config["tagger"]["no"].as_int("pool_size"),
+                 cache=None):
         Annotator.__init__(self)    
         self.command = command
+        self.pool_size = pool_size
+        self._init_cache(cache)
         
     def _annot_text(self, text):
-        tagger_out = self._obt(text)
-        return self._parse_obt_output(tagger_out)
+        seconds = self._new_seconds()
+        tagger_out = self._obt(text, seconds)
+        return self._parse_obt_output(tagger_out, seconds=seconds)
                                        
     def _annot_sentences(self, sentences, ids=None):
         # There is no easy way to enforce sentence boundaries in OBT, so we
         # insert a silly eos_marker which always triggers a sentence
         # boundary. 
         text = self.eos_marker.join(sentences)
-        tagger_out = self._obt(text)
-        return self._parse_obt_output(tagger_out, self.eos_line, ids)
+        seconds = self._new_seconds()
+        tagger_out = self._obt(text, seconds)
+        return self._parse_obt_output(tagger_out, self.eos_line, ids, seconds)
     
-    def _obt(self, text):
+    def _obt(self, text, seconds):
         log.debug(u"OBT input:\n" + text)
+        timer = time.time
+        start = timer()
         
         # convert from unicode to given encoding
         # we may loose some data here!
-        text = text.encode(self.tagger_encoding, "backslashreplace")
+        data = text.encode(self.tagger_encoding, "backslashreplace")
+        t = timer()
+        seconds["encoding"] += t - start
+        
+        if self.pool_size:
+            tagger_out = "".join(self._tagger_pool().iter_tag(data, 
+                                                              decode=False))
+            start = timer()
+            seconds["tagger"] += start - t
+            self.stats.add(bytes_in=len(data), bytes_out=len(tagger_out))
+            tagger_out = tagger_out.decode(self.tagger_encoding, "replace")
+            seconds["encoding"] += timer() - start
+            log.debug(u"OBT standard output:\n" + tagger_out)
+            return tagger_out
         
         # create pipe to tagger
         log.debug("Calling OBT as " + self.command)
         tagger_proc = subprocess.Popen(self.command, 
                                        shell=True,
+                                       close_fds=True,
                                        stdin=subprocess.PIPE, 
                                        stdout=subprocess.PIPE,
                                        stderr=subprocess.PIPE)
 
         # send text and retrieve tagger output 
-        tagger_out, tagger_err = tagger_proc.communicate(text)
+        tagger_out, tagger_err = tagger_proc.communicate(data)
+        self.stats.add(bytes_in=len(data), bytes_out=len(tagger_out))
+        start = timer()
+        seconds["tagger"] += start - t
         
         # and convert back from given encoding to unicode
         tagger_err = tagger_err.decode(self.tagger_encoding, 
                                        "replace")        
         tagger_out = tagger_out.decode(self.tagger_encoding, 
                                        "replace")        
+        seconds["encoding"] += timer() - start
         log.debug(u"OBT standard output:\n" + tagger_out)
         log.debug(u"OBT standard error:\n" + tagger_err)       
         
         return tagger_out
     
-    def _parse_obt_output(self, tagger_out, eos_line="\n\n", ids=None):
+    def _parse_obt_output(self, tagger_out, eos_line="\n\n", ids=None,
+                          seconds=None):
+        seconds = seconds or self._new_seconds()
+        timer = time.time
+        start = timer()
+        n_tokens = 0
         graph_list = []
         annot_sentences = tagger_out.strip().split(eos_line)
         if not ids:
@@ -585,8 +1212,13 @@ class OsloBergenTagger(Annotator):
                 # ignore sentence boundaries inserted by tagger (empty lines)
                 # when using XML input
                 if line.strip():
+                    t = timer()
                     prev_node = self._add_new_node(line, graph, prev_node)
+                    seconds["graphs"] += timer() - t
+                    n_tokens += 1
                 
+        self._add_stats(seconds, timer() - start - seconds["graphs"],
+                        graph_list, n_tokens)
         return graph_list
 
     def _add_new_node(self, line, graph, prev_node):
@@ -605,6 +1237,41 @@ class OsloBergenTagger(Annotator):
     
 
 
+def _unescape_xml(s):
+    """
+    replace entity and character references in XML text by the characters
+    they refer to
+    """
+    def replace(m):
+        ref = m.group(1)
+        if ref.startswith(u"#x"):
+            return unichr(int(ref[2:], 16))
+        elif ref.startswith(u"#"):
+            return unichr(int(ref[1:]))
+        else:
+            return XML_ENTITIES[ref]
+        
+    return XML_REF_RE.sub(replace, s)
+
+
+
+class _CountingReader(object):
+    # file wrapper counting the bytes read
+    
+    def __init__(self, f):
+        self._f = f
+        self.count = 0
+        
+    def read(self, size=-1):
+        data = self._f.read(size)
+        self.count += len(data)
+        return data
+    
+    def close(self):
+        self._f.close()
+    
+    
+
 def get_annotator(lang, *args, **kwargs):
     if lang == "en":
         return TreeTaggerEnglish(*args, **kwargs)
@@ -0,0 +1,111 @@
+"""
+on-disk cache of annotated sentences
+"""
+
+import hashlib
+import logging
+import marshal
+import sqlite3
+import threading
+
+from tg.utils import create_dirs
+
+
+log = logging.getLogger(__name__)
+
+
+
+class AnnotationCache(object):
+    """
+    On-disk cache of tagger output per sentence
+
+    Entries are keyed on a hash of the annotator settings and the sentence
+    text (see Annotator._cache_key), so the cache can be shared by all
+    annotators and data sets. Values are the annotated tokens of a
+    sentence, as a tuple of (word, lemma, pos) or (word, lemma, pos, tag)
+    tuples, stored in marshal format in an SQLite database.
+
+    Parameters
+    ----------
+    fname: str
+        name of database file, which is created if it does not exist
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+        create_dirs(fname)
+        # connection is shared by threads of parallel annotation
+        self._conn = sqlite3.connect(fname, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute("CREATE TABLE IF NOT EXISTS tokens "
+                           "(key TEXT PRIMARY KEY, tokens BLOB)")
+        self.hits = self.misses = 0
+
+    def get_many(self, keys):
+        """
+        return dict mapping those keys which are in the cache to tokens
+        """
+        found = {}
+        keys = list(keys)
+
+        with self._lock:
+            # stay below SQLite's limit on number of query parameters
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i+500]
+                query = "SELECT key, tokens FROM tokens WHERE key IN ({})"
+                query = query.format(",".join("?" * len(chunk)))
+                for key, data in self._conn.execute(query, chunk):
+                    found[key] = marshal.loads(str(data))
+
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+
+        return found
+
+    def put_many(self, items):
+        """
+        store (key, tokens) pairs in the cache
+        """
+        rows = [ (key, buffer(marshal.dumps(tuple(tokens))))
+                 for key, tokens in items ]
+
+        with self._lock:
+            with self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO tokens "
+                                       "VALUES (?, ?)", rows)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM tokens").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def cache_key(*parts):
+    """
+    return hash of unicode strings as cache key
+    """
+    data = u"\0".join(unicode(p) for p in parts)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+
+# caches shared by all annotators, keyed on file name
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(fname):
+    """
+    return shared annotation cache for file name, opening it when required
+    """
+    with _caches_lock:
+        cache = _caches.get(fname)
+
+        if cache is None:
+            log.info("opening annotation cache " + fname)
+            cache = _caches[fname] = AnnotationCache(fname)
+        return cache
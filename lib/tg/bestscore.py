@@ -6,8 +6,11 @@ combine scores into best score
 
 import logging
 
+import numpy as np
+
 from tg.graphproc import GraphProcess
 from tg.scorer import Scorer
+from tg.utils import segment_starts
 
 
 log = logging.getLogger(__name__)
@@ -33,26 +36,37 @@ class BestScorer(Scorer):
         # TODO: handle hypernodes  
         GraphProcess._single_run(self, graph)
         
-        # skip normalization, because base scores are already normalized
-        for u in graph.source_nodes_iter():
-            # first pass to figure out which score attr is present
-            base_score_attr = self._find_base_score_attr(graph, u)  
-            # second pass to add the best scores
-            for u, v, data in graph.trans_edges_iter(u):
-                data[self.score_attr] = data.get(base_score_attr, 0.0)
-                
-    def _find_base_score_attr(self, graph, u):
-        has_trans_edge = False
+        # Skip normalization, because base scores are already normalized.
+        # Works on score columns, where each segment of consecutive edges
+        # holds the translations of a single node.
+        sources = graph.trans_edge_arrays(data=False)[0]
+        
+        if len(sources) == 0:
+            return
+        
+        starts = segment_starts(sources)
+        lengths = np.diff(np.append(starts, len(sources)))
+        is_source = np.array([ graph.is_source_node(u) 
+                               for u in sources[starts].tolist() ], 
+                             dtype=bool)
+        best_scores = np.zeros(len(sources))
+        # source nodes for which no base score attr has been found yet
+        todo = is_source
         
         for score_attr in self.base_score_attrs:
-            for u, v, data in graph.trans_edges_iter(u):
-                has_trans_edge = True
-                if data.has_key(score_attr):
-                    return score_attr
+            scores = graph.score_column(score_attr)
+            has_score = ~np.isnan(scores)
+            found = todo & np.logical_or.reduceat(has_score, starts)
+            mask = np.repeat(found, lengths) & has_score
+            best_scores[mask] = scores[mask]
+            todo = todo & ~found
         
-        # skip warning if source node has no translations, e.g. punctuation
-        if has_trans_edge:
+        for u in sources[starts[todo]].tolist():
             log.warning("none of the translation edges of node {} in graph {} "
                         "has any of the base score attributes {}".format(
                             u, graph, self.base_score_attrs))
+            
+        # NaN leaves the edges of hypernodes untouched
+        best_scores[~np.repeat(is_source, lengths)] = np.nan
+        graph.set_score_column(self.score_attr, best_scores)
 
@@ -4,12 +4,14 @@
 scoring translation candidates with a classifier
 """
 
+import hashlib
 import logging
 
 import numpy as np
 import operator
 import scipy.sparse as sp
 
+from tg import symbols
 from tg.graphproc import GraphProcess
 
 log = logging.getLogger(__name__)
@@ -55,6 +57,17 @@ class Vectorizer(object):
             self._make_source_node_vectors = self._make_full_vectors
             
         self.dtype = dtype        
+        # vocab, its fingerprint and its columns indexed by lemma id 
+        # (see tg.symbols)
+        self._vocab = None
+        self._fingerprint = None
+        self._columns = None
+        
+    def __getstate__(self):
+        # lemma ids are only valid within a process
+        state = self.__dict__.copy()
+        state["_vocab"] = state["_fingerprint"] = state["_columns"] = None
+        return state
         
     def __call__(self, graph, vocab):
         """
@@ -82,12 +95,64 @@ class Vectorizer(object):
         dim = (len(graph), len(vocab))
         # lil sparse format allows indexing 
         mat = sp.lil_matrix(dim, dtype=self.dtype)
-        mat, n_rows = self._make_source_node_vectors(graph, vocab, mat)
+        columns = self.vocab_columns(graph, vocab)
+        mat, n_rows = self._make_source_node_vectors(graph, columns, mat)
         mat = mat.tocsr()
         # remove superfluous rows now that number of source nodes is known
         return mat[:n_rows, :]
 
-    def _make_full_vectors(self, graph, vocab, mat):
+    def vocab_columns(self, graph, vocab):
+        """
+        Return vocabulary columns of the target nodes of a graph
+        
+        Columns are looked up once per graph and vocabulary, and attached to
+        the graph under the fingerprint of the vocabulary, so that later
+        calls with the same graph and vocabulary (e.g. from other
+        experiments in a grid search) need no lookups at all. Use
+        precompute to attach columns to graphs in advance, e.g. before
+        saving them.
+        
+        Parameters
+        ----------
+        graph: Graph instance
+        vocab: dict
+            Full vocabulary as a dictionary mapping target lemmas to
+            (column) indices.
+            
+        Returns
+        -------
+        columns: dict
+            Dict mapping target nodes with an in-vocabulary lemma to their
+            column
+        """
+        if vocab is not self._vocab:
+            self._vocab = vocab
+            self._fingerprint = vocab_fingerprint(vocab)
+            self._columns = symbols.lemmas.lookup_array(vocab)
+            
+        columns = graph.vocab_columns(self._fingerprint)
+        
+        if columns is None:
+            columns = {}
+            
+            for _, v, _ in graph.trans_edges_iter():
+                col_j = symbols.lookup(self._columns, graph.lemma_id(v))
+                if col_j >= 0:
+                    columns[v] = col_j
+                    
+            graph.set_vocab_columns(self._fingerprint, columns)
+            
+        return columns
+    
+    def precompute(self, graphs, vocab):
+        """
+        Attach vocabulary columns of target nodes to each of the graphs
+        (see vocab_columns)
+        """
+        for graph in graphs:
+            self.vocab_columns(graph, vocab)
+
+    def _make_full_vectors(self, graph, columns, mat):
         """ 
         For every source node, create a translation vector indicating all its
         translation candidates (target lemmas) in the vocabulary.
@@ -96,18 +161,16 @@ class Vectorizer(object):
             for u, v, data in graph.trans_edges_iter(u):
                 # TODO: handle source/target hypernodes 
                 if graph.is_target_node(v):
-                    target_lemma = graph.lemma(v)
-                    try:
-                        col_j = vocab[target_lemma]
-                    except KeyError:
-                        # ignore target lemma that is out of vocabulary
-                        continue
-                    mat[row_i, col_j] += 1
+                    col_j = columns.get(v, -1)
+                    
+                    # ignore target lemma that is out of vocabulary
+                    if col_j >= 0:
+                        mat[row_i, col_j] += 1
                     
         n_rows = row_i + 1
         return mat, n_rows
         
-    def _make_max_score_vectors(self, graph, vocab, mat):
+    def _make_max_score_vectors(self, graph, columns, mat):
         """ 
         For every source node, create a vector indicating its translation
         candidate (target lemmas) with the highest score for self.score_attr.
@@ -118,22 +181,18 @@ class Vectorizer(object):
             
             # if v is None, then there are no translation with
             # self.score_attr attribute (or no translation edges at all)
-            if v:
-                target_lemma = graph.lemma(v)
-                
-                try:
-                    col_j = vocab[target_lemma]
-                except KeyError:
-                    # ignore target lemma that is out of vocabulary
-                    # should never happen when score_attr is present
-                    continue
+            if v is not None:
+                col_j = columns.get(v, -1)
                 
-                mat[row_i, col_j] += 1
+                # ignore target lemma that is out of vocabulary
+                # should never happen when score_attr is present
+                if col_j >= 0:
+                    mat[row_i, col_j] += 1
                     
         n_rows = row_i + 1
         return mat, n_rows
     
-    def _make_min_score_vectors(self, graph, vocab, mat):
+    def _make_min_score_vectors(self, graph, columns, mat):
         """ 
         For every source node, create a translation vector indicating all its
         translation candidates (target lemmas) in the vocabulary with a
@@ -144,18 +203,30 @@ class Vectorizer(object):
                 # TODO: handle source/target hypernodes 
                 if ( graph.is_target_node(v) and
                      data.get(self.score_attr) >= self.min_score):
-                    target_lemma = graph.lemma(v)
-                    try:
-                        col_j = vocab[target_lemma]
-                    except KeyError:
-                        # ignore target lemma that is out of vocabulary
-                        continue
-                    mat[row_i, col_j] += 1
+                    col_j = columns.get(v, -1)
+                    
+                    # ignore target lemma that is out of vocabulary
+                    if col_j >= 0:
+                        mat[row_i, col_j] += 1
                     
         n_rows = row_i + 1
         return mat, n_rows
 
 
+def vocab_fingerprint(vocab):
+    """
+    Return fingerprint of vocabulary, which is the same for equal
+    vocabularies, even when they are different objects (e.g. loaded by
+    different processes)
+    """
+    md5 = hashlib.md5()
+    
+    for lemma, col_j in sorted(vocab.iteritems(), key=operator.itemgetter(1)):
+        md5.update(u"{}\t{}\n".format(lemma, col_j).encode("utf-8"))
+        
+    return md5.hexdigest()
+
+
 class ClassifierScore(GraphProcess):
     """
     Add classifier scores to translation candidates.
@@ -272,11 +343,13 @@ class ClassifierScore(GraphProcess):
                 target_lempos = graph.lempos(v)
                 
                 try:
-                    score = data[self.score_attr] = lempos2score[target_lempos]
+                    score = lempos2score[target_lempos]
                 except KeyError:
                     # model does not predict this target lemma,
                     # (which may be different from a 0.0 score)
                     continue
+                
+                graph.set_score(u, v, self.score_attr, score)
     
     # tracing/debugging code
     
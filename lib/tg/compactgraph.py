@@ -0,0 +1,1125 @@
+"""
+array-backed translation graphs
+"""
+
+import collections
+import logging
+
+import numpy as np
+
+from tg import symbols
+from tg.exception import TGException
+from tg.transgraph import TransGraph
+from tg.utils import object_array, segment_argmax, segment_starts
+
+
+log = logging.getLogger(__name__)
+
+
+# node kinds
+SOURCE, TARGET, HYPER_SOURCE, HYPER_TARGET = range(4)
+
+# edge types, indexed by their value of the "name" attribute
+TRANS, NEXT, PART = range(3)
+EDGE_NAMES = ("trans", "next", "part")
+N_EDGE_TYPES = len(EDGE_NAMES)
+
+# initial capacity of node and edge arrays
+INIT_SIZE = 16
+
+# integers beyond this magnitude cannot be stored exactly in a score column
+MAX_EXACT_INT = 2 ** 53
+
+# per-node arrays
+NODE_ARRAYS = "_kind", "_word", "_lemma", "_pos", "_next", "_prev"
+
+
+
+class CompactTransGraph(object):
+    """
+    Translation graph backed by parallel arrays
+
+    Alternative for the networkx-based TransGraph with the same public
+    methods, so that it can be passed to Lookup, the scorers and the
+    formatters unchanged.
+
+    Nodes are identified by integers which index parallel numpy arrays
+    holding the node kind and the word, lemma and POS attributes (as indices
+    into a string table). Any other node attributes (e.g. "lex_lempos") are
+    kept in a dict per node, created only when needed. Edges are stored in
+    parallel arrays of source node, target node and edge type. CSR-style
+    indices over outgoing and incoming edges are built lazily whenever the
+    set of edges has changed. Numerical edge attributes (i.e. scores) are
+    stored in float arrays per attribute, with NaN meaning that the edge
+    does not have the attribute. Any other edge attributes are kept in a
+    dict per edge, created only when needed. Edge data are available as
+    dict-like views, so code written for TransGraph keeps working.
+
+    Parameters
+    ----------
+    attr: keyword arguments
+        graph attributes (e.g. id and n)
+    """
+
+    delimiter = TransGraph.delimiter
+    max_scores_cache = TransGraph.max_scores_cache
+
+    # node attributes stored as string indices in arrays
+    array_attrs = ("word", "lemma", "pos")
+
+    def __init__(self, **attr):
+        self.graph = attr
+        self.source_start_node = None
+
+        self._n_nodes = 0
+        self._kind = np.empty(INIT_SIZE, dtype="i1")
+        self._word = np.empty(INIT_SIZE, dtype="i4")
+        self._lemma = np.empty(INIT_SIZE, dtype="i4")
+        self._pos = np.empty(INIT_SIZE, dtype="i4")
+        # word order index: next and previous node, -1 if none
+        self._next = np.empty(INIT_SIZE, dtype="i4")
+        self._prev = np.empty(INIT_SIZE, dtype="i4")
+        self._node_extra = {}
+
+        self._n_edges = 0
+        self._src = np.empty(INIT_SIZE, dtype="i4")
+        self._dst = np.empty(INIT_SIZE, dtype="i4")
+        self._etype = np.empty(INIT_SIZE, dtype="i1")
+        self._scores = {}
+        # score attributes whose column holds integers only
+        self._int_scores = set()
+        self._edge_extra = {}
+        self._score_versions = {}
+        self._max_score_cache = {}
+        self._vocab_columns = {}
+
+        self._strings = []
+        self._string_ids = {}
+        self._invalidate_index()
+
+        self.node = _NodeMap(self)
+        self.edge = _AdjacencyMap(self)
+
+    def __repr__(self):
+        attrs = ", ".join("{}={!r}".format(k,v)
+                          for k,v in self.graph.items())
+        return "{}({})".format(self.__class__.__name__, attrs)
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __len__(self):
+        return self._n_nodes
+
+    def __iter__(self):
+        return iter(xrange(self._n_nodes))
+
+    def __contains__(self, u):
+        return _is_node_id(u) and 0 <= u < self._n_nodes
+
+    def __getstate__(self):
+        # pickle trimmed arrays and no indices or views
+        state = self.__dict__.copy()
+
+        for name in NODE_ARRAYS:
+            state[name] = state[name][:self._n_nodes].copy()
+
+        for name in "_src", "_dst", "_etype":
+            state[name] = state[name][:self._n_edges].copy()
+
+        state["_scores"] = dict( (k, a[:self._n_edges].copy())
+                                 for k, a in self._scores.iteritems() )
+
+        for name in ("_out_ptr", "_out_edges", "_in_ptr", "_in_edges",
+                     "_index_lists", "_string_ids", "_max_score_cache",
+                     "node", "edge"):
+            del state[name]
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._string_ids = dict( (s, i) for i, s in enumerate(self._strings) )
+        self._max_score_cache = {}
+        self.__dict__.setdefault("_vocab_columns", {})
+        self.__dict__.setdefault("_int_scores", set())
+        self._invalidate_index()
+        self.node = _NodeMap(self)
+        self.edge = _AdjacencyMap(self)
+
+    def copy(self):
+        """
+        return a copy which shares nothing with this graph
+        """
+        graph = self.__class__.__new__(self.__class__)
+        graph.__setstate__(self.__getstate__())
+        # deep copy of mutable data
+        graph.graph = self.graph.copy()
+        graph._node_extra = dict( (u, _copy_attrs(d))
+                                  for u, d in self._node_extra.iteritems() )
+        graph._edge_extra = dict( (e, _copy_attrs(d))
+                                  for e, d in self._edge_extra.iteritems() )
+        graph._strings = list(self._strings)
+        graph._vocab_columns = self._vocab_columns.copy()
+        return graph
+
+    def view(self):
+        """
+        return a graph for writing scores without affecting this graph
+
+        Unlike TransGraph.view, this is simply a copy, as copying arrays is
+        cheap.
+        """
+        return self.copy()
+
+    #-------------------------------------------------------------------------
+    # generic graph interface (subset of networkx.DiGraph)
+    #-------------------------------------------------------------------------
+
+    def number_of_nodes(self):
+        return self._n_nodes
+
+    def number_of_edges(self):
+        return self._n_edges
+
+    def nodes(self, data=False):
+        return list(self.nodes_iter(data=data))
+
+    def nodes_iter(self, data=False):
+        if data:
+            return ( (u, self.node[u]) for u in xrange(self._n_nodes) )
+        else:
+            return iter(xrange(self._n_nodes))
+
+    def edges(self, nbunch=None, data=False):
+        return list(self.edges_iter(nbunch, data=data))
+
+    def edges_iter(self, nbunch=None, data=False):
+        return self.out_edges_iter(nbunch, data=data)
+
+    def out_edges_iter(self, nbunch=None, data=False):
+        return self._edges_iter(nbunch, data)
+
+    def in_edges_iter(self, nbunch=None, data=False):
+        return self._edges_iter(nbunch, data, outgoing=False)
+
+    def successors_iter(self, u):
+        return ( v for _, v in self.out_edges_iter(u) )
+
+    def successors(self, u):
+        return list(self.successors_iter(u))
+
+    def predecessors_iter(self, u):
+        return ( v for v, _ in self.in_edges_iter(u) )
+
+    def predecessors(self, u):
+        return list(self.predecessors_iter(u))
+
+    #-------------------------------------------------------------------------
+    # source nodes
+    #-------------------------------------------------------------------------
+
+    def add_source_node(self, **attr):
+        return self._add_node(SOURCE, attr)
+
+    def is_source_node(self, u):
+        return self._kind.item(u) == SOURCE
+
+    def set_source_start_node(self, u):
+        self.source_start_node = u
+
+    def source_nodes(self, data=False, ordered=False):
+        return list(self.source_nodes_iter(data=data, ordered=ordered))
+
+    def source_nodes_iter(self, data=False, ordered=False):
+        if ordered:
+            nodes = self._ordered_source_nodes_iter()
+        else:
+            nodes = self._nodes_of_kind(SOURCE)
+
+        if data:
+            return ( (u, self.node[u]) for u in nodes )
+        else:
+            return nodes
+
+    def _ordered_source_nodes_iter(self):
+        u = self.source_start_node
+
+        while u is not None:
+            yield u
+            u = self._next_node(u)
+
+    #-------------------------------------------------------------------------
+    # target nodes
+    #-------------------------------------------------------------------------
+
+    def add_target_node(self, **attr):
+        return self._add_node(TARGET, attr)
+
+    def is_target_node(self, u):
+        return self._kind.item(u) == TARGET
+
+    #-------------------------------------------------------------------------
+    # hyper nodes
+    #-------------------------------------------------------------------------
+
+    def add_hyper_source_node(self, nodes):
+        u = self._add_node(HYPER_SOURCE, {})
+        for v in nodes:
+            self._add_edge(v, u, PART)
+        return u
+
+    def add_hyper_target_node(self, nodes):
+        u = self._add_node(HYPER_TARGET, {})
+        for v in nodes:
+            self._add_edge(u, v, PART)
+        return u
+
+    def is_hyper_source_node(self, u):
+        return self._kind.item(u) == HYPER_SOURCE
+
+    def is_hyper_target_node(self, u):
+        return self._kind.item(u) == HYPER_TARGET
+
+    def source_parts_iter(self, u):
+        return iter(self._typed_neighbours(u, PART, outgoing=False))
+
+    def target_parts_iter(self, u):
+        return iter(self._typed_neighbours(u, PART))
+
+    def part_edges_iter(self, u=None):
+        """
+        return an iterator over part edges, optionally restricted to the
+        edges of hyper node u, with the parts of a hyper node in order
+        """
+        src, dst = self._lists()[:2]
+
+        if u is None:
+            edges = self._typed_edges(None, PART)
+        elif self._kind.item(u) == HYPER_SOURCE:
+            edges = self._typed_edges(u, PART, outgoing=False)
+        else:
+            edges = self._typed_edges(u, PART)
+
+        return ( (src[e], dst[e], self._data(e)) for e in edges )
+
+    #-------------------------------------------------------------------------
+    # attributes
+    #-------------------------------------------------------------------------
+
+    # source only
+
+    def source_words(self):
+        return [ self._string(self._word, u)
+                 for u in self.source_nodes_iter(ordered=True) ]
+
+    def source_lemmas(self):
+        return [ self._string(self._lemma, u)
+                 for u in self.source_nodes_iter(ordered=True) ]
+
+    def source_lempos(self):
+        return [ symbols.lempos.lempos(self._string(self._lemma, u),
+                                       self._string(self._pos, u))
+                 for u in self.source_nodes_iter(ordered=True) ]
+
+    def source_string(self):
+        return " ".join(self.source_words())
+
+    # nodes
+
+    def node_attrib(self, u, attrib, as_list=False):
+        kind = self._kind.item(u)
+
+        if ( not as_list and kind <= TARGET and
+             attrib in self.array_attrs ):
+            # fast path for the most common case
+            i = getattr(self, "_" + attrib).item(u)
+            if i >= 0:
+                return self._strings[i]
+
+        if attrib in self.array_attrs:
+            column = getattr(self, "_" + attrib)
+            get = lambda v: self._string(column, v)
+        else:
+            get = lambda v: self.node[v][attrib]
+
+        if kind == SOURCE or kind == TARGET:
+            l = [ get(u) ]
+        elif kind == HYPER_SOURCE:
+            l = [ get(v) for v in self.source_parts_iter(u) ]
+        elif kind == HYPER_TARGET:
+            l = [ get(v) for v in self.target_parts_iter(u) ]
+        else:
+            raise ValueError("not a node")
+
+        if as_list:
+            return l
+        else:
+            return " ".join(l)
+
+    def word(self, u, as_list=False):
+        return self.node_attrib(u, "word", as_list=as_list)
+
+    def lemma(self, u, as_list=False):
+        return self.node_attrib(u, "lemma", as_list=as_list)
+
+    def pos(self, u, as_list=False):
+        return self.node_attrib(u, "pos", as_list=as_list)
+
+    def lempos(self, u, as_list=False):
+        if not as_list and self._kind.item(u) <= TARGET:
+            # fast path for the most common case
+            i, j = self._lemma.item(u), self._pos.item(u)
+            if i >= 0 and j >= 0:
+                return symbols.lempos.lempos(self._strings[i],
+                                             self._strings[j])
+
+        l =  [ symbols.lempos.lempos(lemma, pos)
+               for lemma, pos in zip(self.node_attrib(u, "lemma", True),
+                                     self.node_attrib(u, "pos", True)) ]
+        if as_list:
+            return l
+        else:
+            return " ".join(l)
+
+    def lemma_id(self, u):
+        """
+        See TransGraph.lemma_id
+        """
+        return symbols.lemmas.id(self.lemma(u))
+
+    def lempos_id(self, u):
+        """
+        See TransGraph.lempos_id
+        """
+        return symbols.lempos.id(self.lempos(u))
+
+    def string(self, u):
+        return " ".join(self.node_attrib(u, "word", as_list=True))
+
+    #-------------------------------------------------------------------------
+    # word order
+    #-------------------------------------------------------------------------
+
+    def add_word_order_edge(self, u, v, attr_dict=None, **attr):
+        self._add_edge(u, v, NEXT, attr_dict, attr)
+
+    def ordered_nodes_iter(self, nodes):
+        """
+        return an iterator over nodes in order (i.e. following edges named
+        "next")
+        """
+        nodes = set(nodes)
+
+        # find first node
+        for u in nodes:
+            if self._prev_node(u) not in nodes:
+                break
+        else:
+            # should never happen
+            raise TGException("no first node among ordered nodes")
+
+        while u in nodes:
+            yield u
+            u = self._next_node(u)
+
+    def is_first_node(self, u):
+        """
+        test if node is first (i.e. has predecessor with edge named "next")
+        """
+        return self._prev_node(u) is None
+
+    def word_order_edges_iter(self, u=None):
+        """
+        return an iterator over word order edges, optionally restricted to
+        the edge from node u
+        """
+        src, dst = self._lists()[:2]
+        return ( (src[e], dst[e], self._data(e))
+                 for e in self._typed_edges(u, NEXT) )
+
+    #-------------------------------------------------------------------------
+    # translation
+    #-------------------------------------------------------------------------
+
+    def add_translation_edge(self, u, v, attr_dict=None, **attr):
+        self._add_edge(u, v, TRANS, attr_dict, attr)
+
+    def trans_edges_iter(self, u=None):
+        src, dst = self._lists()[:2]
+        return ( (src[e], dst[e], self._data(e))
+                 for e in self._typed_edges(u, TRANS) )
+
+    def trans_edge_arrays(self, data=True):
+        """
+        return all translation edges as arrays
+
+        Parameters
+        ----------
+        data: bool, optional
+            If false, return only sources and targets
+
+        Returns
+        -------
+        sources: numpy.ndarray
+            Source node of each edge
+        targets: numpy.ndarray
+            Target node of each edge
+        data: numpy.ndarray
+            Object array with a reference to the data dict of each edge
+
+        Notes
+        -----
+        Edges from the same source node are contiguous and in the same order
+        as returned by trans_edges_iter.
+        """
+        edges = self._typed_edge_array(TRANS)
+        arrays = self._src[edges], self._dst[edges]
+
+        if data:
+            arrays += (object_array(self._data(e) for e in edges.tolist()),)
+
+        return arrays
+
+    def score_column(self, score_attr):
+        """
+        return scores of all translation edges
+
+        See TransGraph.score_column
+        """
+        edges = self._typed_edge_array(TRANS)
+
+        try:
+            return self._scores[score_attr][edges]
+        except KeyError:
+            return np.empty(len(edges)) * np.nan
+
+    def set_score_column(self, score_attr, scores):
+        """
+        set scores of all translation edges
+
+        See TransGraph.set_score_column
+        """
+        edges = self._typed_edge_array(TRANS)
+        scores = np.asarray(scores, dtype="f8")
+        has_score = ~np.isnan(scores)
+        edges = edges[has_score]
+        self._score_array(score_attr)[edges] = scores[has_score]
+        self._int_scores.discard(score_attr)
+
+        if self._edge_extra:
+            # scores replace any non-numerical values
+            for e in edges.tolist():
+                self._edge_extra.get(e, {}).pop(score_attr, None)
+
+    def set_score(self, u, v, score_attr, score):
+        """
+        set score of translation edge from u to v
+
+        See TransGraph.set_score
+        """
+        for e in self._typed_edges(u, TRANS):
+            if self._dst.item(e) == v:
+                self._set_edge_attr(e, score_attr, score)
+                return
+
+        raise KeyError((u, v))
+
+    def set_scores(self, score_attr, edge_data, scores):
+        """
+        set scores of translation edges
+
+        See TransGraph.set_scores
+        """
+        for data, score in zip(edge_data, scores):
+            if score is not None:
+                data[score_attr] = score
+
+    def score_version(self, score_attr):
+        """
+        return version of score attribute, which changes whenever scores are
+        written
+        """
+        return self._score_versions.get(score_attr, 0)
+
+    def max_score(self, u, score_attr):
+        """
+        find max score
+
+        Parameters
+        ----------
+        u: int
+            Source node identifier
+        score_attr: str
+            Name of edge attribute containing the score.
+
+        Returns
+        -------
+        t: tuple (score, node) or None
+            See TransGraph.max_score
+
+        Notes
+        -----
+        Max scores are computed for all nodes at once, using a segment-wise
+        argmax over the score column, and cached until the scores are
+        changed or translation edges are added. As all writes go through
+        the score columns, the cache never needs to be cleared by hand.
+        """
+        try:
+            scores, nodes = self._max_score_cache[score_attr]
+        except KeyError:
+            scores, nodes = self._max_score_cache[score_attr] = \
+                self._max_score_arrays(score_attr)
+
+        if u < len(nodes):
+            v = nodes.item(u)
+            if v >= 0:
+                score = scores.item(u)
+                if score_attr in self._int_scores:
+                    score = int(score)
+                return score, v
+
+        return None, None
+
+    #-------------------------------------------------------------------------
+    # conversion
+    #-------------------------------------------------------------------------
+
+    @classmethod
+    def from_transgraph(cls, nx_graph):
+        """
+        create a CompactTransGraph from a networkx-based TransGraph
+
+        Source nodes are numbered in word order, followed by target nodes and
+        hyper nodes in the order of their original identifiers. Outgoing
+        edges of each node retain their original order.
+        """
+        graph = cls(**nx_graph.graph.copy())
+        node_map = {}
+
+        def kind(u):
+            # NB hyper node prefixes must be tested first
+            if nx_graph.is_hyper_source_node(u):
+                return HYPER_SOURCE
+            elif nx_graph.is_hyper_target_node(u):
+                return HYPER_TARGET
+            elif nx_graph.is_source_node(u):
+                return SOURCE
+            else:
+                return TARGET
+
+        def key(u):
+            return kind(u), int(u.lstrip("hst"))
+
+        source_nodes = nx_graph.source_nodes(ordered=True)
+        source_node_set = set(source_nodes)
+        other_nodes = sorted( (u for u in nx_graph.nodes_iter()
+                               if u not in source_node_set),
+                              key=key)
+        nodes = source_nodes + other_nodes
+
+        for u in nodes:
+            attrs = _copy_attrs(nx_graph.node[u])
+            # cached max scores are not copied
+            attrs.pop(cls.max_scores_cache, None)
+            node_map[u] = graph._add_node(kind(u), attrs)
+
+        for u in nodes:
+            for _, v, data in nx_graph.out_edges_iter(u, data=True):
+                if data["name"] != "part":
+                    data = data.copy()
+                    etype = EDGE_NAMES.index(data.pop("name"))
+                    graph._add_edge(node_map[u], node_map[v], etype, data)
+
+        # part edges in order of the parts
+        for u, v, data in nx_graph.part_edges_iter():
+            data = data.copy()
+            del data["name"]
+            graph._add_edge(node_map[u], node_map[v], PART, data)
+
+        if nx_graph.source_start_node is not None:
+            graph.source_start_node = node_map[nx_graph.source_start_node]
+
+        return graph
+
+    def to_transgraph(self):
+        """
+        create a networkx-based TransGraph from this graph
+        """
+        nx_graph = TransGraph(**self.graph.copy())
+        adders = { SOURCE: nx_graph.add_source_node,
+                   TARGET: nx_graph.add_target_node }
+        node_map = {}
+
+        # hyper nodes last, because their parts must exist
+        for u in sorted(xrange(self._n_nodes), key=lambda u: self._kind.item(u)):
+            kind = self._kind.item(u)
+
+            if kind == HYPER_SOURCE:
+                parts = [ node_map[v] for v in self.source_parts_iter(u) ]
+                node_map[u] = nx_graph.add_hyper_source_node(parts)
+            elif kind == HYPER_TARGET:
+                parts = [ node_map[v] for v in self.target_parts_iter(u) ]
+                node_map[u] = nx_graph.add_hyper_target_node(parts)
+            else:
+                attrs = _copy_attrs(self.node[u])
+                attrs.pop(self.max_scores_cache, None)
+                node_map[u] = adders[kind](**attrs)
+
+        for u, v, data in self.edges_iter(data=True):
+            if data["name"] == "part":
+                # already added along with hyper nodes
+                continue
+            nx_graph.add_edge(node_map[u], node_map[v], attr_dict=data.copy())
+
+        if self.source_start_node is not None:
+            nx_graph.set_source_start_node(node_map[self.source_start_node])
+
+        return nx_graph
+
+    def clear_max_scores(self):
+        """
+        remove all cached max scores
+        """
+        self._max_score_cache.clear()
+
+    def vocab_columns(self, fingerprint):
+        """
+        return vocabulary columns of target nodes
+
+        See TransGraph.vocab_columns
+        """
+        return self._vocab_columns.get(fingerprint)
+
+    def set_vocab_columns(self, fingerprint, columns):
+        """
+        attach vocabulary columns of target nodes to graph
+
+        See TransGraph.set_vocab_columns
+        """
+        self._vocab_columns[fingerprint] = columns
+
+    #-------------------------------------------------------------------------
+    # support methods
+    #-------------------------------------------------------------------------
+
+    def _intern(self, s):
+        if s is None:
+            return -1
+        try:
+            return self._string_ids[s]
+        except KeyError:
+            i = self._string_ids[s] = len(self._strings)
+            self._strings.append(s)
+            return i
+
+    def _string(self, column, u):
+        i = column.item(u)
+        if i < 0:
+            return None
+        return self._strings[i]
+
+    def _add_node(self, kind, attr):
+        u = self._n_nodes
+
+        if u == len(self._kind):
+            for name in NODE_ARRAYS:
+                setattr(self, name, _grow(getattr(self, name)))
+
+        self._kind[u] = kind
+        self._word[u] = self._intern(attr.get("word"))
+        self._lemma[u] = self._intern(attr.get("lemma"))
+        self._pos[u] = self._intern(attr.get("pos"))
+        self._next[u] = self._prev[u] = -1
+
+        extra = dict( (k, v) for k, v in attr.iteritems()
+                      if k not in self.array_attrs )
+        if extra:
+            self._node_extra[u] = extra
+
+        self._n_nodes += 1
+        return u
+
+    def _add_edge(self, u, v, etype, attr_dict=None, attr=None):
+        e = self._n_edges
+
+        if e == len(self._src):
+            for name in "_src", "_dst", "_etype":
+                setattr(self, name, _grow(getattr(self, name)))
+            for key, a in self._scores.items():
+                self._scores[key] = _grow(a, fill=np.nan)
+
+        self._src[e] = u
+        self._dst[e] = v
+        self._etype[e] = etype
+
+        if etype == NEXT:
+            self._next[u] = v
+            self._prev[v] = u
+
+        self._n_edges += 1
+        self._invalidate_index()
+
+        if etype == TRANS:
+            self._max_score_cache.clear()
+            self._vocab_columns.clear()
+
+        for d in attr_dict, attr:
+            for key, value in (d or {}).iteritems():
+                self._set_edge_attr(e, key, value)
+
+    def _data(self, e):
+        return _EdgeData(self, e)
+
+    def _score_array(self, key):
+        # array of scores for all edges for writing, created when first
+        # needed
+        try:
+            a = self._scores[key]
+        except KeyError:
+            a = self._scores[key] = np.empty(len(self._src)) * np.nan
+        # any cached max scores become invalid
+        self._score_versions[key] = self.score_version(key) + 1
+        self._max_score_cache.pop(key, None)
+        return a
+
+    def _set_edge_attr(self, e, key, value):
+        if key == "name":
+            if value != EDGE_NAMES[self._etype.item(e)]:
+                raise TGException("cannot change name of edge")
+        elif _is_score(value):
+            if not isinstance(value, (int, long, np.integer)):
+                self._int_scores.discard(key)
+            elif key not in self._scores:
+                # new column, holding integers until a float is written
+                self._int_scores.add(key)
+            self._score_array(key)[e] = value
+            self._edge_extra.get(e, {}).pop(key, None)
+        else:
+            if key in self._scores:
+                self._score_array(key)[e] = np.nan
+            self._edge_extra.setdefault(e, {})[key] = value
+
+    def _del_edge_attr(self, e, key):
+        if key == "name":
+            raise TGException("cannot delete name of edge")
+
+        a = self._scores.get(key)
+
+        if a is not None and not np.isnan(a[e]):
+            self._score_array(key)[e] = np.nan
+        else:
+            del self._edge_extra.get(e, {})[key]
+
+    def _max_score_arrays(self, score_attr):
+        """
+        return arrays with the max score and corresponding target node for
+        each node, where NaN and -1 mean that no translation edge of the
+        node has the score attribute
+        """
+        scores = np.empty(self._n_nodes) * np.nan
+        nodes = -np.ones(self._n_nodes, dtype="i4")
+        edges = self._typed_edge_array(TRANS)
+        column = self._scores.get(score_attr)
+
+        if column is not None and len(edges):
+            sources = self._src[edges]
+            starts = segment_starts(sources)
+            argmax = segment_argmax(column[edges], starts)
+            found = argmax >= 0
+            max_edges = edges[argmax[found]]
+            found_sources = sources[starts[found]]
+            scores[found_sources] = column[max_edges]
+            nodes[found_sources] = self._dst[max_edges]
+
+        return scores, nodes
+
+    def _invalidate_index(self):
+        self._out_ptr = self._out_edges = None
+        self._in_ptr = self._in_edges = None
+        self._index_lists = None
+
+    def _build_index(self):
+        if self._out_ptr is not None:
+            return
+
+        n, m = self._n_nodes, self._n_edges
+        etypes = self._etype[:m]
+        self._out_ptr, self._out_edges = _csr(self._src[:m], etypes, n)
+        self._in_ptr, self._in_edges = _csr(self._dst[:m], etypes, n)
+
+    def _lists(self):
+        """
+        return the edge arrays and CSR indices as lists, which are much
+        faster than numpy arrays for access to single items
+        """
+        if self._index_lists is None:
+            self._build_index()
+            m = self._n_edges
+            self._index_lists = (
+                self._src[:m].tolist(), self._dst[:m].tolist(),
+                self._etype[:m].tolist(),
+                self._out_ptr.tolist(), self._out_edges.tolist(),
+                self._in_ptr.tolist(), self._in_edges.tolist() )
+        return self._index_lists
+
+    def _edges_iter(self, nbunch, data, outgoing=True):
+        src, dst, _, out_ptr, out_edges, in_ptr, in_edges = self._lists()
+
+        if outgoing:
+            ptr, edges = out_ptr, out_edges
+        else:
+            ptr, edges = in_ptr, in_edges
+
+        if nbunch is None:
+            nbunch = xrange(self._n_nodes)
+        elif _is_node_id(nbunch):
+            nbunch = [nbunch]
+
+        for u in nbunch:
+            for e in edges[ptr[u * N_EDGE_TYPES]:
+                           ptr[(u + 1) * N_EDGE_TYPES]]:
+                if data:
+                    yield src[e], dst[e], self._data(e)
+                else:
+                    yield src[e], dst[e]
+
+    def _typed_edges(self, u, etype, outgoing=True):
+        """
+        return list of edges of given type, either all of them or the
+        outgoing/incoming edges of node u
+        """
+        if u is None:
+            return self._typed_edge_array(etype).tolist()
+
+        _, _, _, out_ptr, out_edges, in_ptr, in_edges = self._lists()
+        i = u * N_EDGE_TYPES + etype
+
+        if outgoing:
+            return out_edges[out_ptr[i]:out_ptr[i+1]]
+        else:
+            return in_edges[in_ptr[i]:in_ptr[i+1]]
+
+    def _typed_edge_array(self, etype):
+        """
+        return array of all edges of given type, grouped by source node
+        """
+        self._build_index()
+        edges = self._out_edges
+        return edges[self._etype[edges] == etype]
+
+    def _typed_neighbours(self, u, etype, outgoing=True):
+        src, dst = self._lists()[:2]
+        ends = dst if outgoing else src
+        return [ ends[e] for e in self._typed_edges(u, etype, outgoing) ]
+
+    def _next_node(self, u):
+        v = self._next.item(u)
+        if v >= 0:
+            return v
+
+    def _prev_node(self, u):
+        v = self._prev.item(u)
+        if v >= 0:
+            return v
+
+    def _nodes_of_kind(self, kind):
+        return iter(np.flatnonzero(self._kind[:self._n_nodes] == kind)
+                    .tolist())
+
+
+
+class _NodeData(collections.MutableMapping):
+    """
+    dict-like view on the attributes of a single node
+    """
+
+    def __init__(self, graph, u):
+        self._graph = graph
+        self._u = u
+
+    def _column(self, key):
+        return getattr(self._graph, "_" + key)
+
+    def __getitem__(self, key):
+        if key in CompactTransGraph.array_attrs:
+            value = self._graph._string(self._column(key), self._u)
+            if value is None:
+                raise KeyError(key)
+            return value
+        else:
+            return self._graph._node_extra.get(self._u, {})[key]
+
+    def __setitem__(self, key, value):
+        if key in CompactTransGraph.array_attrs:
+            self._column(key)[self._u] = self._graph._intern(value)
+        else:
+            self._graph._node_extra.setdefault(self._u, {})[key] = value
+
+    def __delitem__(self, key):
+        if key in CompactTransGraph.array_attrs:
+            if self._column(key)[self._u] < 0:
+                raise KeyError(key)
+            self._column(key)[self._u] = -1
+        else:
+            del self._graph._node_extra[self._u][key]
+
+    def __iter__(self):
+        for key in CompactTransGraph.array_attrs:
+            if self._column(key)[self._u] >= 0:
+                yield key
+        for key in self._graph._node_extra.get(self._u, ()):
+            yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def has_key(self, key):
+        return key in self
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+
+class _EdgeData(collections.MutableMapping):
+    """
+    dict-like view on the attributes of a single edge
+    """
+
+    def __init__(self, graph, e):
+        self._graph = graph
+        self._e = e
+
+    def __getitem__(self, key):
+        if key == "name":
+            return EDGE_NAMES[self._graph._etype.item(self._e)]
+
+        a = self._graph._scores.get(key)
+
+        if a is not None:
+            value = a.item(self._e)
+            # NaN means no score
+            if value == value:
+                if key in self._graph._int_scores:
+                    return int(value)
+                return value
+
+        return self._graph._edge_extra.get(self._e, {})[key]
+
+    def __setitem__(self, key, value):
+        self._graph._set_edge_attr(self._e, key, value)
+
+    def __delitem__(self, key):
+        self._graph._del_edge_attr(self._e, key)
+
+    def __iter__(self):
+        yield "name"
+        for key, a in self._graph._scores.iteritems():
+            if not np.isnan(a[self._e]):
+                yield key
+        for key in self._graph._edge_extra.get(self._e, ()):
+            yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def has_key(self, key):
+        return key in self
+
+    def copy(self):
+        return dict(self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+
+class _NodeMap(collections.Mapping):
+    """
+    dict-like view mapping nodes to their attributes (cf. DiGraph.node)
+    """
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __getitem__(self, u):
+        if u not in self._graph:
+            raise KeyError(u)
+        return _NodeData(self._graph, u)
+
+    def __iter__(self):
+        return iter(self._graph)
+
+    def __len__(self):
+        return len(self._graph)
+
+
+
+class _AdjacencyMap(collections.Mapping):
+    """
+    dict-like view mapping nodes to dicts of their successors and the
+    corresponding edge data (cf. DiGraph.edge)
+    """
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __getitem__(self, u):
+        if u not in self._graph:
+            raise KeyError(u)
+        return dict( (v, data)
+                     for _, v, data in self._graph.out_edges_iter(u, True) )
+
+    def __iter__(self):
+        return iter(self._graph)
+
+    def __len__(self):
+        return len(self._graph)
+
+
+
+def _grow(a, fill=None):
+    """
+    return a copy of array a with twice its capacity, optionally filling
+    the new part with the given value
+    """
+    b = np.empty(max(2 * len(a), INIT_SIZE), dtype=a.dtype)
+    b[:len(a)] = a
+    if fill is not None:
+        b[len(a):] = fill
+    return b
+
+
+def _csr(ends, etypes, n):
+    """
+    return CSR-style pointers and edge indices keyed on node and edge type,
+    where edges[ptr[i]:ptr[i+1]] with i = u * N_EDGE_TYPES + etype are the
+    edges of that type with u at the given end, in the order they were added
+    """
+    keys = ends * N_EDGE_TYPES + etypes
+    # mergesort is stable and thus retains the order of edges
+    edges = np.argsort(keys, kind="mergesort").astype("i4")
+    ptr = np.zeros(n * N_EDGE_TYPES + 1, dtype="i4")
+    np.cumsum(np.bincount(keys, minlength=n * N_EDGE_TYPES), out=ptr[1:])
+    return ptr, edges
+
+
+def _is_node_id(u):
+    return isinstance(u, (int, long, np.integer))
+
+
+def _is_score(value):
+    if isinstance(value, (bool, np.bool_)):
+        return False
+    elif isinstance(value, (int, long, np.integer)):
+        # larger integers are kept as extras
+        return abs(value) <= MAX_EXACT_INT
+    else:
+        return isinstance(value, (float, np.floating))
+
+
+def _copy_attrs(d):
+    # one level deeper than dict.copy(), because of lists like "lex_lempos"
+    return dict( (k, list(v) if isinstance(v, list) else v)
+                 for k, v in d.iteritems() )
@@ -0,0 +1,659 @@
+"""
+storage of translation graphs in memory-mapped corpora and of their scores
+in sidecar files
+"""
+
+import cPickle
+import collections
+import logging
+import os
+
+import numpy as np
+
+from tg.compactgraph import ( SOURCE, TARGET, HYPER_SOURCE, HYPER_TARGET,
+                              TRANS, NEXT, PART, EDGE_NAMES, MAX_EXACT_INT )
+from tg.exception import TGException
+from tg.transgraph import TransGraph
+
+
+log = logging.getLogger(__name__)
+
+
+# extension of corpus directories
+CORPUS_EXT = ".tgc"
+
+FORMAT_VERSION = 1
+
+META_FNAME = "meta.pkl"
+EXTRAS_FNAME = "extras.pkl"
+SCORE_PREFIX = "score_"
+
+# node id prefixes indexed by node kind
+NODE_PREFIXES = ( TransGraph.source_node_prefix,
+                  TransGraph.target_node_prefix,
+                  TransGraph.hyper_source_node_prefix,
+                  TransGraph.hyper_target_node_prefix )
+
+# node attributes stored as indices into the string table
+STRING_ATTRS = "word", "lemma", "pos"
+
+# node attribute stored as list of indices into the string table
+LIST_ATTR = "lex_lempos"
+
+
+
+class GraphCorpus(collections.Sequence):
+    """
+    Read-only corpus of translation graphs
+
+    The corpus is a directory of numpy arrays, which are memory-mapped
+    rather than read, so opening a corpus is near-instant. Graphs are only
+    decoded (into TransGraph instances) when accessed, so any prefix or
+    subset of graphs can be obtained without decoding the rest.
+
+    Parameters
+    ----------
+    path: str
+        name of corpus directory, as written by write_corpus
+
+    Notes
+    -----
+    The arrays are concatenations over all graphs:
+
+    - a string table, as a single UTF-8 encoded byte array plus offsets
+    - a node table, with the kind, number (as in the node identifier),
+      word, lemma and POS (as string indices) and lexicon lempos (as a range
+      of string indices) of each node, where source nodes come first in
+      word order; a subset of this table is the token table (source nodes),
+      another is the candidate table (target nodes)
+    - an edge table, with the source node, target node (as node indices
+      local to the graph) and type of each edge
+    - a score column for each score attribute, aligned with the edge
+      table, where NaN means that the edge does not have the attribute;
+      if all values of an attribute are integers, its dtype is recorded as
+      integer and its values are decoded as ints
+    - node and edge pointers, where node_ptr[i]:node_ptr[i+1] is the range
+      of nodes of graph i, and likewise for edges
+
+    Graph attributes are stored in a small pickle file, as are any node or
+    edge attributes that do not fit in the tables above.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        meta = cPickle.load(open(os.path.join(path, META_FNAME), "rb"))
+
+        if meta["version"] != FORMAT_VERSION:
+            raise TGException("unsupported corpus format version {} in "
+                              "{}".format(meta["version"], path))
+
+        self.graph_attrs = meta["graph_attrs"]
+        self.score_attrs = meta["score_attrs"]
+        self.score_dtypes = meta.get("score_dtypes", {})
+        self._arrays = {}
+        self._strings = {}
+        self._id_index = None
+        self._extras = None
+        self._extras_graphs = frozenset(
+            self._array("extras_graphs").tolist())
+
+    def __repr__(self):
+        return "{}({!r})".format(self.__class__.__name__, self.path)
+
+    def __len__(self):
+        return len(self.graph_attrs)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [ self._decode(j) for j in xrange(*i.indices(len(self))) ]
+
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("graph index out of range")
+
+        return self._decode(i)
+
+    def graph_index(self, graph_id):
+        """
+        return index of graph with given id
+        """
+        if self._id_index is None:
+            self._id_index = dict( (attrs.get("id"), i)
+                                   for i, attrs in enumerate(self.graph_attrs) )
+        return self._id_index[graph_id]
+
+    def get_graph(self, graph_id):
+        """
+        return graph with given id
+        """
+        return self._decode(self.graph_index(graph_id))
+
+    def edge_range(self, i):
+        """
+        return start and end index in edge table of the edges of graph i
+        """
+        edge_ptr = self._array("edge_ptr")
+        return edge_ptr.item(i), edge_ptr.item(i + 1)
+
+    def score_column(self, score_attr):
+        """
+        return (memory-mapped) score column for all edges in the corpus
+        """
+        if score_attr not in self.score_attrs:
+            raise KeyError(score_attr)
+        return self._array(SCORE_PREFIX + score_attr)
+
+    def _array(self, name):
+        try:
+            return self._arrays[name]
+        except KeyError:
+            a = self._arrays[name] = np.load(
+                os.path.join(self.path, name + ".npy"), mmap_mode="r")
+            return a
+
+    def _string(self, i):
+        try:
+            return self._strings[i]
+        except KeyError:
+            string_ptr = self._array("string_ptr")
+            start, end = string_ptr.item(i), string_ptr.item(i + 1)
+            s = self._strings[i] = ( self._array("strings")[start:end]
+                                     .tobytes().decode("utf-8") )
+            return s
+
+    def _get_extras(self, i):
+        # the extras pickle is only loaded when a graph actually has extras
+        if i not in self._extras_graphs:
+            return {}, {}
+
+        if self._extras is None:
+            fname = os.path.join(self.path, EXTRAS_FNAME)
+            self._extras = cPickle.load(open(fname, "rb"))
+
+        return self._extras[i]
+
+    def _decode(self, i):
+        graph = TransGraph(**self.graph_attrs[i])
+
+        start, end = self._array("node_ptr")[i:i+2].tolist()
+        kinds = self._array("node_kind")[start:end].tolist()
+        numbers = self._array("node_number")[start:end].tolist()
+        columns = [ (attr, self._array("node_" + attr)[start:end].tolist())
+                    for attr in STRING_ATTRS ]
+        lex_starts = self._array("node_lex_start")[start:end].tolist()
+        lex_lengths = self._array("node_lex_len")[start:end].tolist()
+        lex_ids = self._array("lex_ids")
+        node_extras, edge_extras = self._get_extras(i)
+        nodes = []
+        counts = [0] * len(NODE_PREFIXES)
+
+        for j, (kind, number) in enumerate(zip(kinds, numbers)):
+            attrs = dict( (attr, self._string(column[j]))
+                          for attr, column in columns
+                          if column[j] >= 0 )
+
+            if lex_lengths[j] >= 0:
+                ids = lex_ids[lex_starts[j]:lex_starts[j] + lex_lengths[j]]
+                attrs[LIST_ATTR] = [ self._string(k) for k in ids.tolist() ]
+
+            attrs.update(node_extras.get(j, {}))
+            u = NODE_PREFIXES[kind] + str(number)
+            graph.add_node(u, attr_dict=graph._intern_attrs(attrs))
+            nodes.append(u)
+            counts[kind] = max(counts[kind], number)
+
+        ( graph.source_node_count,
+          graph.target_node_count,
+          graph.hyper_source_node_count,
+          graph.hyper_target_node_count ) = counts
+
+        source_start = self._array("source_start").item(i)
+        if source_start >= 0:
+            graph.set_source_start_node(nodes[source_start])
+
+        start, end = self.edge_range(i)
+        sources = self._array("edge_src")[start:end].tolist()
+        targets = self._array("edge_dst")[start:end].tolist()
+        types = self._array("edge_type")[start:end].tolist()
+        columns = [ (attr, self.score_column(attr)[start:end].tolist(),
+                     self.score_dtypes.get(attr) == "i8")
+                    for attr in self.score_attrs ]
+
+        for k, (u, v, etype) in enumerate(zip(sources, targets, types)):
+            data = {"name": EDGE_NAMES[etype]}
+
+            for attr, column, is_int in columns:
+                score = column[k]
+                # NaN means no score
+                if score == score:
+                    data[attr] = int(score) if is_int else score
+
+            data.update(edge_extras.get(k, {}))
+            graph.add_edge(nodes[u], nodes[v], attr_dict=data)
+
+        return graph
+
+
+
+def write_corpus(graphs, path):
+    """
+    write translation graphs to a new corpus directory
+
+    Parameters
+    ----------
+    graphs: iterable of TransGraph (or CompactTransGraph) instances
+    path: str
+        name of corpus directory, which is created if needed
+    """
+    log.info("writing graph corpus to " + path)
+    writer = _CorpusWriter()
+
+    for graph in graphs:
+        writer.add(graph)
+
+    writer.save(path)
+
+
+def is_corpus(fname):
+    """
+    test if file name refers to a graph corpus rather than a pickle file
+    """
+    return ( fname.endswith(CORPUS_EXT) or
+             os.path.exists(os.path.join(fname, META_FNAME)) )
+
+
+def load_graphs(fname, n_graphs=None):
+    """
+    load list of graphs from a corpus directory or a pickle file
+
+    Parameters
+    ----------
+    fname: str
+        name of corpus directory or pickle file
+    n_graphs: int or None
+        load only the first n_graphs graphs, which only saves time for a
+        corpus
+    """
+    log.info("loading graphs from " + fname)
+
+    if is_corpus(fname):
+        return GraphCorpus(fname)[:n_graphs]
+    else:
+        return cPickle.load(open(fname, "rb"))[:n_graphs]
+
+
+def save_graphs(graphs, fname):
+    """
+    save list of graphs to a corpus directory or a pickle file, depending
+    on the extension of fname
+    """
+    if fname.endswith(CORPUS_EXT):
+        write_corpus(graphs, fname)
+    else:
+        log.info("saving graphs to " + fname)
+        cPickle.dump(graphs, open(fname, "wb"), cPickle.HIGHEST_PROTOCOL)
+
+
+
+def save_scores(graphs, score_attrs, fname):
+    """
+    save score columns of translation edges to a sidecar file
+
+    A sidecar holds only scores, keyed by graph id and by the source and
+    target node of each edge, so it is much smaller than the graphs
+    themselves. It can be overlaid on the graphs it was computed from with
+    overlay_scores, whether these were loaded from a pickle or a corpus.
+
+    Parameters
+    ----------
+    graphs: list of TransGraph (or CompactTransGraph) instances
+    score_attrs: list of str
+        names of score attributes to save
+    fname: str
+        name of sidecar file, which should end in ".npz"
+    """
+    if not score_attrs:
+        raise TGException("no score attributes to save")
+
+    log.info("saving scores {} to {}".format(", ".join(score_attrs), fname))
+    graph_ids = []
+    edge_ptr = [0]
+    edge_src, edge_dst = [], []
+    columns = dict( (attr, []) for attr in score_attrs )
+
+    for graph in graphs:
+        graph_ids.append(unicode(graph.graph["id"]))
+        sources, targets = graph.trans_edge_arrays(data=False)
+        edge_ptr.append(edge_ptr[-1] + len(sources))
+        edge_src += [ unicode(u) for u in sources.tolist() ]
+        edge_dst += [ unicode(v) for v in targets.tolist() ]
+
+        for attr in score_attrs:
+            columns[attr].append(graph.score_column(attr))
+
+    arrays = dict( (SCORE_PREFIX + attr, np.concatenate(columns[attr]))
+                   for attr in score_attrs )
+    np.savez_compressed(fname,
+                        graph_ids=np.array(graph_ids, dtype=unicode),
+                        edge_ptr=np.array(edge_ptr, dtype="i8"),
+                        edge_src=np.array(edge_src, dtype=unicode),
+                        edge_dst=np.array(edge_dst, dtype=unicode),
+                        **arrays)
+
+
+def overlay_scores(graphs, fname, rename=None):
+    """
+    overlay score columns from a sidecar file on translation graphs
+
+    Graphs are matched on their id, so graphs may be any subset of those
+    for which the sidecar was saved; graphs not in the sidecar are left
+    untouched, as are the scores of edges without a score in the sidecar.
+    Edges are matched on their source and target node, as the order of
+    translation edges differs between a graph loaded from a pickle and the
+    same graph loaded from a corpus.
+
+    Parameters
+    ----------
+    graphs: list of TransGraph (or CompactTransGraph) instances
+        same graphs as passed to save_scores, without the saved scores
+    fname: str
+        name of sidecar file written by save_scores
+    rename: dict
+        mapping from score attributes in the sidecar to new names,
+        for combining sidecars that use the same score attributes
+    """
+    log.info("overlaying scores from " + fname)
+    rename = rename or {}
+    sidecar = np.load(fname)
+
+    if "edge_src" not in sidecar.files:
+        raise TGException("score sidecar {} has no edge nodes; save its "
+                          "scores again".format(fname))
+
+    index = dict( (graph_id, i) for i, graph_id in
+                  enumerate(sidecar["graph_ids"].tolist()) )
+    edge_ptr = sidecar["edge_ptr"].tolist()
+    edge_src = sidecar["edge_src"].tolist()
+    edge_dst = sidecar["edge_dst"].tolist()
+    columns = [ (rename.get(key[len(SCORE_PREFIX):], key[len(SCORE_PREFIX):]),
+                 sidecar[key])
+                for key in sidecar.files if key.startswith(SCORE_PREFIX) ]
+
+    for graph in graphs:
+        try:
+            i = index[unicode(graph.graph["id"])]
+        except KeyError:
+            continue
+
+        start, end = edge_ptr[i], edge_ptr[i + 1]
+        saved = zip(edge_src[start:end], edge_dst[start:end])
+        sources, targets = graph.trans_edge_arrays(data=False)
+        edges = [ (unicode(u), unicode(v)) for u, v in
+                  zip(sources.tolist(), targets.tolist()) ]
+
+        if edges == saved:
+            order = slice(start, end)
+        else:
+            # same edges in another order
+            positions = dict( (edge, start + k)
+                              for k, edge in enumerate(saved) )
+            try:
+                order = [ positions[edge] for edge in edges ]
+            except KeyError:
+                order = None
+
+            if order is None or len(edges) != len(saved):
+                raise TGException("translation edges of graph {} do not "
+                                  "match those in score sidecar {}".format(
+                                      graph.graph["id"], fname))
+
+        for attr, column in columns:
+            graph.set_score_column(attr, column[order])
+
+    return graphs
+
+
+def load_scored_graphs(graphs_fname, scores_fnames, n_graphs=None,
+                       renames=None):
+    """
+    load graphs and overlay scores from one or more sidecar files
+
+    Parameters
+    ----------
+    graphs_fname: str
+        name of corpus directory or pickle file with the preprocessed
+        graphs shared by the experiments
+    scores_fnames: list of str
+        names of sidecar files written by save_scores
+    n_graphs: int or None
+        load only the first n_graphs graphs
+    renames: list of dict or None
+        mapping from score attributes to new names for each sidecar file
+    """
+    graphs = load_graphs(graphs_fname, n_graphs)
+
+    for fname, rename in zip(scores_fnames,
+                             renames or [None] * len(scores_fnames)):
+        overlay_scores(graphs, fname, rename)
+
+    return graphs
+
+
+
+class _CorpusWriter(object):
+    """
+    accumulates tables for a corpus
+    """
+
+    def __init__(self):
+        self.graph_attrs = []
+        self.source_start = []
+        self.node_ptr = [0]
+        self.node_kind = []
+        self.node_number = []
+        self.node_columns = dict( (attr, []) for attr in STRING_ATTRS )
+        self.node_lex_start = []
+        self.node_lex_len = []
+        self.lex_ids = []
+        self.edge_ptr = [0]
+        self.edge_src = []
+        self.edge_dst = []
+        self.edge_type = []
+        # per score attribute, lists of edge indices and scores
+        self.scores = {}
+        # score attributes with a non-integer value
+        self.float_attrs = set()
+        self.extras = {}
+        self.string_ids = {}
+        self.strings = []
+
+    def add(self, graph):
+        node_extras = {}
+        edge_extras = {}
+        nodes = self._ordered_nodes(graph)
+        index = dict( (u, j) for j, (u, _, _) in enumerate(nodes) )
+
+        for u, kind, number in nodes:
+            attrs = dict(graph.node[u])
+            attrs.pop(TransGraph.max_scores_cache, None)
+            self.node_kind.append(kind)
+            self.node_number.append(number)
+
+            for attr in STRING_ATTRS:
+                value = attrs.pop(attr, None)
+
+                if value is None or isinstance(value, basestring):
+                    self.node_columns[attr].append(self._intern(value))
+                else:
+                    self.node_columns[attr].append(-1)
+                    attrs[attr] = value
+
+            lex_lempos = attrs.pop(LIST_ATTR, None)
+            self.node_lex_start.append(len(self.lex_ids))
+
+            if lex_lempos is None:
+                self.node_lex_len.append(-1)
+            else:
+                self.node_lex_len.append(len(lex_lempos))
+                self.lex_ids += [ self._intern(s) for s in lex_lempos ]
+
+            if attrs:
+                node_extras[index[u]] = attrs
+
+        self.node_ptr.append(len(self.node_kind))
+
+        edges = ( [ (u, v, TRANS, d) for u, v, d in graph.trans_edges_iter() ] +
+                  [ (u, v, NEXT, d)
+                    for u, v, d in graph.word_order_edges_iter() ] +
+                  [ (u, v, PART, d) for u, v, d in graph.part_edges_iter() ] )
+
+        if len(edges) != graph.number_of_edges():
+            raise TGException("graph {} has edges of unknown type".format(
+                graph))
+
+        for k, (u, v, etype, data) in enumerate(edges):
+            e = len(self.edge_src)
+            self.edge_src.append(index[u])
+            self.edge_dst.append(index[v])
+            self.edge_type.append(etype)
+
+            for attr, value in data.iteritems():
+                if attr == "name":
+                    continue
+                elif _is_number(value):
+                    indices, scores = self.scores.setdefault(attr, ([], []))
+                    indices.append(e)
+                    scores.append(value)
+
+                    if not isinstance(value, (int, long, np.integer)):
+                        self.float_attrs.add(attr)
+                else:
+                    edge_extras.setdefault(k, {})[attr] = value
+
+        self.edge_ptr.append(len(self.edge_src))
+
+        if graph.source_start_node is None:
+            self.source_start.append(-1)
+        else:
+            self.source_start.append(index[graph.source_start_node])
+
+        if node_extras or edge_extras:
+            self.extras[len(self.graph_attrs)] = node_extras, edge_extras
+
+        self.graph_attrs.append(dict(graph.graph))
+
+    def save(self, path):
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        encoded = [ s.encode("utf-8") for s in self.strings ]
+        string_ptr = np.zeros(len(encoded) + 1, dtype="i8")
+        np.cumsum([ len(s) for s in encoded ], out=string_ptr[1:])
+        strings = np.frombuffer("".join(encoded), dtype="u1")
+
+        arrays = [ ("strings", strings),
+                   ("string_ptr", string_ptr),
+                   ("source_start", np.array(self.source_start, dtype="i4")),
+                   ("node_ptr", np.array(self.node_ptr, dtype="i8")),
+                   ("node_kind", np.array(self.node_kind, dtype="i1")),
+                   ("node_number", np.array(self.node_number, dtype="i4")),
+                   ("node_lex_start",
+                    np.array(self.node_lex_start, dtype="i8")),
+                   ("node_lex_len", np.array(self.node_lex_len, dtype="i4")),
+                   ("lex_ids", np.array(self.lex_ids, dtype="i4")),
+                   ("edge_ptr", np.array(self.edge_ptr, dtype="i8")),
+                   ("edge_src", np.array(self.edge_src, dtype="i4")),
+                   ("edge_dst", np.array(self.edge_dst, dtype="i4")),
+                   ("edge_type", np.array(self.edge_type, dtype="i1")),
+                   ("extras_graphs",
+                    np.array(sorted(self.extras), dtype="i4")) ]
+
+        for attr in STRING_ATTRS:
+            arrays.append(("node_" + attr,
+                           np.array(self.node_columns[attr], dtype="i4")))
+
+        for attr, (indices, scores) in self.scores.iteritems():
+            column = np.empty(len(self.edge_src)) * np.nan
+            column[indices] = scores
+            arrays.append((SCORE_PREFIX + attr, column))
+
+        for name, a in arrays:
+            np.save(os.path.join(path, name + ".npy"), a)
+
+        cPickle.dump(self.extras,
+                     open(os.path.join(path, EXTRAS_FNAME), "wb"),
+                     cPickle.HIGHEST_PROTOCOL)
+
+        meta = dict(version=FORMAT_VERSION,
+                    graph_attrs=self.graph_attrs,
+                    score_attrs=sorted(self.scores),
+                    score_dtypes=dict(
+                        (attr, "f8" if attr in self.float_attrs else "i8")
+                        for attr in self.scores ))
+        cPickle.dump(meta, open(os.path.join(path, META_FNAME), "wb"),
+                     cPickle.HIGHEST_PROTOCOL)
+
+        log.info("wrote {} graphs with {} nodes and {} edges".format(
+            len(self.graph_attrs), len(self.node_kind), len(self.edge_src)))
+
+    def _intern(self, s):
+        if s is None:
+            return -1
+
+        if isinstance(s, str):
+            s = s.decode("utf-8")
+
+        try:
+            return self.string_ids[s]
+        except KeyError:
+            i = self.string_ids[s] = len(self.strings)
+            self.strings.append(s)
+            return i
+
+    def _ordered_nodes(self, graph):
+        """
+        return list of (node, kind, number) tuples, with source nodes first
+        in word order, followed by the other nodes ordered by kind and
+        number
+        """
+        counts = [0] * len(NODE_PREFIXES)
+        nodes = []
+
+        for u in graph.nodes_iter():
+            # NB hyper node tests must come first, as their prefixes start
+            # with those of source and target nodes
+            if graph.is_hyper_source_node(u):
+                kind = HYPER_SOURCE
+            elif graph.is_hyper_target_node(u):
+                kind = HYPER_TARGET
+            elif graph.is_source_node(u):
+                kind = SOURCE
+            else:
+                kind = TARGET
+
+            if isinstance(u, basestring):
+                number = int(u[len(NODE_PREFIXES[kind]):])
+            else:
+                # CompactTransGraph has integer node ids
+                counts[kind] += 1
+                number = counts[kind]
+
+            nodes.append((u, kind, number))
+
+        position = dict( (u, i) for i, u in
+                         enumerate(graph.source_nodes_iter(ordered=True)) )
+        nodes.sort(key=lambda (u, kind, number):
+                   (kind != SOURCE, position.get(u), kind, number))
+        return nodes
+
+
+
+def _is_number(value):
+    if isinstance(value, (bool, np.bool_)):
+        return False
+    elif isinstance(value, (int, long, np.integer)):
+        # larger integers are kept as extras
+        return abs(value) <= MAX_EXACT_INT
+    else:
+        return isinstance(value, (float, np.floating))
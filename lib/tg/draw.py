@@ -69,7 +69,8 @@ class DrawGV:
             elif nx_graph.is_target_node(u):
                 node = self.target_node(u, data)
             else:
-                node = self.hyper_node(u, data)
+                node = self.hyper_node(u, data,
+                                       nx_graph.is_hyper_source_node(u))
                 hypernodes.append(u)
                 
             self.dot_graph.add_node(node)
@@ -154,8 +155,8 @@ class DrawGV:
                           fillcolor=self.TARGET_COLOR,
                           **self.NODE_DEFAULTS)
     
-    def hyper_node(self, u, data):
-        if u.startswith("hs"):
+    def hyper_node(self, u, data, is_source=True):
+        if is_source:
             return pydot.Node(
                 str(u), 
                 label=u"|".join(data.get("lex_lempos", [])).encode("utf-8"), 
@@ -2,9 +2,11 @@
 processing of evaluation data
 """
 
+import itertools
 import logging
 import sys
 import xml.etree.ElementTree as et
+from xml.sax.saxutils import escape, quoteattr
 
 from tg.annot import get_annotator
 
@@ -16,11 +18,16 @@ log = logging.getLogger(__name__)
 
 
 def lemmatize(infname, lang, outf=sys.stdout, sent_tag="seg",
-              encoding="utf-8", replace_unknown_lemma=True):
+              encoding="utf-8", replace_unknown_lemma=True, workers=1,
+              cache=None):
     """
     Lemmatize reference translations in mteval format (may work for other
     formats too)
     
+    Segments are read incrementally and annotated in batches, possibly in
+    parallel, while the lemmatized XML is written out in the original order,
+    so memory use does not grow with the size of the input.
+    
     Parameters
     ----------
     infname: str
@@ -33,23 +40,107 @@ def lemmatize(infname, lang, outf=sys.stdout, sent_tag="seg",
         char encoding for output (should be the same as that of input)
     replace_unknown_lemma: bool, optional
         replace unknown lemma by word
+    workers: int, optional
+        number of batches of sentences to lemmatize in parallel
+    cache: AnnotationCache or str, optional
+        cache of annotated sentences or its file name
     """
-    annotator = get_annotator(lang, replace_unknown_lemma=replace_unknown_lemma)
+    annotator = get_annotator(lang, replace_unknown_lemma=replace_unknown_lemma,
+                              cache=cache)
     log.info("using annotator " + annotator.__class__.__name__)
+    _lemmatize(annotator, infname, outf, sent_tag, encoding, workers)
+    annotator.stats.log()
+
+
+def _lemmatize(annotator, infname, outf, sent_tag, encoding, workers):
     log.info("reading evaluation data from file " + infname)
-    etree = et.ElementTree(file=infname)
-    sentences = [ sent_elem.text for sent_elem in etree.iter(sent_tag) ]
-    log.debug(u"input:\n" + u"\n".join(sentences))
-    graph_list = annotator.annot_sentences(sentences)
-        
-    for sent_elem, graph in zip(etree.iter(sent_tag), graph_list):
-        lemma_text = " ".join(graph.source_lemmas())
-        sent_elem.text = lemma_text
-        
+    # Parsing runs ahead of writing by as many sentences as the annotator
+    # is working on, which tee buffers
+    parts, sent_parts = itertools.tee(_iter_xml_parts(infname, sent_tag))
+    sentences = ( sent for _, sent in sent_parts if sent is not None )
+    graphs = annotator.iter_sentences(sentences, workers=workers)
+    
     log.info("writing lemmatized evaluation data to {0}".format(
         getattr(outf, "name", outf)))
+    
+    if isinstance(outf, basestring):
+        outf = open(outf, "w")
         
-    etree.write(outf, encoding=encoding)
+    if encoding.lower() not in ("utf-8", "us-ascii"):
+        outf.write("<?xml version='1.0' encoding='{}'?>\n".format(encoding))
     
+    for markup, sent in parts:
+        outf.write(markup.encode(encoding, "xmlcharrefreplace"))
+        
+        if sent is not None:
+            lemma_text = u" ".join(next(graphs).source_lemmas())
+            log.debug(u"lemmatized: " + lemma_text)
+            outf.write(escape(lemma_text).encode(encoding,
+                                                 "xmlcharrefreplace"))
+            
+    outf.flush()
     
+    
+def _iter_xml_parts(infname, sent_tag):
+    """
+    Parse xml file incrementally, generating (markup, sentence) pairs,
+    where sentence is the text of a sentence element (or None) that goes 
+    right after the markup. Child elements of sentence elements are 
+    dropped.
+    
+    Elements are removed from the tree once they are written, so memory 
+    use is bounded by the depth of the tree. Text and tail of an element
+    are complete only when the parser has moved on to the next event, so 
+    they are generated one event later.
+    """
+    stack = []
+    # element whose text (after start) or tail (after end) is pending
+    pending = None
+    in_sent = 0
+    
+    for event, elem in et.iterparse(infname, events=("start", "end")):
+        if pending:
+            pending_event, pending_elem = pending
+            pending = None
+            
+            if pending_event == "start":
+                yield escape(pending_elem.text or u""), None
+            else:
+                yield escape(pending_elem.tail or u""), None
+                # done with this element
+                if stack:
+                    stack[-1].remove(pending_elem)
+        
+        if in_sent:
+            # anything inside a sentence element is replaced by its lemmas
+            if event == "start":
+                in_sent += 1
+                continue
+            
+            in_sent -= 1
+            
+            if not in_sent:
+                stack.pop()
+                yield u"", elem.text or u""
+                yield u"</{}>".format(elem.tag), None
+                pending = event, elem
+        elif event == "start":
+            if elem.tag == sent_tag:
+                in_sent = 1
+            else:
+                pending = event, elem
+                
+            yield _start_tag(elem), None
+            stack.append(elem)
+        else:
+            stack.pop()
+            yield u"</{}>".format(elem.tag), None
+            pending = event, elem
+            
+    yield u"\n", None
+
 
+def _start_tag(elem):
+    attrs = u"".join(u" {}={}".format(name, quoteattr(value))
+                     for name, value in sorted(elem.items()))
+    return u"<{}{}>".format(elem.tag, attrs)
@@ -2,7 +2,6 @@
 generic framework for running translation experiments with classifiers 
 """
 
-import cPickle
 import logging
 import os
 import tempfile
@@ -10,6 +9,7 @@ import tempfile
 import h5py
 
 from tg.config import config
+from tg.corpus import load_graphs, save_graphs, save_scores
 from tg.exps import support
 
 # Functions and classes below are imported in local namespace 
@@ -57,8 +57,8 @@ def create_filename_prefix(ns):
 
 def get_graphs(ns):
     ns.graphs_fname = config["eval"][ns.data][ns.lang]["graphs_fname"]    
-    log.info("loading graphs from " + ns.graphs_fname) 
-    ns.graphs = cPickle.load(open(ns.graphs_fname))[:ns.n_graphs]  
+    # only the first n_graphs are decoded if graphs_fname is a corpus
+    ns.graphs = load_graphs(ns.graphs_fname, ns.n_graphs)
     
 def get_languages(ns):
     ns.source_lang, ns.target_lang = ns.lang.split("-")
@@ -111,7 +111,7 @@ def get_samples(ns):
 def score(ns):
     ns.compute_classifier_score(ns)
     ns.compute_best_score(ns)
-    ns.save_scored_graphs(ns)
+    ns.save_score_columns(ns)
     
 def compute_classifier_score(ns):
     models = ns.TranslationClassifier(ns.models_fname)
@@ -132,11 +132,16 @@ def compute_best_score(ns):
                                 score_attr=ns.best_score_attr)
     best_scorer(ns.graphs)    
     
+def save_score_columns(ns):
+    # only the scores added by the experiment are saved, as the graphs are
+    # shared by all experiments on the same data (see load_scored_graphs)
+    ns.scores_sidecar_fname = ns.fname_prefix + "_scores.npz"
+    save_scores(ns.graphs, [ns.score_attr, ns.best_score_attr],
+                ns.scores_sidecar_fname)
+    
 def save_scored_graphs(ns):
     ns.scored_graphs_fname = ns.fname_prefix + "_graphs.pkl"
-    log.info("saving scored graphs to " + ns.scored_graphs_fname)
-    cPickle.dump(ns.graphs, 
-                 open(ns.scored_graphs_fname, "w"))        
+    save_graphs(ns.graphs, ns.scored_graphs_fname)
         
         
 #-------------------------------------------------------------------------------
@@ -2,13 +2,17 @@
 preprocessing of experimental data
 """
 
-import logging 
+import logging
 log = logging.getLogger(__name__)
 
 import cPickle
+import itertools
 import os
+import tempfile
+from collections import OrderedDict
 
 from tg.config import config
+from tg.corpus import save_graphs
 from tg.annot import get_annotator
 from tg.transdict import TransDict
 from tg.lookup import Lookup
@@ -17,40 +21,190 @@ from tg.upperscore import DictUpperScorer, ModelUpperScorer
 from tg.classcore import filter_functions
 
 
-def preprocess(data_set, lang_pair):
+def preprocess(data_set, lang_pair, workers=1, cache=None):
+    """
+    annotate the source of a data set for a single language pair, and
+    lookup and score its translations (see preprocess_data_set)
+    """
+    all_stats = preprocess_data_set(data_set, [lang_pair], workers, cache)
+    return all_stats[lang_pair]
+
+
+def preprocess_data_set(data_set, lang_pairs=None, workers=1, cache=None):
+    """
+    Preprocess a data set for several language pairs
+
+    Language pairs with the same source file (e.g. gr-de and gr-en) share
+    its annotation, so the source is tagged only once. The tagged graphs
+    are spooled to a temporary file and read back for each target
+    language, so the graphs of one language pair at a time are in memory,
+    rather than those of all language pairs with the same source. The
+    graphs of a language pair are held as a whole, because the scorers and
+    saving to a pickle require a list of graphs.
+
+    Parameters
+    ----------
+    data_set: str
+        name of data set in config["eval"]
+    lang_pairs: list of str
+        language pairs, by default all language pairs of the data set
+    workers: int
+        number of batches to annotate in parallel
+    cache: str or AnnotationCache
+        cache of annotated sentences
+
+    Returns
+    -------
+    stats: dict
+        mapping of language pair to annotation statistics, which are shared
+        by language pairs with the same source
+    """
+    all_stats = {}
+
+    for source_lang, src_fname, pairs in _group_lang_pairs(data_set,
+                                                           lang_pairs):
+        annotator = get_annotator(source_lang, cache=cache)
+        graphs = annotator.iter_xml_file(src_fname, workers=workers)
+        spool = None
+
+        if len(pairs) > 1:
+            log.info("sharing annotation of {} among {}".format(
+                src_fname, ", ".join(pairs)))
+            spool = _GraphSpool(graphs)
+
+        for lang_pair in pairs:
+            _process_lang_pair(data_set, lang_pair, spool or graphs)
+
+        if spool:
+            spool.close()
+
+        annotator.stats.log("annotation statistics for {} {}".format(
+            data_set, ", ".join(pairs)))
+        all_stats.update((lang_pair, annotator.stats) for lang_pair in pairs)
+
+    return all_stats
+
+
+def _group_lang_pairs(data_set, lang_pairs=None):
+    """
+    return list of (source language, source file name, language pairs)
+    tuples, grouping the language pairs of a data set with the same source
+    """
+    groups = OrderedDict()
+
+    if lang_pairs is None:
+        lang_pairs = config["eval"][data_set].keys()
+
+    for lang_pair in lang_pairs:
+        source_lang = lang_pair.split("-")[0]
+        src_fname = config["eval"][data_set][lang_pair]["src_fname"]
+        key = source_lang, os.path.realpath(src_fname)
+        groups.setdefault(key, (source_lang, src_fname, []))[2].append(
+            lang_pair)
+
+    return groups.values()
+
+
+def _process_lang_pair(data_set, lang_pair, graphs):
     source_lang, target_lang = lang_pair.split("-")
     graphs_fname = config["eval"][data_set][lang_pair]["graphs_fname"]
     out_dir = os.path.dirname(graphs_fname)
     if not os.path.exists(out_dir):
         os.mkdir(out_dir)
-        
-    # annotate
-    annotator = get_annotator(source_lang)
-    graph_list = annotator.annot_xml_file(
-        config["eval"][data_set][lang_pair]["src_fname"])
-    
-    # lookup translations
-    dict_fname = TransDict.load(config["dict"][lang_pair]["pkl_fname"])
-    lookup = Lookup(dict_fname)
+
+    graph_list = list(graphs)
+
+    # lookup translations, in the memory-mapped compiled dictionary if it
+    # exists, or else in the pickled dictionary
+    trans_dict = TransDict.load(_dict_fname(lang_pair))
+    lookup = Lookup(trans_dict)
     lookup(graph_list)
-    
+
     # score most frequent translation
     freq_score = FreqScorer(config["count"]["lemma"][target_lang]["pkl_fname"])
     freq_score(graph_list)
-    
-    # dict upper scores  
+
+    # dict upper scores
     lemma_ref_fname = \
         config["eval"][data_set][lang_pair]["lemma_ref_fname"]
     scorer = DictUpperScorer(lemma_ref_fname)
     scorer(graph_list)
-    
-    # model upper scores  
-    ambig_fname = config["sample"][lang_pair]["ambig_fname"]  
+
+    # model upper scores
+    ambig_fname = config["sample"][lang_pair]["ambig_fname"]
     filter = filter_functions(source_lang)
     scorer = ModelUpperScorer(lemma_ref_fname, ambig_fname, filter)
     scorer(graph_list)
-    
+
     # save graphs
-    log.info("saving preprocessed graphs to " + graphs_fname)
-    cPickle.dump(graph_list, open(graphs_fname, "wb"))
-    
\ No newline at end of file
+    save_graphs(graph_list, graphs_fname)
+
+
+def _dict_fname(lang_pair):
+    """
+    return file name of compiled dictionary for language pair if it exists,
+    or else that of pickled dictionary
+    """
+    compiled_fname = config["dict"][lang_pair].get("compiled_fname")
+    
+    if compiled_fname and os.path.exists(compiled_fname):
+        return compiled_fname
+    
+    log.info("no compiled dictionary for {}, using pickled dictionary "
+             "(see env/setup_local_data.py create_compiled_dicts)".format(
+                 lang_pair))
+    return config["dict"][lang_pair]["pkl_fname"]
+
+
+class _GraphSpool(object):
+    """
+    Temporary file holding annotated graphs, which can be iterated over
+    more than once
+
+    Graphs are pickled in batches while they are read from the graphs
+    iterable, before they are yielded. The first pass therefore yields the
+    original graphs, and later passes yield copies of the graphs as they
+    were before any changes made during earlier passes. The spool itself
+    holds a single batch in memory; how many graphs are in memory in total
+    depends on what is done with them.
+    """
+
+    def __init__(self, graphs, batch_size=1000):
+        self.graphs = iter(graphs)
+        self.batch_size = batch_size
+        self.file = tempfile.TemporaryFile()
+        # file offsets of pickled batches
+        self.offsets = []
+        self.done = False
+
+    def __iter__(self):
+        # fill the spool on the first pass, as far as it is consumed
+        i = 0
+
+        while True:
+            if i < len(self.offsets):
+                batch = self._load(i)
+            elif not self.done:
+                batch = list(itertools.islice(self.graphs, self.batch_size))
+                if not batch:
+                    self.done = True
+                    return
+                self._dump(batch)
+            else:
+                return
+
+            for graph in batch:
+                yield graph
+            i += 1
+
+    def close(self):
+        self.file.close()
+
+    def _dump(self, batch):
+        self.file.seek(0, os.SEEK_END)
+        self.offsets.append(self.file.tell())
+        cPickle.dump(batch, self.file, cPickle.HIGHEST_PROTOCOL)
+
+    def _load(self, i):
+        self.file.seek(self.offsets[i])
+        return cPickle.load(self.file)
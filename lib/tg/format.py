@@ -30,7 +30,7 @@ class Format(GraphProcess):
         # TODO: handle hypernodes
         for u in graph.source_nodes_iter(ordered=True):
             v = graph.max_score(u, self.score_attr)[1]
-            if v:
+            if v is not None:
                 lemma = graph.lemma(v)
             else:
                 # no translation edges
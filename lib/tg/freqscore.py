@@ -5,6 +5,9 @@ translation scores based on frequency
 import logging 
 import cPickle
 
+import numpy as np
+
+from tg import symbols
 from tg.scorer import Scorer
 
 
@@ -36,6 +39,9 @@ class FreqScorer(Scorer):
     def __call__(self, obj, *args, **kwargs):      
         log.info("reading counts from " + self.counts_pkl_fname)
         self.counts_dict = cPickle.load(open(self.counts_pkl_fname))  
+        # counts indexed by lemma id, where NaN means no count
+        self.counts = symbols.lemmas.lookup_array(self.counts_dict, 
+                                                  default=np.nan, dtype="f8")
         Scorer.__call__(self, obj, *args, **kwargs)   
 
     def _score_translations(self, graph, u):
@@ -44,11 +50,13 @@ class FreqScorer(Scorer):
         
         for u, v, data in graph.trans_edges_iter(u):
             edge_data.append(data)
-            lemma = graph.lemma(v)
+            count = symbols.lookup(self.counts, graph.lemma_id(v), np.nan)
+            
             # if oov_count is not None, all translation edges will have a
             # freq_score attrib
-            count = self.counts_dict.get(lemma, self.oov_count)
-            log.debug(u"lemma '{}' has count {}".format(lemma, count))
+            if count != count:
+                count = self.oov_count
+                
             counts.append(count)
             
         return edge_data, counts
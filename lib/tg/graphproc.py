@@ -2,7 +2,6 @@
 graph process
 """
 
-import transgraph
 import logging
 
 log = logging.getLogger(__name__)
@@ -23,8 +22,10 @@ class GraphProcess(object):
         """
         log.info("applying graph process {}".format(self.__class__.__name__))
         
+        # any graph type providing translation edges (e.g. TransGraph or
+        # CompactTransGraph) counts as a single object
         if ( isinstance(obj, basestring) or 
-             isinstance(obj, transgraph.TransGraph)):
+             hasattr(obj, "trans_edges_iter") ):
             return self._single_run(obj, *args, **kwargs)
         else:
             return self._batch_run(obj, *args, **kwargs)
@@ -22,18 +22,22 @@ class InterpolatedScore(GraphProcess):
 
     def _single_run(self, graph, copy = False, *args, **kwargs):
         """
-        @param copy: Score and return a deep copy of the passed graph instance.
+        @param copy: Score and return a copy-on-write view of the passed graph
+            instance, leaving the graph itself untouched.
         """
 
         if copy:
-            graph = graph.copy()
-
-        for _, _, meta in graph.trans_edges_iter():
-            try:
-                scores = [meta[attr] for attr in self.score_attrs]
-                meta[self.score_attr] = np.dot(self.weights, np.array(scores))
-            except KeyError:
-                continue
+            graph = graph.view()
+
+        # NaN for missing scores propagates, so edges lacking any of the
+        # scores are left untouched; without score attributes, all edges get
+        # a zero score
+        scores = np.zeros(len(graph.trans_edge_arrays(data=False)[0]))
+
+        for weight, attr in zip(self.weights, self.score_attrs):
+            scores = scores + weight * graph.score_column(attr)
+
+        graph.set_score_column(self.score_attr, scores)
 
         return graph
 
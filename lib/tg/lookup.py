@@ -2,7 +2,9 @@
 lookup of translation candidates in dictionary
 """
 
+import collections
 import logging
+import time
 
 import graphproc
 
@@ -14,11 +16,17 @@ class Lookup(graphproc.GraphProcess):
     """
     determine translation candidates by lexical lookup in dictionary and add
     them to the translation graph
+    
+    When applied to a list of graphs, the distinct lempos n-grams of all
+    graphs are looked up only once (unless dedup is False), and statistics
+    on hits and time saved are logged and kept in the stats attribute.
     """ 
 
-    def __init__(self, dictionary, max_n_gram_size=5):
+    def __init__(self, dictionary, max_n_gram_size=5, dedup=True):
         self.dictionary = dictionary
         self.max_n_gram_size = max_n_gram_size
+        self.dedup = dedup
+        self.stats = None
         
     def _single_run(self, graph):
         log.debug("applying {0} to graph {1}".format(
@@ -26,7 +34,62 @@ class Lookup(graphproc.GraphProcess):
             graph.graph["id"]))
         
         source_nodes, tagger_lempos_list = self._collect(graph)
+        self._add_all_translations(graph, source_nodes, tagger_lempos_list,
+                                   self._lookup_lempos_seq)
         
+    def _batch_run(self, graphs):
+        if not self.dedup:
+            return graphproc.GraphProcess._batch_run(self, graphs)
+        
+        timer = time.time
+        start = timer()
+        collected = []
+        n_grams = collections.Counter()
+        
+        # collect distinct lempos n-grams over all graphs
+        for graph in graphs:
+            source_nodes, tagger_lempos_list = self._collect(graph)
+            collected.append((graph, source_nodes, tagger_lempos_list))
+            n_grams.update(self._n_grams(tagger_lempos_list))
+            
+        t = timer()
+        
+        # resolve each of them once
+        table = dict( (n_gram, self._lookup_lempos_seq(list(n_gram)))
+                      for n_gram in n_grams )
+        resolve_seconds = timer() - t
+        
+        for graph, source_nodes, tagger_lempos_list in collected:
+            log.debug("applying {0} to graph {1}".format(
+                self.__class__.__name__,
+                graph.graph["id"]))
+            self._add_all_translations(
+                graph, source_nodes, tagger_lempos_list, 
+                lambda lempos_seq: table[tuple(lempos_seq)])
+            
+        self.stats = LookupStats(
+            graphs=len(collected),
+            n_grams=sum(n_grams.itervalues()),
+            distinct_n_grams=len(n_grams),
+            hits=sum(count for n_gram, count in n_grams.iteritems()
+                     if table[n_gram]),
+            distinct_hits=sum(1 for entries in table.itervalues() 
+                              if entries),
+            resolve_seconds=resolve_seconds,
+            total_seconds=timer() - start)
+        self.stats.log()
+        return [None] * len(collected)
+    
+    def _n_grams(self, tagger_lempos_list):
+        # lempos n-grams in the same order as in _add_all_translations
+        n = len(tagger_lempos_list)
+        
+        for i in range(n):
+            for j in range(i + 1, min(n, i + 1 + self.max_n_gram_size)):
+                yield tuple(tagger_lempos_list[i:j])
+                
+    def _add_all_translations(self, graph, source_nodes, tagger_lempos_list,
+                              lookup):
         for i in range(len(source_nodes)):
             has_translation = False
             
@@ -35,7 +98,7 @@ class Lookup(graphproc.GraphProcess):
             for j in range(i + 1, min(len(source_nodes), 
                                       i + 1 + self.max_n_gram_size)):
                 lempos_subseq = tagger_lempos_list[i:j]
-                entries = self._lookup_lempos_seq(lempos_subseq)
+                entries = lookup(lempos_subseq)
                 
                 if entries:
                     has_translation = True
@@ -131,4 +194,55 @@ class Lookup(graphproc.GraphProcess):
     def _add_single_target_node(self, lempos, graph):
         lemma, pos = lempos.rsplit(self.dictionary.delimiter, 1)
         return graph.add_target_node(lemma=lemma, pos=pos) 
-        
\ No newline at end of file
+        
+
+
+
+class LookupStats(object):
+    """
+    statistics of a deduplicated lookup pass over a list of graphs
+    
+    Time saved is estimated as the average time to resolve a distinct
+    n-gram times the number of repeated n-grams, which would have been
+    looked up again without deduplication.
+    """
+    
+    def __init__(self, graphs, n_grams, distinct_n_grams, hits, 
+                 distinct_hits, resolve_seconds, total_seconds):
+        self.graphs = graphs
+        self.n_grams = n_grams
+        self.distinct_n_grams = distinct_n_grams
+        self.hits = hits
+        self.distinct_hits = distinct_hits
+        self.resolve_seconds = resolve_seconds
+        self.total_seconds = total_seconds
+        
+    @property
+    def hit_rate(self):
+        return self.hits / float(self.n_grams or 1)
+    
+    @property
+    def distinct_hit_rate(self):
+        return self.distinct_hits / float(self.distinct_n_grams or 1)
+    
+    @property
+    def saved_seconds(self):
+        repeated = self.n_grams - self.distinct_n_grams
+        return ( self.resolve_seconds / (self.distinct_n_grams or 1) * 
+                 repeated )
+    
+    def report(self):
+        return "\n".join([
+            "graphs: {}".format(self.graphs),
+            "lempos n-grams: {}".format(self.n_grams),
+            "distinct lempos n-grams: {} ({:.1%})".format(
+                self.distinct_n_grams, 
+                self.distinct_n_grams / float(self.n_grams or 1)),
+            "hit rate: {:.1%}".format(self.hit_rate),
+            "distinct hit rate: {:.1%}".format(self.distinct_hit_rate),
+            "lookup time: {:.3f}s".format(self.resolve_seconds),
+            "total time: {:.3f}s".format(self.total_seconds),
+            "estimated time saved: {:.3f}s".format(self.saved_seconds) ])
+    
+    def log(self, title="lookup statistics"):
+        log.info(title + ":\n" + self.report())
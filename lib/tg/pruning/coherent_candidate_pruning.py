@@ -27,11 +27,11 @@ class CoherentCandidatePruner(GraphProcess):
 
     def _single_run(self, graph, copy = False, *args, **kwargs):
         """
-        @param copy: If set to True a deep copy of the passed graph instance
-            will be pruned and returned.
+        @param copy: If set to True a copy-on-write view of the passed graph
+            instance will be pruned and returned.
         """
         if copy:
-            graph = graph.copy()
+            graph = graph.view()
 
         cutoff = self._get_cutoff(graph)
 
@@ -104,7 +104,7 @@ class CoherentCandidatePruner(GraphProcess):
         total_score = float(sum([score for _, score in scores]))
 
         for tn, score in scores:
-            graph.edge[source_node][tn]['centroid_score'] = score / total_score
+            graph.set_score(source_node, tn, 'centroid_score', score / total_score)
 
     @staticmethod
     def _prune_source_node(graph, source_node):
@@ -112,7 +112,7 @@ class CoherentCandidatePruner(GraphProcess):
             key = itemgetter(1))
         target_node = sorted_scores[0][0]
 
-        graph.edge[source_node][target_node]['centroid_score'] = 0.0
+        graph.set_score(source_node, target_node, 'centroid_score', 0.0)
         CoherentCandidatePruner._reweight_scores(graph, source_node)
 
     @staticmethod
@@ -18,7 +18,7 @@ class Scorer(GraphProcess):
         # edges, because scores need to be normalized per source node.
         for u in graph.source_nodes_iter():
             self._add_normalized_scores(
-                *self._score_translations(graph, u))
+                graph, *self._score_translations(graph, u))
             
     def _score_translations(self, graph, u):
         """
@@ -43,12 +43,14 @@ class Scorer(GraphProcess):
         """
         return [], []
     
-    def _add_normalized_scores(self, edge_data, scores):
+    def _add_normalized_scores(self, graph, edge_data, scores):
         """
         Add normalized scores to translation edges 
         
         Parameters
         ----------
+        graph: TransGraph
+            translation graph
         edge_data: dict
             data dict for edges
         scores: iterable
@@ -56,10 +58,14 @@ class Scorer(GraphProcess):
         """
         # scores can contain None
         total = float(sum(s for s in scores if s is not None))
+        normalized = []
         
-        for data, score in zip(edge_data, scores):
+        for score in scores:
             if score is not None:
                 try:
-                    data[self.score_attr] = score / total
+                    score = score / total
                 except ZeroDivisionError:
-                    data[self.score_attr] = 0.0
+                    score = 0.0
+            normalized.append(score)
+                    
+        graph.set_scores(self.score_attr, edge_data, normalized)
@@ -0,0 +1,157 @@
+"""
+interned symbol tables for lemmas, POS tags and lempos strings
+"""
+
+import logging
+import threading
+
+import numpy as np
+
+
+log = logging.getLogger(__name__)
+
+
+
+class SymbolTable(object):
+    """
+    Table assigning integer ids to strings
+
+    Ids are assigned in order of interning, starting from zero, and are
+    never reused. Interning also returns a canonical string object, so that
+    equal strings from different sources (graphs, dictionaries, counts)
+    share memory.
+
+    Notes
+    -----
+    Ids are only valid within the current process. Pickled objects should
+    therefore hold strings rather than ids. Interning is thread-safe.
+    """
+
+    def __init__(self, strings=()):
+        self._ids = {}
+        self._strings = []
+        self._lock = threading.Lock()
+
+        for s in strings:
+            self.id(s)
+
+    def __len__(self):
+        return len(self._strings)
+
+    def __contains__(self, s):
+        return s in self._ids
+
+    def __iter__(self):
+        return iter(self._strings)
+
+    def id(self, s):
+        """
+        return id of string, interning it if required
+        """
+        try:
+            return self._ids[s]
+        except KeyError:
+            with self._lock:
+                # another thread may have interned s in the meantime
+                i = self._ids.get(s)
+                if i is None:
+                    self._strings.append(s)
+                    i = self._ids[s] = len(self._strings) - 1
+                return i
+
+    def get(self, s, default=-1):
+        """
+        return id of string, or default if string is not interned
+        """
+        return self._ids.get(s, default)
+
+    def string(self, i):
+        """
+        return string with given id
+        """
+        return self._strings[i]
+
+    def intern(self, s):
+        """
+        return canonical string object equal to s
+        """
+        return self._strings[self.id(s)]
+
+    def ids(self, strings):
+        """
+        return array with id of each string, interning them if required
+        """
+        return np.array([ self.id(s) for s in strings ], dtype="i4")
+
+    def lookup_array(self, mapping, default=-1, dtype="i4"):
+        """
+        return array a such that a[self.id(s)] == mapping[s] for all keys s
+        in mapping, and default for all other strings interned so far
+
+        Strings interned later have ids beyond the end of the array, so
+        callers should treat out of range ids as missing (see lookup).
+        """
+        keys = self.ids(mapping.keys())
+        a = np.empty(len(self), dtype=dtype)
+        a.fill(default)
+        a[keys] = mapping.values()
+        return a
+
+
+def lookup(a, i, default=-1):
+    """
+    return a[i] for an array created by SymbolTable.lookup_array, or default
+    if i is beyond its end
+    """
+    if i < len(a):
+        return a.item(i)
+    return default
+
+
+
+class LemposTable(SymbolTable):
+    """
+    Symbol table for lempos strings, composed from lemma and POS tag
+
+    Lemmas and POS tags are interned in their own tables. Lempos strings for
+    a lemma and POS tag are memoized, so they are built only once.
+
+    Parameters
+    ----------
+    lemmas: SymbolTable
+    pos_tags: SymbolTable
+    delimiter: str
+        delimiter between lemma and POS tag in lempos strings
+    """
+
+    def __init__(self, lemmas, pos_tags, delimiter=u"/"):
+        SymbolTable.__init__(self)
+        self.lemmas = lemmas
+        self.pos_tags = pos_tags
+        self.delimiter = delimiter
+        self._pairs = {}
+
+    def lempos_id(self, lemma, pos):
+        """
+        return id of lempos string for lemma and POS tag
+        """
+        try:
+            return self._pairs[lemma, pos]
+        except KeyError:
+            i = self._pairs[self.lemmas.intern(lemma),
+                            self.pos_tags.intern(pos)] = \
+                self.id(lemma + self.delimiter + pos)
+            return i
+
+    def lempos(self, lemma, pos):
+        """
+        return (canonical) lempos string for lemma and POS tag
+        """
+        return self._strings[self.lempos_id(lemma, pos)]
+
+
+
+# tables shared by all graphs, dictionaries and models in a process
+lemmas = SymbolTable()
+pos_tags = SymbolTable()
+lempos = LemposTable(lemmas, pos_tags)
@@ -0,0 +1,334 @@
+"""
+running external taggers, once or as pools of long-lived processes
+"""
+
+import atexit
+import logging
+import Queue
+import subprocess
+import threading
+
+from tg.exception import TGException
+
+
+log = logging.getLogger(__name__)
+
+
+
+class TaggerProcess(object):
+    """
+    Long-lived tagger process, fed through stdin and stdout
+
+    Each batch of input text is preceded by a begin marker and followed by
+    an end marker, so the output belonging to the batch can be found in the
+    continuous output stream of the tagger. As taggers (and the pipelines
+    of tokenizers in their wrapper scripts) buffer their input and output,
+    the end marker is followed by filler text which pushes it through. The
+    output of the filler is skipped before the next batch.
+
+    Parameters
+    ----------
+    command: str
+        shell command starting the tagger
+    encoding: str
+        character encoding of tagger input and output
+    begin_marker: unicode
+        line marking the begin of a batch, which the tagger must copy to
+        its output as the start of a line
+    end_marker: unicode
+        line marking the end of a batch, idem
+    flush_text: unicode
+        filler text sent after each batch
+    """
+
+    def __init__(self, command, encoding, begin_marker, end_marker,
+                 flush_text=u""):
+        self.command = command
+        self.encoding = encoding
+        self.begin_marker = begin_marker
+        self.end_marker = end_marker
+        self.flush_text = flush_text
+        self._proc = None
+
+    def start(self):
+        log.info("starting tagger process " + self.command)
+        self._proc = subprocess.Popen(self.command,
+                                      shell=True,
+                                      close_fds=True,
+                                      stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.PIPE)
+        # stderr must be drained to prevent the tagger from blocking
+        thread = threading.Thread(target=self._log_stderr,
+                                  args=(self._proc.stderr,))
+        thread.daemon = True
+        thread.start()
+
+    def close(self):
+        if self._proc:
+            log.info("stopping tagger process " + self.command)
+            try:
+                self._proc.stdin.close()
+                self._proc.wait()
+            except (IOError, OSError):
+                pass
+            self._proc = None
+
+    def kill(self):
+        """
+        stop the tagger process without waiting for its pending output
+        """
+        if self._proc:
+            try:
+                self._proc.kill()
+                self._proc.wait()
+            except OSError:
+                pass
+            self._proc = None
+
+    def restart(self):
+        self.kill()
+        self.start()
+
+    def tag(self, text):
+        """
+        tag text and return tagger output as unicode string
+        """
+        return u"".join(self.iter_tag(text))
+
+    def iter_tag(self, text, decode=True):
+        """
+        tag text, as unicode string or byte string in the tagger's encoding,
+        and yield lines of tagger output as unicode strings, or byte strings
+        if decode is false, as soon as they are read
+        """
+        if not self._proc:
+            self.start()
+
+        if isinstance(text, unicode):
+            text = text.encode(self.encoding, "backslashreplace")
+
+        data = "\n".join([self.begin_marker.encode(self.encoding), text,
+                          self.end_marker.encode(self.encoding),
+                          self.flush_text.encode(self.encoding), ""])
+        # input is written from another thread, because the tagger may
+        # block on writing output while input is written
+        errors = []
+        writer = threading.Thread(target=self._write,
+                                  args=(self._proc.stdin, data, errors))
+        writer.daemon = True
+        writer.start()
+        begin_marker = self.begin_marker.encode(self.encoding)
+        end_marker = self.end_marker.encode(self.encoding)
+        in_batch = False
+
+        for line in iter(self._proc.stdout.readline, ""):
+            if not in_batch:
+                # skip output of filler from previous batch
+                in_batch = line.startswith(begin_marker)
+            elif line.startswith(end_marker):
+                break
+            elif decode:
+                yield line.decode(self.encoding, "replace")
+            else:
+                yield line
+        else:
+            raise TGException("tagger process {!r} terminated".format(
+                self.command))
+
+        writer.join()
+
+        if errors:
+            raise TGException("writing to tagger process {!r} failed: "
+                              "{}".format(self.command, errors[0]))
+
+    @staticmethod
+    def _write(stream, data, errors, close=False):
+        try:
+            stream.write(data)
+            stream.flush()
+            if close:
+                stream.close()
+        except (IOError, OSError) as error:
+            errors.append(error)
+
+    @staticmethod
+    def _log_stderr(stream):
+        for line in iter(stream.readline, ""):
+            log.debug(u"tagger standard error: " +
+                      line.decode("utf-8", "replace").rstrip())
+
+
+
+class TaggerPool(object):
+    """
+    Pool of long-lived tagger processes
+
+    Processes are started when first needed and reused for all later
+    calls, so the startup cost of the tagger (e.g. loading its parameter
+    file) is paid only once per process. A process that fails is restarted
+    and the batch is retried once.
+
+    Parameters
+    ----------
+    size: int
+        maximum number of tagger processes, i.e. number of batches that can
+        be tagged concurrently by different threads
+    command, encoding, begin_marker, end_marker, flush_text:
+        See TaggerProcess
+    """
+
+    def __init__(self, size, command, encoding, begin_marker, end_marker,
+                 flush_text=u""):
+        self.size = size
+        self.command = command
+        self._idle = Queue.Queue()
+        self._all = []
+
+        for _ in range(size):
+            proc = TaggerProcess(command, encoding, begin_marker, end_marker,
+                                 flush_text)
+            self._idle.put(proc)
+            self._all.append(proc)
+
+    def tag(self, text):
+        """
+        tag text with the first idle tagger process and return tagger
+        output as unicode string
+        """
+        return u"".join(self.iter_tag(text))
+
+    def iter_tag(self, text, decode=True):
+        """
+        tag text, as unicode string or byte string in the tagger's encoding,
+        with the first idle tagger process and yield lines of tagger output
+        as unicode strings, or byte strings if decode is false, as soon as
+        they are read
+
+        The process is returned to the pool when the generator is exhausted
+        or closed. A batch is only retried if the process fails before
+        any output was yielded.
+        """
+        proc = self._idle.get()
+        started = False
+
+        try:
+            try:
+                for line in proc.iter_tag(text, decode):
+                    started = True
+                    yield line
+            except TGException as error:
+                if started:
+                    raise
+                log.warn("{}; restarting tagger process".format(error))
+                proc.restart()
+                for line in proc.iter_tag(text, decode):
+                    yield line
+        except:
+            # never return a process in an unknown state to the pool; it
+            # may block on writing output that nobody reads, so kill it
+            proc.kill()
+            raise
+        finally:
+            self._idle.put(proc)
+
+    def close(self):
+        """
+        stop all tagger processes
+        """
+        for proc in self._all:
+            proc.close()
+
+
+
+def run_tagger(command, data, encoding=None):
+    """
+    run tagger once and yield lines of its output as unicode strings, or
+    byte strings if no encoding is given, as soon as they are read
+
+    Parameters
+    ----------
+    command: str
+        shell command starting the tagger
+    data: str
+        input text encoded in the tagger's encoding
+    encoding: str or None
+        character encoding of tagger output
+    """
+    log.debug("calling tagger as " + command)
+    proc = subprocess.Popen(command,
+                            shell=True,
+                            close_fds=True,
+                            stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    # stderr must be drained and input written from other threads to
+    # prevent the tagger from blocking
+    thread = threading.Thread(target=TaggerProcess._log_stderr,
+                              args=(proc.stderr,))
+    thread.daemon = True
+    thread.start()
+    errors = []
+    writer = threading.Thread(target=TaggerProcess._write,
+                              args=(proc.stdin, data, errors, True))
+    writer.daemon = True
+    writer.start()
+
+    complete = False
+
+    try:
+        for line in iter(proc.stdout.readline, ""):
+            yield line.decode(encoding, "replace") if encoding else line
+        complete = True
+    finally:
+        if not complete and proc.poll() is None:
+            # output not consumed, so tagger may block forever
+            proc.kill()
+        writer.join()
+        proc.wait()
+
+    if proc.returncode:
+        raise TGException("tagger process {!r} failed with exit status "
+                          "{}".format(command, proc.returncode))
+
+    if errors:
+        raise TGException("writing to tagger process {!r} failed: "
+                          "{}".format(command, errors[0]))
+
+
+
+# pools shared by all annotators, keyed on size, command and encoding
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(size, command, encoding, begin_marker, end_marker,
+             flush_text=u""):
+    """
+    return shared pool of tagger processes of given size for command and
+    encoding, creating it when required (see TaggerPool for parameters)
+
+    Annotators asking for pools of different sizes get different pools, so
+    a pool is never closed while other annotators are using it.
+    """
+    key = size, command, encoding
+
+    with _pools_lock:
+        pool = _pools.get(key)
+
+        if pool is None:
+            pool = _pools[key] = TaggerPool(size, command, encoding,
+                                            begin_marker, end_marker,
+                                            flush_text)
+        return pool
+
+
+@atexit.register
+def close_pools():
+    """
+    stop processes of all shared pools
+    """
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
@@ -7,19 +7,37 @@ import collections
 import cPickle
 import itertools
 import logging
+import mmap
+import multiprocessing
+import os
 import sys
 from xml.etree import cElementTree as et
 
 import configobj
 import numpy as np
 
+from tg import symbols
 from tg.config import config
+from tg.exception import TGException
 from tg.utils import text_table
 
 
 log = logging.getLogger(__name__)
 
 
+# extension of compiled dictionary directories
+COMPILED_EXT = ".tdc"
+
+COMPILED_VERSION = 1
+
+META_FNAME = "meta.pkl"
+
+
+# marks a key without memoized lookup
+_NOT_MEMOIZED = object()
+
+
+
 class TransDict(object):
     """ 
     dictionary object that allows lookup of translation candidates on the
@@ -32,6 +50,12 @@ class TransDict(object):
     # replacement for delimiter if it occurs in original POS tag
     replacement = "|"
     
+    # maximum number of memoized lookups, after which the memo is cleared
+    memo_size = 100000
+    
+    # attributes derived from entries and POS map (see _init_index)
+    _derived_attrs = "_index", "_memo"
+    
     def __init__(self, pos_map=None):
         self._lempos_dict = {}   
         self._lemma_dict = {}
@@ -41,6 +65,19 @@ class TransDict(object):
             self.pos_map = configobj.ConfigObj(pos_map)
         else:
             self.pos_map = pos_map   
+            
+        self._init_index()
+        
+    def __getstate__(self):
+        # index and memo are rebuilt rather than pickled
+        state = self.__dict__.copy()
+        for attr in self._derived_attrs:
+            state.pop(attr, None)
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_index()
 
     def lookup_lempos(self, lempos):
         """
@@ -48,6 +85,11 @@ class TransDict(object):
         string and a tuple of possible translations
         """
         if self.pos_map:
+            # single words with a tagger POS tag are indexed
+            entry = self._index.get(lempos)
+            if entry:
+                return entry
+            
             lempos = self._map_pos(lempos)
             
         return lempos, self._lempos_dict[lempos]
@@ -65,18 +107,26 @@ class TransDict(object):
         lookup lemma or lempos, get matching lempos entries, and return an
         iterator over lookup for all items (see lookup_lempos)
         """
-        try:
-            return iter([self.lookup_lempos(key)])
-        except (KeyError, ValueError):
-            # lempos not found or lempos ill-formed,
-            # fall back to lemma only
-            return self.lookup_lemma(self._strip_pos(key))
+        entries = self._memo.get(key, _NOT_MEMOIZED)
+        
+        if entries is _NOT_MEMOIZED:
+            entries = self._memoize(key)
+            
+        if entries is None:
+            raise KeyError(key)
+        
+        return iter(entries)
         
     def get(self, key, default=None):
-        try:
-            return self.__getitem__(key)
-        except KeyError:
+        entries = self._memo.get(key, _NOT_MEMOIZED)
+        
+        if entries is _NOT_MEMOIZED:
+            entries = self._memoize(key)
+            
+        if entries is None:
             return default
+        
+        return iter(entries)
     
     def lempos_iteritems(self):
         return self._lempos_dict.iteritems()
@@ -90,11 +140,18 @@ class TransDict(object):
 
     @staticmethod
     def load(pkl_fname):
+        """
+        load dictionary from a pickle file or a compiled dictionary
+        directory (see dump_compiled)
+        """
+        if is_compiled(pkl_fname):
+            return load_compiled(pkl_fname)
+        
         log.info("loading translation dictionary from " + pkl_fname)
         return cPickle.load(open(pkl_fname))
 
     @classmethod
-    def from_xml(cls, dict_fname, reverse=False, pos_map=None):
+    def from_xml(cls, dict_fname, reverse=False, pos_map=None, workers=1):
         """
         create TransDict object from parsing a lexicon in Presemt XML format
         
@@ -103,74 +160,178 @@ class TransDict(object):
         Optional argument pos_map must be a configobj or other dict-like
         object (or a config filename) defining a mapping from POS tags used
         by the tagger to POS tags used in the lexicon.
+        
+        With workers > 1, the lexicon is split into ranges of entries,
+        which are parsed in parallel by worker processes.
         """
-        log.info("reading translation dictionary from " + dict_fname)
-        
-        # temporary dict mapping lempos to set of translations 
-        lempos_dict = collections.defaultdict(set)
-        # temporary dict mapping lemma to set of source lempos
-        lemma_dict = collections.defaultdict(set)        
-        
-        # XML parsing is somewhat fuzzy, because lexicon is likely to contain
-        # format errors
-        for event, elem in et.iterparse(dict_fname, events=("start", "end")):
-            if event == "start":
-                if  elem.tag == "entry":
-                    sl_lem = tl_lem = ""
-                    sl_lempos = tl_lempos = ""
-                    format_error = False
-            # event == "end" for all cases below
-            elif elem.tag == "slLemma":
-                if cls._is_valid(elem):
-                    sl_lem += elem.text.strip() + " "
-                    sl_lempos += cls._lempos(elem) + " "
-                else:
-                    format_error = True
-            elif elem.tag == "tlLemma":
-                if cls._is_valid(elem):
-                    tl_lem += elem.text.strip() + " "
-                    tl_lempos += cls._lempos(elem) + " "
-                else:
-                    format_error = True
-            elif elem.tag == "entry":
-                if format_error:
-                    # some format error, e.g. slLemma has no text
-                    log.error("skiping ill-formed lexicon entry "
-                              "with id {0}".format(elem.get("id")))
-                    continue
-
-                # ElementTree returns text as type string,
-                # unless it contains non-ascii chars.
-                # For uniformity, convert all text to unicode.
-                sl_lem = unicode(sl_lem.rstrip())
-                tl_lem = unicode(tl_lem.rstrip())
-                sl_lempos = unicode(sl_lempos.rstrip())
-                tl_lempos = unicode(tl_lempos.rstrip())
-
+        return cls._from_entries(iter_lexicon_entries(dict_fname, workers),
+                                 [(reverse, pos_map)])[0]
+    
+    @classmethod
+    def from_xml_pair(cls, dict_fname, pos_map=None, reverse_pos_map=None,
+                      workers=1):
+        """
+        create TransDict objects for both directions of a lexicon in 
+        Presemt XML format from a single parse (see from_xml)
+        
+        Returns
+        -------
+        trans_dict, reverse_trans_dict: TransDict objects
+            dictionaries for the lexicon's direction, with POS mapping 
+            pos_map, and the reverse direction, with POS mapping 
+            reverse_pos_map
+        """
+        return cls._from_entries(iter_lexicon_entries(dict_fname, workers),
+                                 [(False, pos_map), (True, reverse_pos_map)])
+    
+    @classmethod
+    def _from_entries(cls, entries, directions):
+        """
+        create a TransDict object per (reverse, pos_map) pair in directions
+        from lexicon entries
+        """
+        # temporary dicts per direction, mapping lempos to set of
+        # translations and lemma to set of source lempos
+        temp_dicts = [ (collections.defaultdict(set),
+                        collections.defaultdict(set))
+                       for _ in directions ]
+        # interned strings are shared between keys and values, as well as
+        # with graphs, and are pickled only once
+        intern = symbols.lempos.intern
+        
+        for sl_lem, sl_lempos, tl_lem, tl_lempos in entries:
+            sl_lempos = intern(sl_lempos)
+            tl_lempos = intern(tl_lempos)
+            
+            for (reverse, _), (lempos_dict, lemma_dict) in zip(directions,
+                                                               temp_dicts):
                 if not reverse:
                     lempos_dict[sl_lempos].add(tl_lempos)
                     lemma_dict[sl_lem].add(sl_lempos)
                 else:
                     lempos_dict[tl_lempos].add(sl_lempos)
                     lemma_dict[tl_lem].add(tl_lempos)
-                
-        trans_dict = cls(pos_map=pos_map)                
-        # convert default dicts to normal dicts and
-        # convert values from sets to tuples to decrease storage space
-        trans_dict._lempos_dict = dict( (lempos, tuple(translations))
-                                        for lempos, translations in lempos_dict.iteritems() )
-        trans_dict._lemma_dict = dict( (lemma, tuple(lempos_keys))
-                                        for lemma, lempos_keys in lemma_dict.iteritems() )
+                    
+        trans_dicts = []
         
-        return trans_dict
+        for (_, pos_map), (lempos_dict, lemma_dict) in zip(directions, 
+                                                           temp_dicts):
+            trans_dict = cls(pos_map=pos_map)                
+            # convert default dicts to normal dicts and
+            # convert values from sets to tuples to decrease storage space
+            trans_dict._lempos_dict = dict( 
+                (lempos, tuple(translations))
+                for lempos, translations in lempos_dict.iteritems() )
+            trans_dict._lemma_dict = dict( 
+                (symbols.lemmas.intern(lemma), tuple(lempos_keys))
+                for lemma, lempos_keys in lemma_dict.iteritems() )
+            trans_dict._init_index()
+            trans_dicts.append(trans_dict)
+            
+        return trans_dicts
     
     def dump(self, pkl_fname):
         log.info("dumping translation dictionary to " + pkl_fname)
         with open(pkl_fname, "wb") as inf:
             cPickle.dump(self, inf)
             
+    def dump_compiled(self, path):
+        """
+        write dictionary to a compiled dictionary directory
+        
+        A compiled dictionary is read-only. Its lempos and lemma entries are
+        kept in sorted tables of UTF-8 encoded keys, with offsets into a
+        packed table of values, which are memory-mapped rather than read
+        (see load_compiled).
+        """
+        log.info("writing compiled translation dictionary to " + path)
+        
+        if not os.path.exists(path):
+            os.makedirs(path)
+            
+        string_ids = {}
+        strings = []
+        
+        for name, d in ("lempos", self._lempos_dict), ("lemma", 
+                                                       self._lemma_dict):
+            _write_compiled_map(path, name, d, string_ids, strings)
+            
+        encoded = [ s.encode("utf-8") for s in strings ]
+        string_ptr = np.zeros(len(encoded) + 1, dtype="i8")
+        np.cumsum([ len(s) for s in encoded ], out=string_ptr[1:])
+        np.save(os.path.join(path, "strings.npy"), 
+                np.frombuffer("".join(encoded), dtype="u1"))
+        np.save(os.path.join(path, "string_ptr.npy"), string_ptr)
+        
+        # class is pickled by reference, so subclasses keep their own way
+        # of mapping POS tags
+        meta = dict(version=COMPILED_VERSION,
+                    cls=self.__class__,
+                    pos_map=self.pos_map)
+        cPickle.dump(meta, open(os.path.join(path, META_FNAME), "wb"),
+                     cPickle.HIGHEST_PROTOCOL)
+            
     # support methods
     
+    def _init_index(self):
+        """
+        Index lookups of lempos with tagger POS tags and start with an
+        empty memo of lookups
+        
+        Must be called again after changing the entries or the POS map.
+        """
+        self._memo = {}
+        self._index = {}
+        
+        # entries of a compiled dictionary are not read in advance
+        if self.pos_map and isinstance(self._lempos_dict, dict):
+            self._index = self._build_index()
+            
+    def _build_index(self):
+        """
+        return dict mapping lempos of single words with a tagger POS tag to
+        entries, for every tagger POS tag that the POS map maps to the
+        entry's lexicon POS tag
+        """
+        index = {}
+        tagger_tags = collections.defaultdict(list)
+        
+        for tagger_pos, lex_pos in self.pos_map.items():
+            tagger_tags[lex_pos].append(tagger_pos)
+            
+        for lempos, translations in self._lempos_dict.iteritems():
+            if " " in lempos:
+                continue
+            
+            lemma, lex_pos = lempos.rsplit(self.delimiter, 1)
+            
+            for tagger_pos in tagger_tags.get(lex_pos, ()):
+                index[lemma + self.delimiter + tagger_pos] = ( 
+                    lempos, translations)
+                
+        return index
+                
+    def _memoize(self, key):
+        """
+        lookup key as in __getitem__ and memoize the list of entries found,
+        or None if there are none
+        """
+        try:
+            entries = [self.lookup_lempos(key)]
+        except (KeyError, ValueError):
+            # lempos not found or lempos ill-formed,
+            # fall back to lemma only
+            try:
+                entries = list(self.lookup_lemma(self._strip_pos(key)))
+            except KeyError:
+                entries = None
+                
+        if len(self._memo) >= self.memo_size:
+            self._memo.clear()
+            
+        self._memo[key] = entries
+        return entries
+    
     @classmethod    
     def _lempos(cls, elem):
         """
@@ -221,6 +382,213 @@ class TransDict(object):
     
 
 
+class _CompiledMap(object):
+    """
+    Read-only mapping of unicode keys to tuples of unicode values, backed
+    by memory-mapped tables of a compiled dictionary
+    
+    Keys are found by binary search in the sorted key table, comparing
+    UTF-8 encoded strings, which sort in the same order as unicode strings.
+    """
+    
+    def __init__(self, path, name, strings):
+        self._keys = _MappedBytes(os.path.join(path, name + "_keys.npy"))
+        self._key_ptr = np.load(os.path.join(path, name + "_key_ptr.npy"),
+                                mmap_mode="r")
+        self._value_ptr = np.load(os.path.join(path, name + 
+                                               "_value_ptr.npy"),
+                                  mmap_mode="r")
+        self._values = np.load(os.path.join(path, name + "_values.npy"),
+                               mmap_mode="r")
+        self._strings = strings
+        
+    def __len__(self):
+        return len(self._key_ptr) - 1
+    
+    def __getitem__(self, key):
+        i = self._index(key)
+        
+        if i is None:
+            raise KeyError(key)
+        
+        return self._value(i)
+    
+    def __contains__(self, key):
+        return self._index(key) is not None
+    
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+        
+    def iterkeys(self):
+        for i in xrange(len(self)):
+            yield self._key(i).decode("utf-8")
+            
+    __iter__ = iterkeys
+            
+    def itervalues(self):
+        for i in xrange(len(self)):
+            yield self._value(i)
+        
+    def iteritems(self):
+        for i in xrange(len(self)):
+            yield self._key(i).decode("utf-8"), self._value(i)
+            
+    def keys(self):
+        return list(self.iterkeys())
+    
+    def values(self):
+        return list(self.itervalues())
+    
+    def items(self):
+        return list(self.iteritems())
+            
+    def _key(self, i):
+        return self._keys[self._key_ptr.item(i):self._key_ptr.item(i + 1)]
+    
+    def _value(self, i):
+        ids = self._values[self._value_ptr.item(i):self._value_ptr.item(i + 1)]
+        return tuple( self._strings[j] for j in ids.tolist() )
+    
+    def _index(self, key):
+        if isinstance(key, unicode):
+            key = key.encode("utf-8")
+            
+        lo, hi = 0, len(self)
+        
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_key = self._key(mid)
+            
+            if mid_key < key:
+                lo = mid + 1
+            elif mid_key > key:
+                hi = mid
+            else:
+                return mid
+            
+        return None
+
+            
+            
+class _MappedBytes(object):
+    """
+    Memory-mapped byte array from a numpy file, where slicing returns a
+    string, which is cheaper than slicing a numpy memmap
+    """
+    
+    def __init__(self, fname):
+        with open(fname, "rb") as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                np.lib.format.read_array_header_1_0(f)
+            else:
+                np.lib.format.read_array_header_2_0(f)
+            self._offset = f.tell()
+            self._size = os.fstat(f.fileno()).st_size
+            # an empty file cannot be mapped
+            if self._size > self._offset:
+                self._mmap = mmap.mmap(f.fileno(), 0, 
+                                       access=mmap.ACCESS_READ)
+            else:
+                self._mmap = ""
+            
+    def __len__(self):
+        return self._size - self._offset
+    
+    def __getslice__(self, start, end):
+        return self._mmap[self._offset + start:self._offset + end]
+    
+    
+    
+class _StringTable(object):
+    """
+    table of unicode strings, decoded from memory-mapped UTF-8 strings when
+    first accessed
+    """
+    
+    def __init__(self, path):
+        self._bytes = _MappedBytes(os.path.join(path, "strings.npy"))
+        self._ptr = np.load(os.path.join(path, "string_ptr.npy"), 
+                            mmap_mode="r")
+        self._cache = {}
+        
+    def __getitem__(self, i):
+        try:
+            return self._cache[i]
+        except KeyError:
+            s = self._bytes[self._ptr.item(i):self._ptr.item(i + 1)]
+            s = self._cache[i] = symbols.lempos.intern(s.decode("utf-8"))
+            return s
+        
+        
+        
+def is_compiled(fname):
+    """
+    test if file name refers to a compiled dictionary rather than a pickle
+    file
+    """
+    return ( fname.endswith(COMPILED_EXT) or
+             os.path.exists(os.path.join(fname, META_FNAME)) )
+
+
+def load_compiled(path):
+    """
+    Open a compiled dictionary (see TransDict.dump_compiled)
+    
+    Its tables are memory-mapped, so opening is near-instant and pages of
+    the tables are shared by all processes using the same dictionary.
+    Entries are decoded only when looked up.
+    """
+    log.info("opening compiled translation dictionary " + path)
+    meta = cPickle.load(open(os.path.join(path, META_FNAME), "rb"))
+    
+    if meta["version"] != COMPILED_VERSION:
+        raise TGException("unsupported compiled dictionary format version "
+                          "{} in {}".format(meta["version"], path))
+    
+    trans_dict = meta["cls"](pos_map=meta["pos_map"])
+    strings = _StringTable(path)
+    trans_dict._lempos_dict = _CompiledMap(path, "lempos", strings)
+    trans_dict._lemma_dict = _CompiledMap(path, "lemma", strings)
+    trans_dict._init_index()
+    return trans_dict
+    
+    
+def _write_compiled_map(path, name, d, string_ids, strings):
+    """
+    write sorted key table and value table of dict d, adding values to the
+    shared string table
+    """
+    items = sorted( (key.encode("utf-8"), values) 
+                    for key, values in d.iteritems() )
+    key_ptr = np.zeros(len(items) + 1, dtype="i8")
+    np.cumsum([ len(key) for key, _ in items ], out=key_ptr[1:])
+    value_ptr = np.zeros(len(items) + 1, dtype="i8")
+    np.cumsum([ len(values) for _, values in items ], out=value_ptr[1:])
+    value_ids = []
+    
+    for _, values in items:
+        for value in values:
+            try:
+                value_ids.append(string_ids[value])
+            except KeyError:
+                value_ids.append(string_ids.setdefault(value, len(strings)))
+                strings.append(unicode(value))
+                
+    arrays = [ (name + "_keys", 
+                np.frombuffer("".join(key for key, _ in items), dtype="u1")),
+               (name + "_key_ptr", key_ptr),
+               (name + "_value_ptr", value_ptr),
+               (name + "_values", np.array(value_ids, dtype="i4")) ]
+    
+    for array_name, a in arrays:
+        np.save(os.path.join(path, array_name + ".npy"), a)
+    
+    
+    
 class TransDictGreek(TransDict):
     """
     A hack that permits partial matching of Greek POS tags.
@@ -240,12 +608,36 @@ class TransDictGreek(TransDict):
     (with tag "nopr" in the lexicon). So simply splitting off the initial two
     chars won't do. 
     
-    Instead we match the tagger's tag against each of the tags in the POS map
-    and check if the first part matches. For example, a tag like NoCmFeSgAc
-    matches NoCm and therefore gets mapped to the lexicon tag "nocm". Yes,
-    this is ugly and expensive.
+    Instead we match the tagger's tag against the tags in the POS map and
+    take the longest one which is a prefix. For example, a tag like
+    NoCmFeSgAc matches NoCm and therefore gets mapped to the lexicon tag
+    "nocm". Yes, this is ugly, but POS map tags are indexed on their length,
+    so finding the longest match takes a dict lookup per distinct length,
+    and mapped tags are memoized.
     """
     
+    _derived_attrs = TransDict._derived_attrs + ("_prefix_index", 
+                                                 "_pos_memo")
+    
+    def _init_index(self):
+        TransDict._init_index(self)
+        # POS map tags indexed on their length, longest first
+        self._prefix_index = []
+        self._pos_memo = {}
+        
+        if self.pos_map:
+            by_length = collections.defaultdict(dict)
+            
+            for from_pos, to_pos in self.pos_map.items():
+                by_length[len(from_pos)][from_pos] = to_pos
+                
+            self._prefix_index = sorted(by_length.items(), reverse=True)
+    
+    def _build_index(self):
+        # Tagger POS tags are matched on prefixes, so they cannot be indexed
+        # in advance; only the memo of lookups applies.
+        return {}
+    
     def _map_pos(self, lempos):
         """
         map all pos tags in lempos
@@ -263,14 +655,215 @@ class TransDictGreek(TransDict):
         return mapped_lempos[:-1]
     
     def _map_single_pos(self, pos):
-        for from_pos, to_pos in self.pos_map.items():
-            if pos.startswith(from_pos):
-                return to_pos
-        return ""
+        try:
+            return self._pos_memo[pos]
+        except KeyError:
+            pass
+        
+        to_pos = ""
+        
+        for length, prefixes in self._prefix_index:
+            if length <= len(pos) and pos[:length] in prefixes:
+                to_pos = prefixes[pos[:length]]
+                break
+            
+        # number of distinct tags is small, so memo is not bounded
+        self._pos_memo[pos] = to_pos
+        return to_pos
+    
+    
     
+
+    
+def iter_lexicon_entries(dict_fname, workers=1):
+    """
+    Parse lexicon in Presemt XML format, generating a (source lemma, source
+    lempos, target lemma, target lempos) tuple of unicode strings per entry
+    
+    Elements are cleared once their entry is parsed, so memory use does not
+    grow with the size of the lexicon. With workers > 1, the file is split
+    into as many ranges of entries, which are parsed in parallel by worker
+    processes, while entries are still generated in the order of the file.
+    This requires that entries are children of the root element.
+    """
+    log.info("reading translation dictionary from " + dict_fname)
+    
+    if workers <= 1:
+        for entry in _parse_entries(open(dict_fname, "rb")):
+            yield entry
+        return
+    
+    pool = multiprocessing.Pool(workers)
+    
+    try:
+        ranges = _split_lexicon(dict_fname, workers)
+        tasks = [ (dict_fname, start, end) for start, end in ranges ]
+        
+        for entries in pool.imap(_parse_entry_range, tasks):
+            for entry in entries:
+                yield entry
+    finally:
+        pool.terminate()
+        
+        
+def _parse_entries(inf):
+    # XML parsing is somewhat fuzzy, because lexicon is likely to contain
+    # format errors
+    stack = []
+    
+    for event, elem in et.iterparse(inf, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            
+            if  elem.tag == "entry":
+                sl_lem, tl_lem = [], []
+                sl_lempos, tl_lempos = [], []
+                format_error = False
+            continue
+        
+        stack.pop()
+        
+        # event == "end" for all cases below
+        if elem.tag == "slLemma":
+            if TransDict._is_valid(elem):
+                sl_lem.append(elem.text.strip())
+                sl_lempos.append(TransDict._lempos(elem))
+            else:
+                format_error = True
+        elif elem.tag == "tlLemma":
+            if TransDict._is_valid(elem):
+                tl_lem.append(elem.text.strip())
+                tl_lempos.append(TransDict._lempos(elem))
+            else:
+                format_error = True
+        elif elem.tag == "entry":
+            if format_error:
+                # some format error, e.g. slLemma has no text
+                log.error("skiping ill-formed lexicon entry "
+                          "with id {0}".format(elem.get("id")))
+            else:
+                # ElementTree returns text as type string,
+                # unless it contains non-ascii chars.
+                # For uniformity, convert all text to unicode.
+                yield ( unicode(" ".join(sl_lem)), 
+                        unicode(" ".join(sl_lempos)), 
+                        unicode(" ".join(tl_lem)), 
+                        unicode(" ".join(tl_lempos)) )
+                
+            # done with this entry
+            if stack:
+                stack[-1].remove(elem)
+            elem.clear()
+            
+            
+def _split_lexicon(dict_fname, n):
+    """
+    return list of at most n (start, end) byte offsets of ranges of entries
+    of about equal size, where the first range starts at the first entry 
+    and the last one ends after the last entry
+    """
+    with open(dict_fname, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+    try:
+        first = _find_entry(data, 0)
+        last = data.rfind("</entry>")
+        
+        if first < 0 or last < 0:
+            return []
+        
+        end = last + len("</entry>")
+        bounds = [first]
+        
+        for i in range(1, n):
+            offset = _find_entry(data, max(bounds[-1] + 1, 
+                                           first + (end - first) * i // n))
+            if offset < 0 or offset >= end:
+                break
+            bounds.append(offset)
+            
+        bounds.append(end)
+        return zip(bounds[:-1], bounds[1:])
+    finally:
+        data.close()
+        
+        
+def _find_entry(data, offset):
+    """
+    return offset of first entry start tag at or after offset, or -1
+    """
+    while True:
+        offset = data.find("<entry", offset)
+        
+        if offset < 0 or data[offset + 6:offset + 7] in (">", " ", "\t", 
+                                                         "\r", "\n", "/"):
+            return offset
+        
+        offset += 1
+        
+        
+def _parse_entry_range(args):
+    """
+    parse entries in a range of bytes of a lexicon file, wrapped in the
+    lexicon's XML declaration and a root element
+    """
+    dict_fname, start, end = args
     
+    with open(dict_fname, "rb") as f:
+        head = f.read(min(start, 1024))
+        
+    prefix = ""
     
+    if head.startswith("<?xml"):
+        prefix = head[:head.index("?>") + 2]
+        
+    inf = _RangeReader(dict_fname, start, end, prefix + "<lexicon>", 
+                       "</lexicon>")
+    
+    try:
+        return list(_parse_entries(inf))
+    except et.ParseError as error:
+        # exceptions must be picklable to pass them to the main process
+        raise TGException("cannot parse entries at bytes {}-{} of {} ({}); "
+                          "parallel parsing requires entries to be children "
+                          "of the root element".format(start, end, dict_fname,
+                                                       error))
+
 
+
+class _RangeReader(object):
+    """
+    file-like reader of a range of bytes of a file, preceded by prefix and
+    followed by suffix
+    """
+    
+    def __init__(self, fname, start, end, prefix="", suffix=""):
+        self._f = open(fname, "rb")
+        self._f.seek(start)
+        self._remaining = end - start
+        self._prefix = prefix
+        self._suffix = suffix
+        
+    def read(self, size=-1):
+        if size < 0:
+            size = self._remaining + len(self._prefix) + len(self._suffix)
+            
+        data = self._prefix[:size]
+        self._prefix = self._prefix[size:]
+        
+        if len(data) < size and self._remaining:
+            chunk = self._f.read(min(size - len(data), self._remaining))
+            self._remaining -= len(chunk)
+            data += chunk
+            
+        if len(data) < size and not self._remaining:
+            n = size - len(data)
+            data += self._suffix[:n]
+            self._suffix = self._suffix[n:]
+            
+        return data
+    
+    
     
 def ambig_dist(trans_dict, entry="lempos",
                with_single_word=True, with_multi_word=True, max_trans=1000):
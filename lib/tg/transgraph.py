@@ -1,8 +1,11 @@
 import logging
 
 import networkx as nx
+import numpy as np
 
+from tg import symbols
 from tg.exception import TGException
+from tg.utils import object_array, segment_argmax
 
 
 log = logging.getLogger(__name__)
@@ -18,6 +21,13 @@ class TransGraph(nx.DiGraph):
     max_scores_cache = "_max_scores"
     
     def __init__(self, data=None, **attr):
+        # version counter per score attribute, incremented on every write 
+        self._score_versions = {}
+        # cached max scores per score attribute
+        self._max_scores = {}
+        # vocabulary columns of target nodes per vocabulary fingerprint
+        self._vocab_columns = {}
+        self._init_edge_index()
         nx.DiGraph.__init__(self, data, **attr) 
         self.source_node_count = 0   
         self.target_node_count = 0   
@@ -33,6 +43,86 @@ class TransGraph(nx.DiGraph):
     def __str__(self):
         return self.__repr__()
     
+    def __getstate__(self):
+        # cached max scores are not pickled (or copied)
+        state = self.__dict__.copy()
+        state["_max_scores"] = {}
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        
+        if "_score_versions" not in state:
+            # graph pickled before versioned max score cache was introduced,
+            # which cached max scores on source nodes without any way to 
+            # tell if they are still valid
+            self._score_versions = {}
+            self._max_scores = {}
+            
+            for data in self.node.itervalues():
+                data.pop(self.max_scores_cache, None)
+        
+        if "_vocab_columns" not in state:
+            self._vocab_columns = {}
+            
+        if "_trans" not in state:
+            # graph pickled before edge index was introduced
+            self._index_edges()
+    
+    def view(self):
+        """
+        return a copy-on-write view of this graph for writing scores
+        
+        See TransGraphView
+        """
+        return TransGraphView(self)
+    
+    #-------------------------------------------------------------------------
+    # edges
+    #-------------------------------------------------------------------------  
+    
+    def add_edge(self, u, v, attr_dict=None, **attr):
+        is_new = not self.has_edge(u, v)
+        nx.DiGraph.add_edge(self, u, v, attr_dict=attr_dict, **attr)
+        
+        if is_new:
+            self._index_edge(u, v, self.edge[u][v].get("name"))
+            
+    def add_edges_from(self, ebunch, attr_dict=None, **attr):
+        # nx.DiGraph.add_edges_from does not call add_edge
+        for e in ebunch:
+            u, v = e[:2]
+            data = dict(attr_dict or {}, **attr)
+            
+            if len(e) == 3:
+                data.update(e[2])
+                
+            self.add_edge(u, v, attr_dict=data)
+            
+    def remove_edge(self, u, v):
+        name = self.edge[u][v].get("name")
+        nx.DiGraph.remove_edge(self, u, v)
+        self._unindex_edge(u, v, name)
+        
+    def remove_node(self, n):
+        edges = ( self.in_edges(n, data=True) + 
+                  self.out_edges(n, data=True) )
+        nx.DiGraph.remove_node(self, n)
+        
+        for u, v, data in edges:
+            self._unindex_edge(u, v, data.get("name"))
+            
+    def remove_nodes_from(self, nodes):
+        for n in nodes:
+            if n in self:
+                self.remove_node(n)
+                
+    def clear(self):
+        nx.DiGraph.clear(self)
+        self.source_start_node = None
+        self._max_scores = {}
+        self._init_edge_index()
+    
     #-------------------------------------------------------------------------
     # source nodes
     #-------------------------------------------------------------------------  
@@ -41,7 +131,7 @@ class TransGraph(nx.DiGraph):
         self.source_node_count += 1
         u = "{0}{1}".format(self.source_node_prefix,
                             self.source_node_count)
-        self.add_node(u, **attr)
+        self.add_node(u, **self._intern_attrs(attr))
         return u
     
     def is_source_node(self, u):
@@ -68,16 +158,7 @@ class TransGraph(nx.DiGraph):
             else:
                 yield u
                 
-            for u, v, d in self.out_edges_iter(u, data=True):
-                if d.get("name") == "next":
-                    u = v
-                    # assuming there is only one "next" node, ignore any
-                    # remaining outgoing edges
-                    break
-            else:
-                # none of the outgoing edges has name "next", so this was the
-                # last token
-                return
+            u = self._next.get(u)
             
     def _unordered_source_nodes_iter(self, data=False):
         if data:
@@ -95,8 +176,17 @@ class TransGraph(nx.DiGraph):
         self.target_node_count += 1
         u = "{0}{1}".format(self.target_node_prefix,
                             self.target_node_count)
-        self.add_node(u, **attr)
-        return u    
+        self.add_node(u, **self._intern_attrs(attr))
+        return u
+    
+    @staticmethod
+    def _intern_attrs(attr):
+        # share lemma and POS strings with all other graphs and dictionaries
+        if "lemma" in attr:
+            attr["lemma"] = symbols.lemmas.intern(attr["lemma"])
+        if "pos" in attr:
+            attr["pos"] = symbols.pos_tags.intern(attr["pos"])
+        return attr    
     
     def is_target_node(self, u):
         return u.startswith(self.target_node_prefix) 
@@ -129,14 +219,30 @@ class TransGraph(nx.DiGraph):
         return u.startswith(self.hyper_target_node_prefix) 
     
     def source_parts_iter(self, u):
-        part_nodes = ( v for v, _, data in self.in_edges_iter(u, data=True)
-                       if data.get("name") == "part" )
-        return self.ordered_nodes_iter(part_nodes)
+        return iter(self._parts[u])
     
     def target_parts_iter(self, u):
-        part_nodes = ( v for _, v, data in self.out_edges_iter(u, data=True)
-                       if data.get("name") == "part" )
-        return self.ordered_nodes_iter(part_nodes)
+        return iter(self._parts[u])
+    
+    def part_edges_iter(self, u=None):
+        """
+        return an iterator over part edges, optionally restricted to the
+        edges of hyper node u, with the parts of a hyper node in order
+        """
+        if u is None:
+            nodes = self._parts
+        elif u in self._parts:
+            nodes = [u]
+        else:
+            nodes = []
+        
+        for u in nodes:
+            if self.is_hyper_source_node(u):
+                for v in self._parts[u]:
+                    yield v, u, self.succ[v][u]
+            else:
+                for v in self._parts[u]:
+                    yield u, v, self.succ[u][v]
     
     #-------------------------------------------------------------------------
     # attributes
@@ -153,7 +259,7 @@ class TransGraph(nx.DiGraph):
                  for _,d in self.source_nodes_iter(data=True, ordered=True) ]
     
     def source_lempos(self):
-        return [ ( d["lemma"] + self.delimiter + d["pos"] )
+        return [ symbols.lempos.lempos(d["lemma"], d["pos"])
                  for _,d in self.source_nodes_iter(data=True, ordered=True) ]
         
     def source_string(self):
@@ -188,14 +294,38 @@ class TransGraph(nx.DiGraph):
         return self.node_attrib(u, "pos", as_list=as_list)
     
     def lempos(self, u, as_list=False):
-        l =  [ self.delimiter.join(pair)
-               for pair in zip(self.node_attrib(u, "lemma", True),
-                               self.node_attrib(u, "pos", True)) ]
+        if not as_list and ( self.is_source_node(u) or 
+                             self.is_target_node(u) ):
+            # fast path for the most common case
+            d = self.node[u]
+            return symbols.lempos.lempos(d["lemma"], d["pos"])
+        
+        l =  [ symbols.lempos.lempos(lemma, pos)
+               for lemma, pos in zip(self.node_attrib(u, "lemma", True),
+                                     self.node_attrib(u, "pos", True)) ]
         if as_list:
             return l
         else:
             return " ".join(l)
         
+    def lemma_id(self, u):
+        """
+        return id of the lemma of node u in the global lemma table 
+        (see tg.symbols)
+        """
+        return symbols.lemmas.id(self.lemma(u))
+    
+    def lempos_id(self, u):
+        """
+        return id of the lempos of node u in the global lempos table 
+        (see tg.symbols)
+        """
+        if self.is_source_node(u) or self.is_target_node(u):
+            d = self.node[u]
+            return symbols.lempos.lempos_id(d["lemma"], d["pos"])
+        
+        return symbols.lempos.id(self.lempos(u))
+        
     
     def string(self, u):
         " ".join(self.node_attrib(u, "word"))
@@ -211,36 +341,97 @@ class TransGraph(nx.DiGraph):
     def ordered_nodes_iter(self, nodes):
         """
         return an iterator over nodes in order (i.e. following edges named
-        "next")
+        "next"), starting from the node without a predecessor among nodes and
+        stopping at the first successor which is not among nodes
         """
+        nodes = set(nodes)
+        
         # find first node
         for u in nodes:
-            if self.is_first_node(u):
+            if self._prev.get(u) not in nodes:
                 break
         else:
             # should never happen
             raise TGException("no first node among ordered nodes")
            
-        while u:
+        while u in nodes:
             yield u
-            
-            for _,v,data in self.out_edges(u, data=True): 
-                if data.get("name") == "next":
-                    # found next node
-                    u = v
-                    break
-            else:
-                # reached final node
-                return
+            u = self._next.get(u)
                 
     def is_first_node(self, u):
         """
         test if node is first (i.e. has predecessor with edge named "next")
         """
-        for _, _, data in  self.in_edges_iter(u, data=True):
-            if data.get("name") == "next":
-                return False
-        return True
+        return u not in self._prev
+    
+    def word_order_edges_iter(self, u=None):
+        """
+        return an iterator over word order edges, optionally restricted to
+        the edge from node u
+        """
+        if u is None:
+            nodes = self._next
+        elif u in self._next:
+            nodes = [u]
+        else:
+            nodes = []
+            
+        return ( (u, self._next[u], self.succ[u][self._next[u]]) 
+                 for u in nodes )
+    
+    def _init_edge_index(self):
+        # Edge index, kept separately per edge type: 
+        # - maps each node to the list of its translations, in the order in
+        #   which they were added 
+        # - maps each node to the next and to the previous node according to
+        #   edges named "next"
+        # - maps each hyper node to the list of its parts in the order in 
+        #   which they were added
+        self._trans = {}
+        self._next = {}
+        self._prev = {}
+        self._parts = {}
+        
+    def _index_edges(self):
+        """
+        (re)build edge index from edges
+        """
+        self._init_edge_index()
+        
+        for u, v, data in self.edges_iter(data=True):
+            self._index_edge(u, v, data.get("name"))
+            
+        # edge order is arbitrary, so put parts in word order
+        for u, parts in self._parts.items():
+            self._parts[u] = list(self.ordered_nodes_iter(parts))
+            
+    def _index_edge(self, u, v, name):
+        if name == "trans":
+            self._trans.setdefault(u, []).append(v)
+            self._max_scores.clear()
+            self._vocab_columns.clear()
+        elif name == "next":
+            self._next[u] = v
+            self._prev[v] = u
+        elif name == "part":
+            if self.is_hyper_source_node(v):
+                self._parts.setdefault(v, []).append(u)
+            else:
+                self._parts.setdefault(u, []).append(v)
+                
+    def _unindex_edge(self, u, v, name):
+        if name == "trans":
+            self._trans[u].remove(v)
+            self._max_scores.clear()
+            self._vocab_columns.clear()
+        elif name == "next":
+            del self._next[u]
+            del self._prev[v]
+        elif name == "part":
+            if self.is_hyper_source_node(v):
+                self._parts[v].remove(u)
+            else:
+                self._parts[u].remove(v)
     
     #-------------------------------------------------------------------------
     # translation
@@ -251,8 +442,160 @@ class TransGraph(nx.DiGraph):
         self.add_edge(u, v, name="trans", attr_dict=attr_dict, **attr)
         
     def trans_edges_iter(self, u=None):
-        return ( (u,v,d) for u,v,d in self.out_edges_iter(u, data=True)
-                 if d.get("name") == "trans" )
+        if u is None:
+            nodes = self._trans
+        elif u in self._trans:
+            nodes = [u]
+        else:
+            nodes = []
+            
+        return ( (u, v, self.succ[u][v]) 
+                 for u in nodes 
+                 for v in self._trans[u] )
+    
+    def trans_edge_arrays(self, data=True):
+        """
+        return all translation edges as arrays
+        
+        Parameters
+        ----------
+        data: bool, optional
+            If false, return only sources and targets
+        
+        Returns
+        -------
+        sources: numpy.ndarray
+            Source node of each edge
+        targets: numpy.ndarray
+            Target node of each edge
+        data: numpy.ndarray
+            Object array with a reference to the data dict of each edge
+            
+        Notes
+        -----
+        Edges from the same source node are contiguous and in the same order 
+        as returned by trans_edges_iter.
+        """
+        sources, targets, edge_data = [], [], []
+        
+        for u, vs in self._trans.iteritems():
+            sources += [u] * len(vs)
+            targets += vs
+            
+            if data:
+                succ = self.succ[u]
+                edge_data += [ succ[v] for v in vs ]
+            
+        arrays = ( np.array(sources, dtype=object), 
+                   np.array(targets, dtype=object) )
+        
+        if data:
+            arrays += (object_array(edge_data),)
+            
+        return arrays
+    
+    def score_column(self, score_attr):
+        """
+        return scores of all translation edges
+        
+        Parameters
+        ----------
+        score_attr: str
+            Name of edge attribute containing the score.
+            
+        Returns
+        -------
+        scores: numpy.ndarray
+            Float array aligned with the edges returned by trans_edge_arrays,
+            where NaN means that the edge has no score attribute
+        """
+        scores = []
+        
+        for u, vs in self._trans.iteritems():
+            succ = self.succ[u]
+            scores += [ succ[v].get(score_attr) for v in vs ]
+        
+        # conversion to float turns None into NaN
+        return np.array(scores, dtype="f8")
+    
+    def set_score_column(self, score_attr, scores):
+        """
+        set scores of all translation edges
+        
+        Parameters
+        ----------
+        score_attr: str
+            Name of edge attribute containing the score.
+        scores: numpy.ndarray
+            Float array aligned with the edges returned by trans_edge_arrays,
+            where NaN means that the score of the edge is left untouched
+        """
+        scores = iter(np.asarray(scores, dtype="f8").tolist())
+        
+        for u, vs in self._trans.iteritems():
+            succ = None
+            
+            for v, score in zip(vs, scores):
+                # NaN is the only value not equal to itself
+                if score == score:
+                    if succ is None:
+                        succ = self._writable_succ(u)
+                    succ[v][score_attr] = score
+                    
+        self._score_changed(score_attr)
+    
+    def set_score(self, u, v, score_attr, score):
+        """
+        set score of translation edge from u to v
+        
+        Parameters
+        ----------
+        u: str
+            Source node identifier
+        v: str
+            Target node identifier
+        score_attr: str
+            Name of edge attribute containing the score.
+        score: float
+            Score
+        """
+        self._writable_succ(u)[v][score_attr] = score
+        self._score_changed(score_attr)
+        
+    def set_scores(self, score_attr, edge_data, scores):
+        """
+        set scores of translation edges
+        
+        Parameters
+        ----------
+        score_attr: str
+            Name of edge attribute containing the score.
+        edge_data: list of dicts
+            data dicts of translation edges (from trans_edges_iter)
+        scores: iterable
+            scores, where None means that the score of the edge is left 
+            untouched
+        """
+        for data, score in zip(edge_data, scores):
+            if score is not None:
+                data[score_attr] = score
+                
+        self._score_changed(score_attr)
+        
+    def score_version(self, score_attr):
+        """
+        return version of score attribute, which changes whenever scores are
+        written through set_score, set_scores or set_score_column
+        """
+        return self._score_versions.get(score_attr, 0)
+    
+    def _score_changed(self, score_attr):
+        self._score_versions[score_attr] = self.score_version(score_attr) + 1
+        
+    def _writable_succ(self, u):
+        # successors of u whose edge data may be written, 
+        # overridden by copy-on-write views
+        return self.succ[u]
     
     def max_score(self, u, score_attr):
         """
@@ -278,26 +621,175 @@ class TransGraph(nx.DiGraph):
             
         Notes
         -----
-        Max scores are cached with a dict on te source node, so make sure to 
-        clear these caches if you rerun a scorer. 
+        Max scores are computed for all nodes with translation edges at once,
+        using a segment-wise argmax over the score column. They are cached
+        until translation edges are added or removed, or the version of the
+        score attribute changes. Scores must therefore be written through
+        set_score, set_scores or set_score_column. If scores are written to
+        edge data dicts directly, call clear_max_scores afterwards.
         """
+        version = self.score_version(score_attr)
+        
         try:
-            return self.node[u][self.max_scores_cache][score_attr]
+            cached_version, max_scores = self._max_scores[score_attr]
         except KeyError:
-            pass
+            cached_version = None
+            
+        if cached_version != version:
+            max_scores = self._compute_max_scores(score_attr)
+            self._max_scores[score_attr] = version, max_scores
+            
+        return max_scores.get(u, (None, None))
+    
+    def clear_max_scores(self):
+        """
+        remove all cached max scores
+        """
+        self._max_scores.clear()
+        
+    def vocab_columns(self, fingerprint):
+        """
+        return vocabulary columns of target nodes
+        
+        Parameters
+        ----------
+        fingerprint: str
+            Fingerprint of vocabulary
+            
+        Returns
+        -------
+        columns: dict or None
+            Dict mapping target nodes to their (lemma's) column in the 
+            vocabulary, as set by set_vocab_columns, or None if not set.
+            Target nodes which are out of vocabulary are not included.
+        """
+        return self._vocab_columns.get(fingerprint)
+    
+    def set_vocab_columns(self, fingerprint, columns):
+        """
+        attach vocabulary columns of target nodes to graph
         
-        max_score, max_node = None, None
+        Columns are kept (and pickled) until translation edges are added or
+        removed.
         
-        for _, v, d in self.trans_edges_iter(u):
-            score = d.get(score_attr)
-            if score > max_score:
-                max_score, max_node = score, v
-                max_node = v
+        Parameters
+        ----------
+        fingerprint: str
+            Fingerprint of vocabulary
+        columns: dict
+            Dict mapping target nodes to their column in the vocabulary
+        """
+        self._vocab_columns[fingerprint] = columns
+    
+    def _compute_max_scores(self, score_attr):
+        """
+        return dict mapping each node with a translation edge that has the
+        score attribute to a tuple of its max score and target node
+        """
+        nodes, starts, targets, scores = [], [], [], []
+        
+        for u, vs in self._trans.iteritems():
+            if vs:
+                succ = self.succ[u]
+                nodes.append(u)
+                starts.append(len(targets))
+                targets += vs
+                scores += [ succ[v].get(score_attr) for v in vs ]
                 
-        cache = self.node[u].setdefault(self.max_scores_cache, {})
-        cache[score_attr] = max_score, max_node
-        return max_score, max_node
+        argmax = segment_argmax(np.array(scores, dtype="f8"), starts)
+        # original score rather than its conversion to float
+        return dict( (u, (scores[i], targets[i])) 
+                     for u, i in zip(nodes, argmax.tolist()) 
+                     if i >= 0 )
 
         
         
         
+
+
+
+class TransGraphView(TransGraph):
+    """
+    Copy-on-write view of a translation graph
+    
+    A view shares nodes, edges and their data with the base graph, so it is
+    cheap to create, but scores written to the view through set_score, 
+    set_scores or set_score_column do not affect the base graph. To that 
+    end, the successors of a source node and the data of their edges are 
+    copied on the first write of a score to one of these edges.
+    
+    Parameters
+    ----------
+    graph: TransGraph
+        Base graph
+    
+    Notes
+    -----
+    Nodes and edges cannot be added to or removed from a view. Node data and
+    edge data written directly (rather than through the score methods 
+    above) are shared with the base graph. The base graph should not be 
+    modified while it has views.
+    """
+    
+    def __init__(self, graph):
+        self.__dict__.update(graph.__dict__)
+        self.graph = graph.graph.copy()
+        self.succ = self.adj = self.edge = graph.succ.copy()
+        self.pred = graph.pred.copy()
+        self._score_versions = graph._score_versions.copy()
+        self._max_scores = {}
+        self._vocab_columns = graph._vocab_columns.copy()
+        # nodes with copied successors and predecessors respectively
+        self._owned_succ = set()
+        self._owned_pred = set()
+        # maps id of edge data to edge, built on first use by set_scores
+        self._edge_ids = None
+        
+    def __getstate__(self):
+        # ids of edge data are meaningless in another process
+        state = TransGraph.__getstate__(self)
+        state["_edge_ids"] = None
+        return state
+        
+    def _writable_succ(self, u):
+        if u not in self._owned_succ:
+            succ = self.succ[u] = dict( (v, data.copy()) 
+                                        for v, data in self.succ[u].iteritems() )
+            
+            for v, data in succ.iteritems():
+                if v not in self._owned_pred:
+                    self.pred[v] = self.pred[v].copy()
+                    self._owned_pred.add(v)
+                    
+                self.pred[v][u] = data
+                
+            if self._edge_ids is not None:
+                # ids of the shared data remain valid as well, as the base
+                # graph keeps them alive
+                self._edge_ids.update( (id(data), (u, v)) 
+                                       for v, data in succ.iteritems() )
+                
+            self._owned_succ.add(u)
+            
+        return self.succ[u]
+    
+    def set_scores(self, score_attr, edge_data, scores):
+        # edge data may belong to the base graph, so find the edges they 
+        # belong to
+        if self._edge_ids is None:
+            self._edge_ids = dict( (id(data), (u, v)) 
+                                   for u, v, data in self.trans_edges_iter() )
+        
+        for data, score in zip(edge_data, scores):
+            if score is not None:
+                u, v = self._edge_ids[id(data)]
+                self._writable_succ(u)[v][score_attr] = score
+                
+        self._score_changed(score_attr)
+        
+    def _read_only(self, *args, **kwargs):
+        raise TGException("cannot add or remove nodes or edges of a graph "
+                          "view")
+    
+    add_node = add_nodes_from = add_edge = add_edges_from = _read_only
+    remove_node = remove_nodes_from = remove_edge = clear = _read_only
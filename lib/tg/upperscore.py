@@ -75,7 +75,7 @@ class DictUpperScorer(_UpperScorer):
         
         for u in graph.source_nodes_iter():
             self._add_normalized_scores(
-                *self._score_translations(graph, u, seg_counts))
+                graph, *self._score_translations(graph, u, seg_counts))
 
     
     
@@ -116,5 +116,5 @@ class ModelUpperScorer(_UpperScorer):
                 continue
             
             self._add_normalized_scores(
-                *self._score_translations(graph, u, seg_counts))
+                graph, *self._score_translations(graph, u, seg_counts))
     
\ No newline at end of file
@@ -103,6 +103,71 @@ def coo_matrix_from_hdf5(group, dtype=None):
                          shape=group.attrs["shape"], dtype=dtype)
 
 
+def object_array(objects):
+    """
+    return 1-dimensional numpy array of objects 
+    
+    np.array would turn e.g. a list of tuples or lists into a 2-dimensional 
+    array instead
+    """
+    objects = list(objects)
+    a = np.empty(len(objects), dtype=object)
+    
+    for i, obj in enumerate(objects):
+        a[i] = obj
+        
+    return a
+
+
+
+# segments
+
+def segment_starts(keys):
+    """
+    return start indices of the segments (i.e. runs of equal consecutive 
+    keys) in keys
+    """
+    keys = np.asarray(keys)
+    
+    if len(keys) == 0:
+        return np.zeros(0, dtype=int)
+    
+    return np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+
+
+def segment_argmax(values, starts):
+    """
+    return index of the maximum value in each segment of values 
+    
+    Parameters
+    ----------
+    values: numpy.ndarray
+        float values, where NaN means no value
+    starts: numpy.ndarray
+        start index of each segment, in increasing order
+        
+    Returns
+    -------
+    argmax: numpy.ndarray
+        Index into values of the first maximum in each segment, or -1 if all
+        values in the segment are NaN
+    """
+    values = np.asarray(values, dtype="f8")
+    n = len(values)
+    
+    if len(starts) == 0:
+        return np.zeros(0, dtype=int)
+    
+    lengths = np.diff(np.append(starts, n))
+    is_nan = np.isnan(values)
+    filled = np.where(is_nan, -np.inf, values)
+    maxima = np.maximum.reduceat(filled, starts)
+    is_max = (filled == np.repeat(maxima, lengths)) & ~is_nan
+    # smallest index of a maximum per segment, or n if there is none
+    argmax = np.minimum.reduceat(np.where(is_max, np.arange(n), n), starts)
+    argmax[argmax == n] = -1
+    return argmax
+
 
 # ascii tables
 
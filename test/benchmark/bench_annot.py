@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+"""
+Compare parsing of TreeTagger output as XML with line-oriented parsing
+
+The XML source (by default a newstest file, repeated to make it large) is
+tagged once with the stand-in tagger from the test data. Its raw output is
+then turned into graphs in two ways: the former way, which decodes the whole
+output, replaces "<unknown>" and ampersands, encodes it again and parses it
+as XML, and the current line-oriented parser. Throughput is measured in
+source tokens per second, memory as the increase of peak memory use while
+parsing (including the graphs), and both must produce the same graphs.
+"""
+
+import argparse
+import cStringIO
+import gc
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+import xml.etree.ElementTree as et
+
+import numpy as np
+
+from tg.config import config
+from tg.annot import TreeTagger
+from tg.taggerpool import run_tagger
+from tg.utils import set_default_log, text_table
+
+
+log = logging.getLogger(__name__)
+
+
+COMMAND = "{} {}/fake_tagger.py".format(sys.executable,
+                                        config["test_data_dir"])
+
+
+def parse_as_xml(annotator, tagger_out, xml_sent_tag="seg", id_attr="id"):
+    """
+    former way of creating graphs from TreeTagger output
+    """
+    tagger_out = tagger_out.decode("utf-8")
+    tagger_out = tagger_out.replace(annotator.unknown_lemma,
+                                    annotator.unknown)
+    tagger_out = tagger_out.replace(u"&", u"&amp;")
+    tagger_out = tagger_out.encode("utf-8")
+    graph_list = []
+
+    for _, elem in et.iterparse(cStringIO.StringIO(tagger_out)):
+        if elem.tag == xml_sent_tag:
+            graph = annotator._add_new_graph(graph_id=elem.get(id_attr),
+                                             n=len(graph_list) + 1)
+            graph_list.append(graph)
+            prev_node = None
+            text = elem.text.strip()
+
+            if text:
+                for line in text.split(u"\n"):
+                    prev_node, _ = annotator._add_new_node(line, graph,
+                                                           prev_node)
+    return graph_list
+
+
+def parse_lines(annotator, tagger_out, xml_sent_tag="seg", id_attr="id"):
+    """
+    current way of creating graphs from TreeTagger output, where lines
+    are decoded one by one as in tg.taggerpool.run_tagger
+    """
+    lines = ( line.decode("utf-8").rstrip(u"\r\n")
+              for line in cStringIO.StringIO(tagger_out) )
+    return annotator._extract_sentences_from_output(lines, xml_sent_tag,
+                                                    id_attr)
+
+
+def timeit(func, annotator, tagger_out, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.time()
+        graphs = func(annotator, tagger_out)
+        best = min(best, time.time() - start)
+    return best, graphs
+
+
+def rss():
+    """
+    current resident set size in KB (Linux only)
+    """
+    pages = int(open("/proc/self/statm").read().split()[1])
+    return pages * resource.getpagesize() / 1024.0
+
+
+def peak_memory(func, annotator, tagger_out):
+    """
+    increase of peak memory use in KB while running func in a child process,
+    sampling the resident set size every millisecond (Linux only)
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+
+    if pid == 0:
+        os.close(read_fd)
+        start = rss()
+        peak = [start]
+        running = [True]
+
+        def sample():
+            while running[0]:
+                peak[0] = max(peak[0], rss())
+                time.sleep(0.001)
+
+        thread = threading.Thread(target=sample)
+        thread.start()
+        func(annotator, tagger_out)
+        running[0] = False
+        thread.join()
+        os.write(write_fd, str(max(peak[0], rss()) - start))
+        os._exit(0)
+
+    os.close(write_fd)
+    kbytes = float(os.read(read_fd, 64))
+    os.close(read_fd)
+    os.waitpid(pid, 0)
+    return kbytes
+
+
+def bench(xml_fname, copies=100, repeat=3):
+    log.info("reading XML source from " + xml_fname)
+    source = open(xml_fname).read()
+    # repeat source within a single root element
+    source = "<corpus>\n" + source * copies + "</corpus>\n"
+    annotator = TreeTagger(COMMAND, "utf-8")
+    # also exercise handling of ampersands and unknown lemmas
+    source = source.replace(" and ", " & ").replace(" 20", " 20x")
+    log.info("tagging {} KB of XML source".format(len(source) / 1024))
+    tagger_out = u"".join(run_tagger(COMMAND, source, "utf-8"))
+    tagger_out = tagger_out.encode("utf-8")
+    # suppress logging of unknown lemmas
+    logging.getLogger("tg.annot").setLevel(logging.ERROR)
+    rows = []
+    results = []
+
+    for func in parse_as_xml, parse_lines:
+        kbytes = peak_memory(func, annotator, tagger_out)
+        seconds, graphs = timeit(func, annotator, tagger_out, repeat)
+        n_tokens = sum(len(graph) for graph in graphs)
+        log.info("{} took {:.4f}s".format(func.__name__, seconds))
+        rows.append((func.__name__, len(graphs), n_tokens / seconds, kbytes))
+        results.append(graphs)
+
+    assert ( [ (g.graph, g.source_lempos()) for g in results[0] ] ==
+             [ (g.graph, g.source_lempos()) for g in results[1] ] )
+
+    dtype = [("parser", "S16"), ("graphs", "i"), ("tok/s", "f"),
+             ("peak_memory_KB", "f")]
+    return np.array(rows, dtype=dtype)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        "xml_fname",
+        metavar="XML_FILE",
+        nargs="?",
+        default=config["test_data_dir"] +
+        "/sample_newstest2011-src.en.sgm",
+        help="XML source file, e.g. in mteval format")
+
+    parser.add_argument(
+        "-c", "--copies",
+        metavar="N",
+        type=int,
+        default=100,
+        help="number of copies of the source to tag")
+
+    parser.add_argument(
+        "-r", "--repeat",
+        metavar="N",
+        type=int,
+        default=3,
+        help="number of repeats per parser (best time is reported)")
+
+    args = parser.parse_args()
+    set_default_log()
+    results = bench(args.xml_fname, args.copies, args.repeat)
+    text_table(results)
+    print
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+
+"""
+Measure annotation throughput of TreeTagger and OsloBergenTagger
+
+Both annotators run with the stand-in tagger from the test data instead of
+the real taggers, which emits tab-separated lines at a configurable speed
+(see --delay and --startup). For annot_text, annot_sentences and
+annot_xml_file at several input sizes, the benchmark measures graphs and
+tokens per second and the increase of peak memory use. Inputs are made by
+repeating the segments of a newstest file.
+
+Each run is done in a child process of its own, so runs do not affect each
+other's memory use. Results are saved to a numpy file and a text table
+(see tg.exps.support.ResultsStore). Comparing with the results of an
+earlier run (see --baseline) shows regressions.
+"""
+
+import argparse
+import cPickle
+import logging
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as et
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from tg.config import config
+from tg.annot import TreeTagger, OsloBergenTagger
+from tg.exps.support import ResultsStore, Namespace
+from tg.utils import set_default_log, text_table
+
+
+log = logging.getLogger(__name__)
+
+
+COMMAND = "{} {}/fake_tagger.py".format(sys.executable,
+                                        config["test_data_dir"])
+
+DESCRIPTOR = [
+    ("tagger", "S16"),
+    ("method", "S16"),
+    ("sentences", "i"),
+    ("graphs", "i"),
+    ("tokens", "i"),
+    ("seconds", "f"),
+    ("graphs_per_sec", "f"),
+    ("tokens_per_sec", "f"),
+    ("peak_memory_KB", "f"),
+]
+
+
+def make_annotators(delay=0.0, startup=0.0, pool_size=0):
+    options = " --startup {} --delay {}".format(startup, delay)
+    return [
+        ("TreeTagger",
+         TreeTagger(COMMAND + options, "utf-8", eos_pos_tag="SENT",
+                    pool_size=pool_size)),
+        ("OsloBergenTagger",
+         OsloBergenTagger(COMMAND + options + " --obt",
+                          pool_size=pool_size)) ]
+
+
+def read_sentences(xml_fname, n):
+    """
+    return list of n sentences, repeating those from the XML file
+    """
+    sentences = [ elem.text.strip()
+                  for elem in et.ElementTree(file=xml_fname).iter("seg") ]
+    return [ sentences[i % len(sentences)] for i in range(n) ]
+
+
+def write_xml(sentences, fname):
+    with open(fname, "w") as outf:
+        outf.write("<refset>\n<doc>\n")
+        for i, sent in enumerate(sentences):
+            outf.write(u'<seg id="{}">{}</seg>\n'.format(
+                i + 1, escape(sent)).encode("utf-8"))
+        outf.write("</doc>\n</refset>\n")
+
+
+def rss():
+    """
+    current resident set size in KB (Linux only)
+    """
+    pages = int(open("/proc/self/statm").read().split()[1])
+    return pages * resource.getpagesize() / 1024.0
+
+
+def run_child(func, *args):
+    """
+    run func in a child process, sampling the resident set size every
+    millisecond, and return its time in seconds, the number of graphs and
+    tokens of its result and the increase of peak memory use in KB
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+
+    if pid == 0:
+        os.close(read_fd)
+        start = rss()
+        peak = [start]
+        running = [True]
+
+        def sample():
+            while running[0]:
+                peak[0] = max(peak[0], rss())
+                time.sleep(0.001)
+
+        thread = threading.Thread(target=sample)
+        thread.start()
+        t = time.time()
+        graphs = func(*args)
+        seconds = time.time() - t
+        running[0] = False
+        thread.join()
+        result = (seconds, len(graphs), sum(len(g) for g in graphs),
+                  max(peak[0], rss()) - start)
+        os.write(write_fd, cPickle.dumps(result))
+        os._exit(0)
+
+    os.close(write_fd)
+    data = ""
+    while True:
+        chunk = os.read(read_fd, 4096)
+        if not chunk:
+            break
+        data += chunk
+    os.close(read_fd)
+    os.waitpid(pid, 0)
+    return cPickle.loads(data)
+
+
+def bench(xml_fname, sizes, store, delay=0.0, startup=0.0, pool_size=0):
+    tmp_dir = tempfile.mkdtemp()
+    # suppress logging of unknown lemmas
+    logging.getLogger("tg.annot").setLevel(logging.ERROR)
+
+    try:
+        for size in sizes:
+            sentences = read_sentences(xml_fname, size)
+            text = u"\n".join(sentences)
+            sent_fname = os.path.join(tmp_dir, "sample_{}.xml".format(size))
+            write_xml(sentences, sent_fname)
+            runs = [ ("annot_text", text),
+                     ("annot_sentences", sentences),
+                     ("annot_xml_file", sent_fname) ]
+
+            for name, annotator in make_annotators(delay, startup,
+                                                   pool_size):
+                for method, data in runs:
+                    log.info("running {}.{} on {} sentences".format(
+                        name, method, size))
+                    seconds, n_graphs, n_tokens, kbytes = run_child(
+                        getattr(annotator, method), data)
+                    store.append(Namespace(
+                        tagger=name,
+                        method=method,
+                        sentences=size,
+                        graphs=n_graphs,
+                        tokens=n_tokens,
+                        seconds=seconds,
+                        graphs_per_sec=n_graphs / seconds,
+                        tokens_per_sec=n_tokens / seconds,
+                        peak_memory_KB=kbytes))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    return store.results[:store.count]
+
+
+def compare(results, baseline_fname):
+    """
+    return table with relative change of throughput and memory use in
+    comparison with the results in a baseline numpy file
+    """
+    baseline = np.load(baseline_fname)
+    old = dict( ((r["tagger"], r["method"], r["sentences"]), r)
+                for r in baseline )
+    rows = []
+
+    for r in results:
+        key = r["tagger"], r["method"], r["sentences"]
+        if key in old:
+            rows.append(key + (
+                r["tokens_per_sec"] / old[key]["tokens_per_sec"] - 1,
+                r["peak_memory_KB"] - old[key]["peak_memory_KB"]))
+
+    dtype = [("tagger", "S16"), ("method", "S16"), ("sentences", "i"),
+             ("tok/s_change", "f"), ("memory_change_KB", "f")]
+    return np.array(rows, dtype=dtype)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        "xml_fname",
+        metavar="XML_FILE",
+        nargs="?",
+        default=config["test_data_dir"] +
+        "/sample_newstest2011-src.en.sgm",
+        help="XML source file with seg elements, e.g. in mteval format")
+
+    parser.add_argument(
+        "-s", "--sizes",
+        metavar="N",
+        type=int,
+        nargs="+",
+        default=[100, 1000, 5000],
+        help="input sizes in sentences")
+
+    parser.add_argument(
+        "-d", "--delay",
+        metavar="SECONDS",
+        type=float,
+        default=0.0,
+        help="delay of stand-in tagger per token")
+
+    parser.add_argument(
+        "--startup",
+        metavar="SECONDS",
+        type=float,
+        default=0.0,
+        help="startup delay of stand-in tagger")
+
+    parser.add_argument(
+        "-p", "--pool-size",
+        metavar="N",
+        type=int,
+        default=0,
+        help="number of long-lived tagger processes (0 starts a tagger per "
+        "call)")
+
+    parser.add_argument(
+        "-o", "--out",
+        metavar="PREFIX",
+        default="bench_annot_throughput",
+        help="prefix of numpy and text files for results")
+
+    parser.add_argument(
+        "-b", "--baseline",
+        metavar="NPY_FILE",
+        help="numpy file with results of an earlier run to compare with")
+
+    args = parser.parse_args()
+    set_default_log()
+    store = ResultsStore(DESCRIPTOR, args.out)
+    results = bench(args.xml_fname, args.sizes, store, args.delay,
+                    args.startup, args.pool_size)
+    text_table(results)
+    print
+
+    if args.baseline:
+        text_table(compare(results, args.baseline))
+        print
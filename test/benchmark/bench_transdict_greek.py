@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare lookup in the Greek dictionaries with the former and current
+mapping of POS tags
+
+Formerly, TransDictGreek mapped a full tagger tag such as NoCmFeSgAc by
+trying every tag in the POS map as a prefix. Now it finds the longest
+matching prefix through an index on prefix length and memoizes mapped tags.
+Lookups are made for every lempos entry of the dictionary, with the lexicon
+POS tag replaced by a full tagger tag, as in Lookup, and once more for
+multi-word lookups of pairs of entries. Throughput is measured in lookups
+per second with a cold memo of lookups (so each lookup maps its POS tags),
+and for comparison with the other languages, the same for the English-German
+dictionary. All ways of lookup must produce the same results.
+
+If a dictionary pickle is not available, a synthetic dictionary is made from
+its POS map.
+"""
+
+import argparse
+import gc
+import itertools
+import logging
+import os
+import random
+import time
+
+import configobj
+import numpy as np
+
+from tg.config import config
+from tg.transdict import TransDict, TransDictGreek
+from tg.utils import set_default_log, text_table
+
+
+log = logging.getLogger(__name__)
+
+
+# features appended to POS map tags to obtain full tagger tags
+FEATURES = [ "", "FeSgAc", "MaPlNm", "NeSgGe", "XxIpAvXx", "Sp",
+             "Ba", "Co", "Ac03SgXx", "IdPa03PlXxPeAvXx" ]
+
+
+class FormerTransDictGreek(TransDictGreek):
+    """
+    TransDictGreek with the former way of mapping POS tags
+    """
+
+    def _map_single_pos(self, pos):
+        for from_pos, to_pos in self.pos_map.items():
+            if pos.startswith(from_pos):
+                return to_pos
+        return ""
+
+
+def load_dict(lang_pair, n_synthetic):
+    pkl_fname = config["dict"][lang_pair]["pkl_fname"]
+
+    if os.path.exists(pkl_fname):
+        return TransDict.load(pkl_fname)
+
+    log.warning("dictionary {} not found, making synthetic "
+                "dictionary".format(pkl_fname))
+    cls = TransDictGreek if lang_pair.startswith("gr-") else TransDict
+    trans_dict = cls(pos_map=config["dict"][lang_pair]["posmap_fname"])
+    lex_tags = sorted(set(trans_dict.pos_map.values()))
+    rand = random.Random(lang_pair)
+
+    for i in range(n_synthetic):
+        lemma = u"λέξη{}".format(i)
+        lempos = u"{}/{}".format(lemma, rand.choice(lex_tags))
+        trans_dict._lempos_dict[lempos] = (u"word{}/n".format(i),)
+        trans_dict._lemma_dict[lemma] = (lempos,)
+
+    trans_dict._init_index()
+    return trans_dict
+
+
+def make_keys(trans_dict, n_mwu):
+    """
+    return list of lookup keys with tagger POS tags for the entries of the
+    dictionary, plus multi-word keys of pairs of entries
+    """
+    tagger_tags = {}
+    for from_pos, to_pos in trans_dict.pos_map.items():
+        tagger_tags.setdefault(to_pos, []).append(from_pos)
+
+    greek = isinstance(trans_dict, TransDictGreek)
+    rand = random.Random(0)
+    keys = []
+
+    for lempos in sorted(trans_dict._lempos_dict):
+        pairs = []
+        for pair in lempos.split():
+            lemma, pos = pair.rsplit(trans_dict.delimiter, 1)
+            pos = rand.choice(tagger_tags.get(pos, ["XX"]))
+            if greek:
+                pos += rand.choice(FEATURES)
+            pairs.append(lemma + trans_dict.delimiter + pos)
+        keys.append(u" ".join(pairs))
+
+    singles = [ key for key in keys if " " not in key ]
+    for _ in range(n_mwu):
+        keys.append(u" ".join(rand.sample(singles, 2)))
+
+    return keys
+
+
+def lookup_all(trans_dict, keys):
+    # cold memo of lookups, as for new keys
+    trans_dict._memo.clear()
+    return [ list(trans_dict.get(key, [])) for key in keys ]
+
+
+def bench(lang_pairs, repeat=3, n_mwu=10000, n_synthetic=50000):
+    rows = []
+
+    for lang_pair in lang_pairs:
+        trans_dict = load_dict(lang_pair, n_synthetic)
+        keys = make_keys(trans_dict, n_mwu)
+        log.info("{} lookups in {} dictionary".format(len(keys), lang_pair))
+        variants = [ ("current", trans_dict) ]
+
+        if isinstance(trans_dict, TransDictGreek):
+            former = FormerTransDictGreek.__new__(FormerTransDictGreek)
+            former.__setstate__(trans_dict.__getstate__())
+            variants.insert(0, ("former", former))
+
+        results = []
+
+        for name, variant in variants:
+            best = float("inf")
+            for _ in range(repeat):
+                gc.collect()
+                if isinstance(variant, TransDictGreek):
+                    variant._pos_memo.clear()
+                start = time.time()
+                result = lookup_all(variant, keys)
+                best = min(best, time.time() - start)
+            log.info("{} {} took {:.4f}s".format(lang_pair, name, best))
+            rows.append((lang_pair, name, len(keys), len(keys) / best,
+                         best * 1e6 / len(keys)))
+            results.append(result)
+
+        for result in results[1:]:
+            assert result == results[0]
+
+    dtype = [("dict", "S8"), ("mapping", "S8"), ("lookups", "i"),
+             ("lookups/s", "f"), ("us/lookup", "f")]
+    return np.array(rows, dtype=dtype)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        "lang_pairs",
+        metavar="LANG_PAIR",
+        nargs="*",
+        default=["gr-de", "gr-en", "en-de"],
+        help="language pairs of dictionaries")
+
+    parser.add_argument(
+        "-r", "--repeat",
+        metavar="N",
+        type=int,
+        default=3,
+        help="number of repeats (best time is reported)")
+
+    parser.add_argument(
+        "-m", "--mwu",
+        metavar="N",
+        type=int,
+        default=10000,
+        help="number of multi-word lookups")
+
+    parser.add_argument(
+        "-s", "--synthetic",
+        metavar="N",
+        type=int,
+        default=50000,
+        help="number of entries of a synthetic dictionary")
+
+    args = parser.parse_args()
+    set_default_log()
+    results = bench(args.lang_pairs, args.repeat, args.mwu, args.synthetic)
+    text_table(results)
+    print
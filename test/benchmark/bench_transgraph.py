@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+"""
+Compare memory use and throughput of TransGraph and CompactTransGraph
+
+Memory is measured as the deep size of the Python objects making up the
+graphs (after running all operations, so including any caches and indices)
+and as the size of their pickles. Throughput is measured in source tokens per
+second for typical operations of the pipeline.
+"""
+
+import argparse
+import cPickle
+import gc
+import logging
+import sys
+import time
+
+import numpy as np
+
+from tg.config import config
+from tg.compactgraph import CompactTransGraph
+from tg.utils import set_default_log, text_table
+
+
+log = logging.getLogger(__name__)
+
+
+def deep_size(obj, seen=None):
+    """
+    approximate memory size in bytes of an object and everything it refers
+    to
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, np.ndarray):
+        # getsizeof includes the data buffer only if the array owns it
+        if obj.base is not None:
+            size += obj.nbytes
+    elif isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen)
+                    for k, v in obj.iteritems())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_size(obj.__dict__, seen)
+
+    return size
+
+
+def traverse(graphs):
+    for graph in graphs:
+        for u in graph.source_nodes_iter(ordered=True):
+            graph.lempos(u)
+
+
+def trans_edges(graphs):
+    for graph in graphs:
+        for u in graph.source_nodes_iter():
+            for _, v, data in graph.trans_edges_iter(u):
+                graph.lemma(v)
+
+
+def score(graphs):
+    for graph in graphs:
+        for u in graph.source_nodes_iter():
+            for _, v, data in graph.trans_edges_iter(u):
+                graph.set_score(u, v, "bench_score", 1.0)
+
+
+def max_score(graphs):
+    for graph in graphs:
+        for u in graph.source_nodes_iter():
+            graph.max_score(u, "bench_score")
+
+
+def pickle_graphs(graphs):
+    return cPickle.dumps(graphs, cPickle.HIGHEST_PROTOCOL)
+
+
+OPERATIONS = [traverse, trans_edges, score, max_score, pickle_graphs]
+
+
+def timeit(func, graphs, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.time()
+        func(graphs)
+        best = min(best, time.time() - start)
+    return best
+
+
+def bench(graphs_fname, repeat=3, n_graphs=None):
+    log.info("loading graphs from " + graphs_fname)
+    nx_graphs = cPickle.load(open(graphs_fname))[:n_graphs]
+    compact_graphs = [ CompactTransGraph.from_transgraph(graph)
+                       for graph in nx_graphs ]
+    n_tokens = sum(len(graph.source_nodes()) for graph in nx_graphs)
+    log.info("{} graphs with {} source tokens".format(len(nx_graphs),
+                                                      n_tokens))
+
+    rows = []
+
+    for name, graphs in ("TransGraph", nx_graphs), \
+                        ("CompactTransGraph", compact_graphs):
+        row = [name]
+
+        for func in OPERATIONS:
+            seconds = timeit(func, graphs, repeat)
+            row.append(n_tokens / seconds)
+            log.info("{}: {} took {:.4f}s".format(name, func.__name__,
+                                                  seconds))
+
+        seconds = timeit(lambda graphs: cPickle.loads(pickle_graphs(graphs)),
+                         graphs, repeat)
+        row.append(n_tokens / seconds)
+        row.append(deep_size(graphs) / 1024.0)
+        row.append(len(pickle_graphs(graphs)) / 1024.0)
+        rows.append(tuple(row))
+
+    dtype = ( [("graph", "S24")] +
+              [ (func.__name__ + "_tok/s", "f") for func in OPERATIONS ] +
+              [("unpickle_tok/s", "f"), ("memory_KB", "f"),
+               ("pickle_KB", "f")] )
+    return np.array(rows, dtype=dtype)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        "graphs_fname",
+        metavar="GRAPHS_FILE",
+        nargs="?",
+        default=config["test_data_dir"] +
+        "/graphs_sample_newstest2011-src.en.pkl",
+        help="pickle file containing translation graphs")
+
+    parser.add_argument(
+        "-n", "--n-graphs",
+        metavar="N",
+        type=int,
+        help="use only the first N graphs")
+
+    parser.add_argument(
+        "-r", "--repeat",
+        metavar="N",
+        type=int,
+        default=3,
+        help="number of repeats per operation (best time is reported)")
+
+    args = parser.parse_args()
+    set_default_log()
+    results = bench(args.graphs_fname, args.repeat, args.n_graphs)
+    text_table(results)
+    print
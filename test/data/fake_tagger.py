@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Deterministic stand-in for TreeTagger and the Oslo-Bergen Tagger
+
+Reads text from stdin line by line and writes one line per token to stdout,
+where tokens are separated by whitespace and sentence-final punctuation.
+SGML tags are copied to the output on a line of their own, as TreeTagger
+does. Tokens are tagged as "SENT" if they are sentence-final punctuation
+and as "NN" otherwise; lemmas are lowercased tokens, except that tokens
+containing digits get TreeTagger's "<unknown>" lemma. With --obt, tags
+follow the Oslo-Bergen Tagger instead, so that its sentence boundary
+marker (see tg.annot.OsloBergenTagger) is recognized.
+"""
+
+import argparse
+import re
+import sys
+import time
+
+
+# sentence-final punctuation is split off the end of words
+TOKEN_RE = re.compile(r"<[^<>]+>|[^\s<>]+?(?=[.!?]?(?:[\s<]|$))|[.!?]")
+
+EOS_TOKENS = ".", "!", "?"
+
+
+def tag(token):
+    if token in EOS_TOKENS:
+        return token, "SENT", token
+    elif any(c.isdigit() for c in token):
+        return token, "NN", "<unknown>"
+    else:
+        return token, "NN", token.lower()
+
+
+def tag_obt(token):
+    if token in EOS_TOKENS:
+        return token, "<punkt>_<<<", "$" + token
+    elif token.isupper():
+        return token, "subst_prop", token
+    else:
+        return token, "subst_appell", token.lower()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        "--obt",
+        action="store_true",
+        help="write word, lemma and tag like OBT rather than word, tag "
+        "and lemma like TreeTagger, with an empty line after each sentence")
+
+    parser.add_argument(
+        "--startup",
+        metavar="SECONDS",
+        type=float,
+        default=0.0,
+        help="startup delay, e.g. for loading a parameter file")
+
+    parser.add_argument(
+        "--delay",
+        metavar="SECONDS",
+        type=float,
+        default=0.0,
+        help="delay per token")
+
+    args = parser.parse_args()
+    time.sleep(args.startup)
+    out = sys.stdout
+
+    # readline rather than iteration, which reads ahead and would block
+    for line in iter(sys.stdin.readline, ""):
+        for token in TOKEN_RE.findall(line):
+            if token.startswith("<"):
+                out.write(token + "\n")
+                continue
+
+            if args.delay:
+                time.sleep(args.delay)
+
+            if args.obt:
+                word, pos, lemma = tag_obt(token)
+                out.write("{}\t{}\t{}\n".format(word, lemma, pos))
+                if token in EOS_TOKENS:
+                    out.write("\n")
+            else:
+                word, pos, lemma = tag(token)
+                out.write("{}\t{}\t{}\n".format(word, pos, lemma))
+
+        out.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+test incremental annotation
+"""
+
+import cStringIO
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import types
+import xml.etree.ElementTree as et
+
+from tg.config import config
+from tg.annot import TreeTagger
+from tg.annotcache import AnnotationCache
+
+
+# stand-in tagger which copies SGML tags like TreeTagger
+COMMAND = "{} {}/fake_tagger.py".format(sys.executable,
+                                        config["test_data_dir"])
+
+
+class TestIterAnnotation:
+
+    @classmethod
+    def setup_class(cls):
+        cls.annotator = TreeTagger(COMMAND, "utf-8", eos_pos_tag="SENT")
+
+    def check_graphs(self, graphs, graphs2):
+        assert len(graphs2) == len(graphs)
+
+        for graph, graph2 in zip(graphs, graphs2):
+            assert graph2.graph == graph.graph
+            assert graph2.source_lempos() == graph.source_lempos()
+
+    def test_iter_xml_file(self):
+        xml_fname = config["test_data_dir"] + "/sample_en_1.xml"
+        graphs = self.annotator.annot_xml_file(xml_fname)
+        graphs2 = self.annotator.iter_xml_file(xml_fname, batch_size=3)
+        assert isinstance(graphs2, types.GeneratorType)
+        self.check_graphs(graphs, list(graphs2))
+
+    def test_iter_sentences(self):
+        sentences = [ u"The cat sat on the mat .",
+                      u"Dogs bark !",
+                      u"Cats do not ." ] * 3
+        graphs = self.annotator.annot_sentences(sentences)
+        graphs2 = self.annotator.iter_sentences(iter(sentences),
+                                                batch_size=2)
+        self.check_graphs(graphs, list(graphs2))
+
+    def test_iter_text_file(self):
+        text_fname = config["test_data_dir"] + "/sample_en_1.txt"
+        graphs = self.annotator.annot_text_file(text_fname)
+        graphs2 = list(self.annotator.iter_text_file(text_fname,
+                                                     batch_size=1))
+        self.check_graphs(graphs, graphs2)
+
+    def test_iter_xml_memory(self):
+        segs = "".join('<seg id="{0}">Sentence <b>{0}</b> .</seg>\n'.format(i)
+                       for i in range(5000))
+        source = ( "<refset>\n<doc>\n{0}</doc>\n<doc>\n{0}</doc>\n"
+                   "</refset>\n".format(segs) )
+        pairs = self.annotator._iter_sentences_from_xml(
+            cStringIO.StringIO(source), "seg", "id")
+        n = 0
+
+        for sent, sent_id in pairs:
+            assert (sent, sent_id) == (u"Sentence ", str(n % 5000))
+            n += 1
+
+            if n % 1000 == 0:
+                # parsed segments are not retained by their document, so
+                # only those parsed ahead are in memory
+                assert len([ obj for obj in gc.get_objects()
+                             if isinstance(obj, et.Element) and
+                             obj.tag == "seg" ]) < 1000
+
+        assert n == 10000
+
+    def test_workers(self):
+        xml_fname = config["test_data_dir"] + "/sample_en_1.xml"
+        graphs = self.annotator.annot_xml_file(xml_fname)
+        self.check_graphs(graphs,
+                          self.annotator.annot_xml_file(xml_fname, workers=3))
+        self.check_graphs(graphs,
+                          list(self.annotator.iter_xml_file(
+                              xml_fname, batch_size=2, workers=2)))
+
+        sentences = [ u"Sentence {} .".format(i) for i in range(10) ]
+        self.check_graphs(self.annotator.annot_sentences(sentences),
+                          self.annotator.annot_sentences(sentences,
+                                                         workers=4))
+
+    def test_entities(self):
+        # same tokens for XML input, whether tagged as is, in parallel
+        # batches, with a cache or as sentences
+        source = ( '<doc>\n'
+                   '<seg id="a&amp;b">AT&amp;T buys &lt;it&gt; .</seg>\n'
+                   '<seg id="2">Caf&#233; &quot;Q&quot; .</seg>\n'
+                   '</doc>\n' )
+        expected = [ [u"AT&T", u"buys", u"<it>", u"."],
+                     [u"Caf\xe9", u'"Q"', u"."] ]
+        tmp_dir = tempfile.mkdtemp()
+
+        try:
+            cached = TreeTagger(COMMAND, "utf-8", eos_pos_tag="SENT",
+                                cache=AnnotationCache(
+                                    os.path.join(tmp_dir, "annot.db")))
+            results = [
+                self.annotator.annot_xml_file(cStringIO.StringIO(source)),
+                self.annotator.annot_xml_file(cStringIO.StringIO(source),
+                                              workers=2),
+                cached.annot_xml_file(cStringIO.StringIO(source)),
+                cached.annot_xml_file(cStringIO.StringIO(source)),
+                self.annotator.annot_sentences(
+                    [ u"AT&T buys <it> .", u'Caf\xe9 "Q" .' ],
+                    ids=["a&b", "2"]) ]
+            cached.cache.close()
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        for graphs in results:
+            assert [ g.graph["id"] for g in graphs ] == ["a&b", "2"]
+            assert [ [ d["word"] for _, d in
+                       g.source_nodes_iter(data=True, ordered=True) ]
+                     for g in graphs ] == expected
+
+    def test_empty_segment(self):
+        source = ( '<doc>\n'
+                   '<seg id="1">Dogs bark .</seg>\n'
+                   '<seg id="2"></seg>\n'
+                   '<seg id="3"/>\n'
+                   '</doc>\n' )
+        graphs = self.annotator.annot_xml_file(cStringIO.StringIO(source))
+        assert [ len(g) for g in graphs ] == [3, 0, 0]
+        tmp_dir = tempfile.mkdtemp()
+
+        try:
+            cached = TreeTagger(COMMAND, "utf-8", eos_pos_tag="SENT",
+                                cache=AnnotationCache(
+                                    os.path.join(tmp_dir, "annot.db")))
+            self.check_graphs(graphs, list(self.annotator.iter_xml_file(
+                cStringIO.StringIO(source), batch_size=2)))
+            self.check_graphs(graphs, self.annotator.annot_xml_file(
+                cStringIO.StringIO(source), workers=2))
+
+            for _ in range(2):
+                self.check_graphs(graphs, cached.annot_xml_file(
+                    cStringIO.StringIO(source)))
+            cached.cache.close()
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_parse_output(self):
+        lines = [ u"<doc>",
+                  u'<seg id="1">',
+                  u"Tom\tNP\tTom",
+                  u"&\tCC\t&",
+                  u"&amp;\tCC\t&amp;",
+                  u"Jerry3\tNP\t<unknown>",
+                  u"</seg>",
+                  u"outside\tNN\toutside",
+                  u"<seg id='2'/>",
+                  u'<seg id="3">',
+                  u"",
+                  u"<\tSYM\t<",
+                  u"</seg>",
+                  u"</doc>" ]
+        graphs = self.annotator._extract_sentences_from_output(lines, "seg",
+                                                               "id")
+        assert [ g.graph["id"] for g in graphs ] == ["1", "2", "3"]
+        assert isinstance(graphs[0].graph["id"], str)
+        # entities are unescaped
+        assert graphs[0].source_lemmas() == [u"Tom", u"&", u"&",
+                                             u"Jerry3"]
+        assert graphs[1].source_lemmas() == []
+        assert graphs[2].source_lempos() == [u"</SYM"]
+
+    def test_stats(self):
+        sentences = [ u"The cat sat on the mat .", u"Dogs bark at 3 cats !" ]
+
+        for pool_size in 0, 1:
+            annotator = TreeTagger(COMMAND, "utf-8", eos_pos_tag="SENT",
+                                   pool_size=pool_size)
+            annotator.annot_sentences(sentences)
+            annotator.annot_text(u" ".join(sentences))
+            stats = annotator.stats
+            assert stats.sentences == 4
+            assert stats.tokens == 26
+            assert stats.unknown_lemmas == 2
+            assert stats.bytes_in > 0
+            assert stats.bytes_out > stats.bytes_in
+            assert stats.seconds["tagger"] > 0
+            assert all( t >= 0 for t in stats.seconds.values() )
+            assert "tokens per second" in stats.report()
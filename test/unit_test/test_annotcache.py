@@ -0,0 +1,82 @@
+"""
+test cache of annotated sentences
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+from nose.tools import assert_raises
+
+from tg.config import config
+from tg.annot import TreeTagger
+from tg.annotcache import AnnotationCache
+from tg.exception import TGException
+
+
+# stand-in tagger which copies SGML tags like TreeTagger
+COMMAND = "{} {}/fake_tagger.py".format(sys.executable,
+                                        config["test_data_dir"])
+
+
+class TestAnnotationCache:
+
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_fname = os.path.join(self.tmp_dir, "cache", "annot.db")
+
+    def teardown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_cache(self):
+        xml_fname = config["test_data_dir"] + "/sample_en_1.xml"
+        graphs = TreeTagger(COMMAND, "utf-8").annot_xml_file(xml_fname)
+
+        cache = AnnotationCache(self.cache_fname)
+        annotator = TreeTagger(COMMAND, "utf-8", cache=cache)
+        cold_graphs = annotator.annot_xml_file(xml_fname)
+        assert cache.hits == 0
+        assert len(cache) == len(graphs)
+        cache.close()
+
+        # warm run must not call the tagger
+        cache = AnnotationCache(self.cache_fname)
+        annotator = TreeTagger(COMMAND, "utf-8", cache=cache)
+        annotator._annot_sentences = None
+        warm_graphs = list(annotator.iter_xml_file(xml_fname, batch_size=3))
+        assert cache.hits == len(graphs)
+        assert cache.misses == 0
+
+        for graph_list in cold_graphs, warm_graphs:
+            assert [ g.graph for g in graph_list ] == [ g.graph for g in graphs ]
+            assert ( [ sorted(g.nodes(data=True)) for g in graph_list ] ==
+                     [ sorted(g.nodes(data=True)) for g in graphs ] )
+            assert ( [ g.source_lempos() for g in graph_list ] ==
+                     [ g.source_lempos() for g in graphs ] )
+
+    def test_partial(self):
+        sentences = [ u"The cat sat .", u"Dogs bark !" ]
+        annotator = TreeTagger(COMMAND, "utf-8", cache=self.cache_fname)
+        annotator.annot_sentences(sentences[:1])
+        graphs = annotator.annot_sentences(sentences, ids=["a", "b"])
+        assert annotator.cache.hits == 1
+        assert [ g.graph["id"] for g in graphs ] == ["a", "b"]
+        assert [ g.graph["n"] for g in graphs ] == [1, 2]
+        assert graphs[1].source_lemmas() == [u"dogs", u"bark", u"!"]
+
+        # tokens with full tag, as produced by the Oslo-Bergen Tagger
+        graph = annotator._graph_from_tokens(
+            ((u"Hun", u"hun", u"pron", u"pron_fem"),), "c", 3)
+        assert annotator._graph_tokens(graph) == \
+            ((u"Hun", u"hun", u"pron", u"pron_fem"),)
+
+    def test_count_mismatch(self):
+        # sentence split in two by the tagger
+        annotator = TreeTagger(COMMAND, "utf-8", eos_pos_tag="SENT",
+                               cache=self.cache_fname)
+        annotator._annot_sentences = lambda sentences, ids: \
+            annotator.annot_text(u" ".join(sentences))
+        assert_raises(TGException, annotator.annot_sentences,
+                      [u"Dogs bark . Cats do not ."])
+        assert len(annotator.cache) == 0
@@ -3,11 +3,12 @@ unit test for classscore
 """
 
 import cPickle
+from cPickle import loads, dumps, HIGHEST_PROTOCOL
 
 import h5py
 
 from tg.config import config
-from tg.classcore import ClassifierScore, Vectorizer
+from tg.classcore import ClassifierScore, Vectorizer, vocab_fingerprint
 from tg.classify import TranslationClassifier
 from tg.format import TextFormat
 
@@ -82,6 +83,31 @@ class TestVectorizer:
         # NB "have" and "own" are not in vocab
         assert m[3, self.vocab["experience"]] == 1.0
 
+        
+    def test_vocab_columns(self):
+        graph = loads(dumps(self.graph, HIGHEST_PROTOCOL))
+        vectorizer = Vectorizer()
+        vectorizer.precompute([graph], self.vocab)
+        fingerprint = vocab_fingerprint(self.vocab)
+        columns = graph.vocab_columns(fingerprint)
+        
+        for _, v, _ in graph.trans_edges_iter():
+            assert columns.get(v) == self.vocab.get(graph.lemma(v))
+            
+        # columns are reused for an equal vocab and survive pickling 
+        graph = loads(dumps(graph, HIGHEST_PROTOCOL))
+        vocab = dict(self.vocab)
+        assert vocab_fingerprint(vocab) == fingerprint
+        assert Vectorizer().vocab_columns(graph, vocab) is \
+            graph.vocab_columns(fingerprint)
+        assert ( (vectorizer(graph, vocab) != 
+                  vectorizer(self.graph, self.vocab)).nnz == 0 )
+        # but not when translations change
+        graph.add_translation_edge(graph.source_start_node,
+                                   graph.add_target_node(lemma=u"x", 
+                                                         pos=u"y"))
+        assert graph.vocab_columns(fingerprint) is None
+        
 
 class TestClassifierScore:
     
@@ -0,0 +1,225 @@
+"""
+test array-backed translation graphs
+"""
+
+from cPickle import load, loads, dumps, HIGHEST_PROTOCOL
+
+import numpy as np
+
+from tg.config import config
+from tg.bestscore import BestScorer
+from tg.compactgraph import CompactTransGraph
+from tg.lookup import Lookup
+from tg.format import TextFormat
+from tg.accuracy import accuracy_score
+
+
+class TestCompactTransGraph:
+
+    @classmethod
+    def setup_class(cls):
+        graphs_fname = config["test_data_dir"] + "/graphs_sample_out_de-en.pkl"
+        cls.nx_graphs = load(open(graphs_fname))
+        cls.graphs = [ CompactTransGraph.from_transgraph(graph)
+                       for graph in cls.nx_graphs ]
+
+    def test_source_nodes(self):
+        for nx_graph, graph in zip(self.nx_graphs, self.graphs):
+            assert graph.graph == nx_graph.graph
+            assert graph.source_words() == nx_graph.source_words()
+            assert graph.source_lempos() == nx_graph.source_lempos()
+            assert ( len(graph.source_nodes()) ==
+                     len(nx_graph.source_nodes()) )
+
+    def test_trans_edges(self):
+        for nx_graph, graph in zip(self.nx_graphs, self.graphs):
+            assert len(graph) == len(nx_graph)
+            assert graph.number_of_edges() == nx_graph.number_of_edges()
+
+            for nx_u, u in zip(nx_graph.source_nodes(ordered=True),
+                               graph.source_nodes(ordered=True)):
+                assert ( self._translations(nx_graph, nx_u) ==
+                         self._translations(graph, u) )
+
+    def test_hyper_nodes(self):
+        for nx_graph, graph in zip(self.nx_graphs, self.graphs):
+            nx_lempos = sorted(nx_graph.lempos(u) for u in nx_graph
+                               if nx_graph.is_hyper_target_node(u))
+            lempos = sorted(graph.lempos(u) for u in graph
+                            if graph.is_hyper_target_node(u))
+            assert lempos == nx_lempos
+
+    def test_typed_edges(self):
+        for nx_graph, graph in zip(self.nx_graphs, self.graphs):
+            for name, nx_edges, edges in [
+                ("trans", nx_graph.trans_edges_iter(),
+                 graph.trans_edges_iter()),
+                ("next", nx_graph.word_order_edges_iter(),
+                 graph.word_order_edges_iter()),
+                ("part", nx_graph.part_edges_iter(),
+                 graph.part_edges_iter()) ]:
+                assert ( sorted( (nx_graph.lempos(u), nx_graph.lempos(v))
+                                 for u, v, _ in nx_edges ) ==
+                         sorted( (graph.lempos(u), graph.lempos(v))
+                                 for u, v, _ in edges ) )
+
+            for u in graph:
+                if graph.is_hyper_source_node(u):
+                    assert ( [ v for v, _, _ in graph.part_edges_iter(u) ] ==
+                             list(graph.source_parts_iter(u)) )
+
+    def test_trans_edge_arrays(self):
+        for graph in self.graphs:
+            sources, targets, data = graph.trans_edge_arrays()
+            assert ( zip(sources, targets, data) ==
+                     list(graph.trans_edges_iter()) )
+
+    def test_score_column(self):
+        for nx_graph, graph in zip(self.nx_graphs, self.graphs):
+            nx_sources, nx_targets = nx_graph.trans_edge_arrays(data=False)
+            sources, targets = graph.trans_edge_arrays(data=False)
+            nx_order = np.lexsort(([ nx_graph.lempos(v) for v in nx_targets ],
+                                   [ nx_graph.lempos(u) for u in nx_sources ]))
+            order = np.lexsort(([ graph.lempos(v) for v in targets ],
+                                [ graph.lempos(u) for u in sources ]))
+            np.testing.assert_array_equal(
+                nx_graph.score_column("freq_score")[nx_order],
+                graph.score_column("freq_score")[order])
+
+    def test_score_writes(self):
+        graph = self.graphs[0].copy()
+        u = graph.source_start_node
+        score, v = graph.max_score(u, "freq_score")
+        # scores written through the data dict are stored in a column and
+        # invalidate cached max scores
+        graph.edge[u][v]["freq_score"] = -1.0
+        score, v2 = graph.max_score(u, "freq_score")
+        assert v2 != v
+        scores = graph.score_column("freq_score")
+        assert (scores == -1.0).sum() == 1
+        graph.set_score_column("freq_score", scores + 10.0)
+        assert graph.max_score(u, "freq_score") == (score + 10.0, v2)
+        # non-numerical values are kept in the data dict
+        graph.edge[u][v]["freq_score"] = "x"
+        assert graph.edge[u][v]["freq_score"] == "x"
+        assert np.isnan(graph.score_column("freq_score")).sum() == 1
+        del graph.edge[u][v]["freq_score"]
+        assert "freq_score" not in graph.edge[u][v]
+
+    def test_int_attrs(self):
+        graph = self.graphs[0].copy()
+        u = graph.source_start_node
+        v = graph.trans_edges_iter(u).next()[1]
+        data = graph.edge[u][v]
+        data["count"] = 3
+        data["big_count"] = 2 ** 60
+        # integers round-trip like in TransGraph, also when pickled
+        for graph2 in graph, loads(dumps(graph, HIGHEST_PROTOCOL)):
+            data = graph2.edge[u][v]
+            assert type(data["count"]) is int and data["count"] == 3
+            assert data["big_count"] == 2 ** 60
+            assert graph2.max_score(u, "count") == (3, v)
+            assert type(graph2.max_score(u, "count")[0]) is int
+        # a float makes the column hold floats
+        graph.edge[u][v]["count"] = 0.5
+        assert graph.edge[u][v]["count"] == 0.5
+
+    def test_best_score(self):
+        scorer = BestScorer(base_score_attrs=["dup_score", "freq_score"])
+        nx_graphs = [ graph.to_transgraph() for graph in self.graphs ]
+        graphs = [ graph.copy() for graph in self.graphs ]
+        scorer(nx_graphs)
+        scorer(graphs)
+
+        for nx_graph, graph in zip(nx_graphs, graphs):
+            for nx_u, u in zip(nx_graph.source_nodes(ordered=True),
+                               graph.source_nodes(ordered=True)):
+                assert ( nx_graph.max_score(nx_u, "best_score")[0] ==
+                         graph.max_score(u, "best_score")[0] )
+
+    def test_max_score(self):
+        for nx_graph, graph in zip(self.nx_graphs, self.graphs):
+            for nx_u, u in zip(nx_graph.source_nodes(ordered=True),
+                               graph.source_nodes(ordered=True)):
+                nx_score, nx_v = nx_graph.max_score(nx_u, "freq_score")
+                score, v = graph.max_score(u, "freq_score")
+                assert score == nx_score
+                if v is not None:
+                    assert graph.lempos(v) == nx_graph.lempos(nx_v)
+
+    def test_format(self):
+        nx_format = TextFormat(score_attr="freq_score")
+        nx_format(self.nx_graphs)
+        format = TextFormat(score_attr="freq_score")
+        format(self.graphs)
+        assert format.out_str == nx_format.out_str
+
+    def test_accuracy(self):
+        ref_fname = config["test_data_dir"] + "/lemma_sample_out_de-en.ref"
+        assert ( accuracy_score(self.graphs, ref_fname, "freq_score") ==
+                 accuracy_score(self.nx_graphs, ref_fname, "freq_score") )
+
+    def test_pickle(self):
+        for graph in self.graphs:
+            graph2 = loads(dumps(graph, HIGHEST_PROTOCOL))
+            assert graph2.source_lempos() == graph.source_lempos()
+            assert ( [ data for _, _, data in graph2.trans_edges_iter() ] ==
+                     [ data for _, _, data in graph.trans_edges_iter() ] )
+            # graph must still be extendible
+            u = graph2.add_target_node(lemma=u"x", pos=u"y")
+            graph2.add_translation_edge(graph2.source_start_node, u)
+            assert graph2.lempos(u) == u"x/y"
+
+    def test_copy(self):
+        graph = self.graphs[0]
+        graph2 = graph.copy()
+
+        for _, _, data in graph2.trans_edges_iter():
+            data["copy_score"] = 1.0
+
+        for _, _, data in graph.trans_edges_iter():
+            assert "copy_score" not in data
+
+    def test_to_transgraph(self):
+        for nx_graph, graph in zip(self.nx_graphs, self.graphs):
+            nx_graph2 = graph.to_transgraph()
+            assert nx_graph2.source_lempos() == nx_graph.source_lempos()
+            assert len(nx_graph2) == len(nx_graph)
+
+            for nx_u, nx_u2 in zip(nx_graph.source_nodes(ordered=True),
+                                   nx_graph2.source_nodes(ordered=True)):
+                assert ( self._translations(nx_graph, nx_u) ==
+                         self._translations(nx_graph2, nx_u2) )
+
+    def test_lookup(self):
+        dict_fname = config["test_data_dir"] + "/dict_sample_out_de-en.pkl"
+        lookup = Lookup(load(open(dict_fname)))
+
+        for nx_graph in self.nx_graphs:
+            # new graph with source nodes only
+            graph = CompactTransGraph(**nx_graph.graph)
+            prev_node = None
+
+            for _, data in nx_graph.source_nodes_iter(data=True,
+                                                      ordered=True):
+                u = graph.add_source_node(word=data["word"],
+                                          lemma=data["lemma"],
+                                          pos=data["pos"])
+                if prev_node is None:
+                    graph.set_source_start_node(u)
+                else:
+                    graph.add_word_order_edge(prev_node, u)
+                prev_node = u
+
+            lookup(graph)
+
+            for nx_u, u in zip(nx_graph.source_nodes(ordered=True),
+                               graph.source_nodes(ordered=True)):
+                assert ( graph.node[u].get("lex_lempos") ==
+                         nx_graph.node[nx_u].get("lex_lempos") )
+                assert ( set(self._translations(nx_graph, nx_u)) ==
+                         set(self._translations(graph, u)) )
+
+    def _translations(self, graph, u):
+        return sorted( graph.lempos(v)
+                       for _, v, _ in graph.trans_edges_iter(u) )
@@ -0,0 +1,170 @@
+"""
+test memory-mapped graph corpus
+"""
+
+from cPickle import load, loads, dumps, HIGHEST_PROTOCOL
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from nose.tools import assert_raises
+
+from tg import symbols
+from tg.config import config
+from tg.exception import TGException
+from tg.corpus import ( GraphCorpus, write_corpus, load_graphs, save_graphs,
+                        save_scores, overlay_scores, load_scored_graphs )
+
+
+class TestGraphCorpus:
+
+    @classmethod
+    def setup_class(cls):
+        graphs_fname = config["test_data_dir"] + "/graphs_sample_out_de-en.pkl"
+        cls.graphs = load(open(graphs_fname))
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.corpus_fname = os.path.join(cls.tmp_dir, "graphs.tgc")
+        write_corpus(cls.graphs, cls.corpus_fname)
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_round_trip(self):
+        corpus = GraphCorpus(self.corpus_fname)
+        assert len(corpus) == len(self.graphs)
+
+        for graph, graph2 in zip(self.graphs, corpus):
+            assert graph2.graph == graph.graph
+            assert sorted(graph2.nodes(data=True)) == \
+                sorted(graph.nodes(data=True))
+            assert sorted(graph2.edges(data=True)) == \
+                sorted(graph.edges(data=True))
+            assert ( graph2.source_nodes(ordered=True) ==
+                     graph.source_nodes(ordered=True) )
+            assert graph2._parts == graph._parts
+            # new nodes must not clash with decoded ones
+            assert graph2.add_target_node(lemma="x", pos="y") not in graph
+
+    def test_lazy_access(self):
+        corpus = GraphCorpus(self.corpus_fname)
+        graphs = corpus[1:3]
+        assert [ g.graph for g in graphs ] == \
+            [ g.graph for g in self.graphs[1:3] ]
+        assert corpus[-1].graph == self.graphs[-1].graph
+        graph_id = self.graphs[2].graph["id"]
+        assert corpus.graph_index(graph_id) == 2
+        assert ( corpus.get_graph(graph_id).source_lempos() ==
+                 self.graphs[2].source_lempos() )
+
+    def test_score_column(self):
+        corpus = GraphCorpus(self.corpus_fname)
+        start, end = corpus.edge_range(0)
+        scores = corpus.score_column("freq_score")[start:end]
+        scores = scores[~np.isnan(scores)]
+        np.testing.assert_array_equal(
+            np.sort(scores),
+            np.sort(self.graphs[0].score_column("freq_score")))
+
+    def test_extras(self):
+        graphs = loads(dumps(self.graphs[:2], HIGHEST_PROTOCOL))
+        u = graphs[1].source_start_node
+        graphs[1].node[u]["best_nodes"] = {"freq_score": ["t1"]}
+        v = graphs[1].trans_edges_iter(u).next()[1]
+        graphs[1].edge[u][v]["note"] = "test"
+        corpus_fname = os.path.join(self.tmp_dir, "extras.tgc")
+        write_corpus(graphs, corpus_fname)
+        graph = GraphCorpus(corpus_fname)[1]
+        assert graph.node[u]["best_nodes"] == {"freq_score": ["t1"]}
+        assert graph.edge[u][v]["note"] == "test"
+
+    def test_numeric_types(self):
+        graphs = loads(dumps(self.graphs[:2], HIGHEST_PROTOCOL))
+
+        for i, (u, v, data) in enumerate(graphs[0].trans_edges_iter()):
+            data["count"] = i
+            data["big_count"] = 2 ** 60 + i
+            data["mixed"] = i if i % 2 else i + 0.5
+
+        corpus_fname = os.path.join(self.tmp_dir, "types.tgc")
+        write_corpus(graphs, corpus_fname)
+        graph = GraphCorpus(corpus_fname)[0]
+
+        for u, v, data in graphs[0].trans_edges_iter():
+            data2 = graph.edge[u][v]
+            assert data2 == data
+            assert type(data2["count"]) is int
+            assert type(data2["big_count"]) is type(data["big_count"])
+
+        for u, data in graph.nodes_iter(data=True):
+            if "lemma" in data:
+                assert data["lemma"] is symbols.lemmas.intern(data["lemma"])
+                assert data["pos"] is symbols.pos_tags.intern(data["pos"])
+
+    def test_load_save(self):
+        pkl_fname = os.path.join(self.tmp_dir, "graphs.pkl")
+        save_graphs(load_graphs(self.corpus_fname, 3), pkl_fname)
+        graphs = load_graphs(pkl_fname)
+        assert len(graphs) == 3
+        assert ( [ g.source_lempos() for g in graphs ] ==
+                 [ g.source_lempos() for g in self.graphs[:3] ] )
+
+    def test_score_sidecar(self):
+        graphs = loads(dumps(self.graphs, HIGHEST_PROTOCOL))
+
+        for graph in graphs:
+            graph.set_score_column("test_score",
+                                   -graph.score_column("freq_score"))
+
+        scores_fname = os.path.join(self.tmp_dir, "scores.npz")
+        save_scores(graphs, ["test_score"], scores_fname)
+        # overlay on a subset of the shared graphs
+        graphs2 = overlay_scores(GraphCorpus(self.corpus_fname)[2:],
+                                 scores_fname)
+
+        for graph, graph2 in zip(graphs[2:], graphs2):
+            np.testing.assert_array_equal(graph2.score_column("test_score"),
+                                          graph.score_column("test_score"))
+
+        # combine sidecars using the same score attribute
+        graphs2 = load_scored_graphs(self.corpus_fname,
+                                     [scores_fname, scores_fname],
+                                     renames=[{}, {"test_score": "score2"}])
+        for graph in graphs2:
+            np.testing.assert_array_equal(graph.score_column("score2"),
+                                          graph.score_column("test_score"))
+
+
+def test_score_sidecar_across_formats():
+    # order of translation edges differs between pickle and corpus
+    pkl_fname = ( config["test_data_dir"] +
+                  "/graphs_sample_newstest2011-src.en.pkl" )
+    graphs = load(open(pkl_fname))
+    tmp_dir = tempfile.mkdtemp()
+
+    try:
+        corpus_fname = os.path.join(tmp_dir, "graphs.tgc")
+        write_corpus(graphs, corpus_fname)
+        scores_fname = os.path.join(tmp_dir, "scores.npz")
+
+        for graph in graphs:
+            for k, (u, v, data) in enumerate(graph.trans_edges_iter()):
+                graph.set_score(u, v, "test_score", float(k))
+
+        save_scores(graphs, ["test_score"], scores_fname)
+        graphs2 = load_scored_graphs(corpus_fname, [scores_fname])
+
+        for graph, graph2 in zip(graphs, graphs2):
+            for u, v, data in graph.trans_edges_iter():
+                assert graph2.edge[u][v]["test_score"] == data["test_score"]
+
+        # edges not matching those in the sidecar
+        graph = graphs2[0]
+        u, v, _ = graph.trans_edges_iter().next()
+        graph.remove_edge(u, v)
+        graph.add_translation_edge(u, graph.add_target_node(lemma="x",
+                                                            pos="y"))
+        assert_raises(TGException, overlay_scores, [graph], scores_fname)
+    finally:
+        shutil.rmtree(tmp_dir)
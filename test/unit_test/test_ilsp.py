@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+"""
+test concurrent annotation with the ILSP NLP web service, using a local
+stand-in for the service
+"""
+
+import BaseHTTPServer
+import threading
+import time
+import xml.etree.ElementTree as et
+from xml.sax.saxutils import quoteattr
+
+from nose.tools import assert_raises
+
+from tg.annot import ILSP_NLP_Greek
+from tg.exception import TGException
+
+
+class Obj(object):
+    pass
+
+
+class Factory(object):
+
+    def create(self, name):
+        obj = Obj()
+        if name == "ns3:Map":
+            obj.item = []
+        return obj
+
+
+class FakeService(object):
+    """
+    Stand-in for the Soaplab service of ILSP NLP, where each job takes
+    job_time seconds and its XCES output is served over HTTP
+    """
+
+    def __init__(self, job_time, port):
+        self.job_time = job_time
+        self.url = "http://127.0.0.1:{}/".format(port)
+        self.outputs = {}
+        self.finish_times = {}
+        self.lock = threading.Lock()
+        self.max_running = 0
+
+    def createAndRun(self, param_map):
+        items = dict( (item.key, item.value) for item in param_map.item )
+        assert items["InputType"] == "xcesbasic"
+
+        with self.lock:
+            job_id = "job{}".format(len(self.outputs))
+            self.outputs[job_id] = self.annotate(items["input_direct_data"])
+            self.finish_times[job_id] = time.time() + self.job_time
+            self.max_running = max(self.max_running, self.running())
+
+        return job_id
+
+    def running(self):
+        now = time.time()
+        return sum(t > now for t in self.finish_times.values())
+
+    def waitFor(self, job_id):
+        raise AssertionError("blocking call")
+
+    def getStatus(self, job_id):
+        if time.time() < self.finish_times[job_id]:
+            return "RUNNING"
+        return "COMPLETED"
+
+    def getResults(self, job_id):
+        results = []
+        for value in self.url + job_id, "0", "report":
+            result = Obj()
+            result.value = value
+            results.append(result)
+        return [results]
+
+    def annotate(self, input_data):
+        parts = [u'<cesDoc xmlns="http://www.xces.org/schema/2003">'
+                 u"<text><body>"]
+
+        for elem in et.fromstring(input_data.encode("utf-8")).iter("p"):
+            parts.append(u"<p id={}><s>".format(quoteattr(elem.get("id"))))
+            for word in elem.text.split():
+                parts.append(u"<t word={} lemma={} tag={}/>".format(
+                    quoteattr(word), quoteattr(word.lower()),
+                    quoteattr(u"NoCm")))
+            parts.append(u"</s></p>")
+
+        parts.append(u"</body></text></cesDoc>")
+        return u"".join(parts).encode("utf-8")
+
+
+class FakeClient(object):
+
+    def __init__(self, service):
+        self.service = service
+        self.factory = Factory()
+
+
+class TestILSP:
+
+    @classmethod
+    def setup_class(cls):
+        outputs = {}
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                self.send_response(200)
+                self.end_headers()
+                self.wfile.write(outputs[self.path.strip("/")])
+
+            def log_message(self, *args):
+                pass
+
+        cls.server = BaseHTTPServer.HTTPServer(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=cls.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        cls.service = FakeService(0.2, cls.server.server_port)
+        cls.service.outputs = outputs
+
+    @classmethod
+    def teardown_class(cls):
+        cls.server.shutdown()
+
+    def test_concurrent_jobs(self):
+        annotator = ILSP_NLP_Greek(client=FakeClient(self.service),
+                                   max_jobs=3)
+        annotator.poll_delay = 0.01
+        sentences = [ u"Η γάτα {} κάθεται .".format(i) for i in range(12) ]
+        ids = [ "s{}".format(i) for i in range(12) ]
+
+        start = time.time()
+        graphs = list(annotator.iter_sentences(sentences, ids=ids,
+                                               batch_size=2, workers=6))
+        seconds = time.time() - start
+
+        # 6 jobs of 0.2s, at most 3 at a time
+        assert self.service.max_running == 3
+        assert seconds < 0.2 * 6
+        assert [ g.graph["id"] for g in graphs ] == ids
+        assert [ g.graph["n"] for g in graphs ] == range(1, 13)
+        assert graphs[5].source_lemmas() == sentences[5].lower().split()
+        assert ( [ g.source_lempos() for g in graphs ] ==
+                 [ g.source_lempos() for g in
+                   annotator.annot_sentences(sentences, ids=ids) ] )
+
+    def test_max_wait(self):
+        # job stuck in running state
+        service = FakeService(3600, self.server.server_port)
+        annotator = ILSP_NLP_Greek(client=FakeClient(service), max_jobs=1)
+        annotator.poll_delay = 0.01
+        annotator.max_wait = 0.1
+
+        start = time.time()
+        assert_raises(TGException, annotator.annot_sentences,
+                      [u"Η γάτα κάθεται ."])
+        assert time.time() - start < 1.0
+        # job slot is released
+        assert annotator._job_slots.acquire(False)
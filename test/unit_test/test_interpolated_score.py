@@ -31,4 +31,13 @@ class TestInterpolatedScore(unittest.TestCase):
                     for _, s_tn, s_meta in sg.trans_edges_iter(sn):
                         if s_tn == tn:
                             assert s_meta[scorer.score_attr] == 0.8 * meta['centroid_score'] + 0.2 * meta['freq_score']
-                            break
\ No newline at end of file
+                            break
+
+    def test_no_score_attrs(self):
+        # zero score for every edge, as an empty weighted sum
+        scorer = InterpolatedScore(score_attrs = [])
+        scored_graphs = scorer(self.graphs, copy = True)
+
+        for sg in scored_graphs:
+            for _, _, s_meta in sg.trans_edges_iter():
+                assert s_meta[scorer.score_attr] == 0.0
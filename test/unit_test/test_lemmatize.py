@@ -0,0 +1,39 @@
+"""
+test streaming lemmatization of reference translations
+"""
+
+import cStringIO
+import sys
+import xml.etree.ElementTree as et
+
+from tg.config import config
+from tg.annot import TreeTagger
+from tg.eval import _lemmatize
+
+
+COMMAND = "{} {}/fake_tagger.py".format(sys.executable,
+                                        config["test_data_dir"])
+
+
+def test_lemmatize():
+    ref_fname = config["test_data_dir"] + "/sample_newstest2011-ref.de.sgm"
+    annotator = TreeTagger(COMMAND, "utf-8", eos_pos_tag="SENT")
+    annotator.batch_size = 7
+    outf = cStringIO.StringIO()
+    _lemmatize(annotator, ref_fname, outf, "seg", "utf-8", workers=3)
+
+    # compare with lemmatizing the whole tree at once
+    etree = et.ElementTree(file=ref_fname)
+    sentences = [ elem.text for elem in etree.iter("seg") ]
+    graphs = TreeTagger(COMMAND, "utf-8").annot_sentences(sentences)
+    for elem, graph in zip(etree.iter("seg"), graphs):
+        elem.text = " ".join(graph.source_lemmas())
+    expected = cStringIO.StringIO()
+    etree.write(expected, encoding="utf-8")
+
+    result = et.fromstring(outf.getvalue())
+    expected = et.fromstring(expected.getvalue())
+    assert len(sentences) > annotator.batch_size * 3
+    assert annotator.stats.sentences == len(sentences)
+    assert ( [ (e.tag, e.attrib, e.text, e.tail) for e in result.iter() ] ==
+             [ (e.tag, e.attrib, e.text, e.tail) for e in expected.iter() ] )
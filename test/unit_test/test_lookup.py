@@ -4,7 +4,7 @@
 test lookup
 """
 
-from cPickle import load
+from cPickle import load, loads, dumps
 
 from tg.config import config
 from tg.annot import TreeTaggerGerman
@@ -38,6 +38,29 @@ class TestLookup:
                 assert ( self._translations_in_graph(graph, sn) ==
                          self._translations_in_dict(graph, sn) )
 
+    def test_dedup(self):
+        graphs = loads(dumps(self.graphs, -1))
+        lookup = Lookup(self.dict)
+        lookup(graphs)
+        stats = lookup.stats
+        assert stats.graphs == len(graphs)
+        assert 0 < stats.distinct_hits <= stats.distinct_n_grams
+        assert stats.distinct_n_grams < stats.n_grams
+        assert 0 < stats.hit_rate < 1
+        assert "hit rate" in stats.report()
+        
+        # same graphs without deduplication
+        other_graphs = loads(dumps(self.graphs, -1))
+        lookup = Lookup(self.dict, dedup=False)
+        lookup(other_graphs)
+        assert lookup.stats is None
+            
+        for graph, other in zip(graphs, other_graphs):
+            assert ( sorted(graph.nodes(data=True)) == 
+                     sorted(other.nodes(data=True)) )
+            assert ( sorted(graph.edges(data=True)) == 
+                     sorted(other.edges(data=True)) )
+
     def _translations_in_graph(self, graph, sn):
         """
         get all translation for source node from dictionary
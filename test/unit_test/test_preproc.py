@@ -0,0 +1,44 @@
+"""
+test sharing of source annotation in preprocessing
+"""
+
+import sys
+
+from tg.config import config
+from tg.annot import TreeTagger
+from tg.exps.preproc import _group_lang_pairs, _GraphSpool
+
+
+COMMAND = "{} {}/fake_tagger.py".format(sys.executable,
+                                        config["test_data_dir"])
+
+
+def test_group_lang_pairs():
+    groups = _group_lang_pairs("presemt-dev",
+                               ["gr-en", "de-en", "gr-de", "no-de", "no-en"])
+    assert [ (lang, pairs) for lang, _, pairs in groups ] == [
+        ("gr", ["gr-en", "gr-de"]),
+        ("de", ["de-en"]),
+        ("no", ["no-de", "no-en"]) ]
+    assert groups[0][1].endswith("EL200_dev-src.xml")
+    assert _group_lang_pairs("presemt-dev", []) == []
+
+
+def test_graph_spool():
+    xml_fname = config["test_data_dir"] + "/sample_en_1.xml"
+    annotator = TreeTagger(COMMAND, "utf-8")
+    graphs = annotator.annot_xml_file(xml_fname)
+    annotator = TreeTagger(COMMAND, "utf-8")
+    spool = _GraphSpool(annotator.iter_xml_file(xml_fname), batch_size=2)
+
+    first = list(spool)
+    # graphs of later passes are unaffected by changes to earlier ones
+    for graph in first:
+        graph.graph["id"] = None
+    second = list(spool)
+    spool.close()
+
+    assert annotator.stats.sentences == len(graphs)
+    assert [ g.graph for g in second ] == [ g.graph for g in graphs ]
+    assert ( [ g.source_lempos() for g in second ] ==
+             [ g.source_lempos() for g in graphs ] )
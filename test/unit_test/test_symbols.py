@@ -0,0 +1,36 @@
+"""
+test symbol tables
+"""
+
+from tg.symbols import SymbolTable, LemposTable, lookup
+
+
+class TestSymbolTable:
+
+    def test_ids(self):
+        table = SymbolTable([u"a", u"b"])
+        assert table.id(u"b") == 1
+        assert table.id(u"c") == 2
+        assert table.get(u"d") == -1
+        assert u"d" not in table
+        assert table.string(2) == u"c"
+        s = u"".join([u"a", u"b"])
+        assert table.intern(s) is table.intern(u"ab")
+
+    def test_lookup_array(self):
+        table = SymbolTable([u"a"])
+        a = table.lookup_array({u"b": 3, u"c": 4})
+        assert len(a) == 3
+        assert lookup(a, table.id(u"a")) == -1
+        assert lookup(a, table.id(u"b")) == 3
+        assert lookup(a, table.id(u"c")) == 4
+        # strings interned later are missing
+        assert lookup(a, table.id(u"d")) == -1
+
+    def test_lempos(self):
+        table = LemposTable(SymbolTable(), SymbolTable())
+        i = table.lempos_id(u"house", u"NN")
+        assert table.lempos(u"house", u"NN") == u"house/NN"
+        assert table.lempos(u"house", u"NN") is table.string(i)
+        assert table.id(u"house/NN") == i
+        assert u"house" in table.lemmas and u"NN" in table.pos_tags
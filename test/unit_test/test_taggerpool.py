@@ -0,0 +1,112 @@
+"""
+test pools of tagger processes
+"""
+
+import sys
+import threading
+
+from tg.config import config
+from tg.annot import TreeTagger
+from tg.taggerpool import TaggerPool, get_pool
+
+
+# stand-in tagger which copies SGML tags like TreeTagger
+COMMAND = "{} {}/fake_tagger.py".format(sys.executable,
+                                        config["test_data_dir"])
+
+SENTENCES = [ u"The cat sat on the mat .",
+              u"Dogs bark at 3 cats !",
+              u"Caf\xe9s open early ." ]
+
+
+class TestTaggerPool:
+
+    def setup(self):
+        self.pool = TaggerPool(2, COMMAND, "utf-8",
+                               TreeTagger.begin_marker,
+                               TreeTagger.end_marker,
+                               TreeTagger.flush_text)
+
+    def teardown(self):
+        self.pool.close()
+
+    def test_tag(self):
+        for sent in SENTENCES * 2:
+            lines = self.pool.tag(sent).splitlines()
+            assert [ l.split(u"\t")[0] for l in lines ] == sent.split()
+
+    def test_threads(self):
+        results = {}
+
+        def tag(i):
+            results[i] = self.pool.tag(SENTENCES[i % 3])
+
+        threads = [ threading.Thread(target=tag, args=(i,))
+                    for i in range(9) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for i, out in results.items():
+            assert out == self.pool.tag(SENTENCES[i % 3])
+
+    def test_restart(self):
+        out = self.pool.tag(SENTENCES[0])
+
+        for proc in self.pool._all:
+            if proc._proc:
+                proc._proc.kill()
+                proc._proc.wait()
+
+        assert self.pool.tag(SENTENCES[0]) == out
+
+    def test_close_early(self):
+        # more pending output than fits in a pipe buffer
+        text = u" ".join(SENTENCES * 20000)
+        done = threading.Event()
+
+        def tag():
+            lines = self.pool.iter_tag(text)
+            lines.next()
+            lines.close()
+            done.set()
+
+        thread = threading.Thread(target=tag)
+        thread.daemon = True
+        thread.start()
+        thread.join(30)
+        assert done.is_set(), "closing generator early must not hang"
+        assert self.pool.tag(SENTENCES[0]).count(u"\n") == 7
+
+    def test_get_pool(self):
+        pool = get_pool(1, COMMAND, "utf-8", TreeTagger.begin_marker,
+                        TreeTagger.end_marker, TreeTagger.flush_text)
+        pool.tag(SENTENCES[0])
+        # pools of another size do not replace those in use
+        pool2 = get_pool(2, COMMAND, "utf-8", TreeTagger.begin_marker,
+                         TreeTagger.end_marker, TreeTagger.flush_text)
+        assert pool2 is not pool
+        assert pool._all[0]._proc is not None
+        assert get_pool(1, COMMAND, "utf-8", TreeTagger.begin_marker,
+                        TreeTagger.end_marker,
+                        TreeTagger.flush_text) is pool
+
+    def test_annotator(self):
+        ids = "a", "b", "c"
+        annotator = TreeTagger(COMMAND, "utf-8", eos_pos_tag="SENT")
+        pooled_annotator = TreeTagger(COMMAND, "utf-8", eos_pos_tag="SENT",
+                                      pool_size=2)
+
+        for _ in range(2):
+            graphs = pooled_annotator.annot_sentences(SENTENCES, ids=ids)
+            assert ( [ g.source_lempos() for g in graphs ] ==
+                     [ g.source_lempos() for g in
+                       annotator.annot_sentences(SENTENCES, ids=ids) ] )
+            assert [ g.graph["id"] for g in graphs ] == list(ids)
+
+        text = u" ".join(SENTENCES)
+        graphs = pooled_annotator.annot_text(text)
+        assert len(graphs) == 3
+        assert ( [ g.source_lempos() for g in graphs ] ==
+                 [ g.source_lempos() for g in annotator.annot_text(text) ] )
@@ -1,11 +1,20 @@
+# -*- coding: utf-8 -*-
+
 """
 test translation dictionary
 """
 
+import collections
+import cPickle
+import os
+import shutil
+import tempfile
+
+import configobj
 from nose.tools import raises
 
 from tg.config import config
-from tg.transdict import TransDict
+from tg.transdict import TransDict, TransDictGreek, is_compiled
 
 
 
@@ -171,4 +180,217 @@ class TestMappedDict:
     def test_unkown_lemma_mwu(self):
         self.trans_dict.lookup_lemma("1q84 out")
         
-        
\ No newline at end of file
+        
+        
+class TestCompiledDict:
+    
+    @classmethod
+    def setup_class(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.trans_dict = TransDict.load(
+            config["test_data_dir"] + "/dict_sample_out_de-en.pkl")
+        path = os.path.join(cls.tmp_dir, "dict.tdc")
+        cls.trans_dict.dump_compiled(path)
+        assert is_compiled(path)
+        cls.compiled_dict = TransDict.load(path)
+        
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.tmp_dir)
+        
+    def test_entries(self):
+        assert ( sorted(self.compiled_dict.lempos_iteritems()) ==
+                 sorted(self.trans_dict.lempos_iteritems()) )
+        assert ( sorted(self.compiled_dict.lemma_iteritems()) ==
+                 sorted(self.trans_dict.lemma_iteritems()) )
+        
+    def test_lookup(self):
+        for lempos, _ in self.trans_dict.lempos_iteritems():
+            lemma = self.trans_dict._strip_pos(lempos)
+            assert ( self.compiled_dict._lempos_dict[lempos] == 
+                     self.trans_dict._lempos_dict[lempos] )
+            assert ( list(self.compiled_dict.lookup_lemma(lemma)) ==
+                     list(self.trans_dict.lookup_lemma(lemma)) )
+            # POS tags are mapped
+            assert ( list(self.compiled_dict[lemma + u"/ADJA"]) ==
+                     list(self.trans_dict[lemma + u"/ADJA"]) )
+        
+        assert ( self.compiled_dict.lookup_lempos(u"absolut/ADJD") ==
+                 (u"absolut/adj", 
+                  (u"total/jj", u"absolute/jj", u"rank/jj", u"thorough/jj")) )
+        assert self.compiled_dict.get(u"absolut/xyz") is not None
+        assert self.compiled_dict.get(u"1q84") is None
+        
+    @raises(KeyError)  
+    def test_unknown_lempos(self):
+        self.compiled_dict.lookup_lempos(u"Zugeh\xf6rigkeit/NN x/NN")
+        
+    def test_class(self):
+        greek_dict = TransDictGreek(pos_map={"NoCm": "nocm"})
+        greek_dict._lempos_dict = {u"\u03b3\u03ac\u03c4\u03b1/nocm": 
+                                   (u"cat/n",)}
+        greek_dict._lemma_dict = {u"\u03b3\u03ac\u03c4\u03b1": 
+                                  (u"\u03b3\u03ac\u03c4\u03b1/nocm",)}
+        path = os.path.join(self.tmp_dir, "greek.tdc")
+        greek_dict.dump_compiled(path)
+        compiled_dict = TransDict.load(path)
+        assert isinstance(compiled_dict, TransDictGreek)
+        assert ( compiled_dict.lookup_lempos(
+            u"\u03b3\u03ac\u03c4\u03b1/NoCmFeSgNm") == 
+                 (u"\u03b3\u03ac\u03c4\u03b1/nocm", (u"cat/n",)) )
+        
+        
+        
+class TestIndexedDict:
+    
+    @classmethod
+    def setup_class(cls):
+        cls.trans_dict = TransDict.load(
+            config["test_data_dir"] + "/dict_sample_out_de-en.pkl")
+        
+    def lookup(self, key):
+        # lookup without index and memo
+        try:
+            lempos = self.trans_dict._map_pos(key)
+            return [(lempos, self.trans_dict._lempos_dict[lempos])]
+        except (KeyError, ValueError):
+            lemma = self.trans_dict._strip_pos(key)
+            lempos_list = self.trans_dict._lemma_dict.get(lemma, ())
+            return [ (lempos, self.trans_dict._lempos_dict[lempos]) 
+                     for lempos in lempos_list ] or None
+        
+    def test_index(self):
+        assert self.trans_dict._index
+        keys = [u"1q84", u"1q84/NN", u"er/PPER", u"er/NN er/PPER"]
+        
+        for lempos in self.trans_dict._lempos_dict:
+            for tagger_pos in self.trans_dict.pos_map:
+                keys.append(u" ".join(pair.rsplit("/", 1)[0] + "/" + 
+                                      tagger_pos for pair in lempos.split()))
+        
+        # second time from memo
+        for _ in range(2):
+            for key in keys:
+                expected = self.lookup(key)
+                assert self.trans_dict.get(key) is None or expected
+                assert list(self.trans_dict.get(key, [])) == (expected or [])
+                
+                if key in self.trans_dict._index:
+                    assert self.trans_dict.lookup_lempos(key) == expected[0]
+                    
+        assert len(self.trans_dict._memo) == len(set(keys))
+        assert u"er/PPER" in self.trans_dict._index
+        assert u"er/NN er/PPER" not in self.trans_dict._index
+        
+    def test_pickle(self):
+        self.trans_dict.get(u"er/PPER")
+        trans_dict = cPickle.loads(cPickle.dumps(self.trans_dict))
+        assert "_memo" not in self.trans_dict.__getstate__()
+        assert trans_dict._memo == {}
+        assert trans_dict._index == self.trans_dict._index
+        
+    def test_memo_size(self):
+        trans_dict = TransDict.load(
+            config["test_data_dir"] + "/dict_sample_out_de-en.pkl")
+        trans_dict.memo_size = 2
+        
+        for key in u"a", u"b", u"c":
+            trans_dict.get(key)
+            
+        assert trans_dict._memo == {u"c": None}
+        
+        
+        
+class TestGreekDict:
+    
+    def test_map_pos(self):
+        pos_map = configobj.ConfigObj(config["dict"]["gr-de"]["posmap_fname"])
+        trans_dict = TransDictGreek(pos_map=pos_map)
+        
+        for tag, mapped in [ ("NoCmFeSgAc", "nocm"),
+                             ("NoPrMaSgNm", "nopr"),
+                             ("VbMnIdPr03SgXxIpAvXx", "vbmn"),
+                             ("AsPpSp", "aspp"),
+                             ("PtFu", ""),
+                             ("No", ""),
+                             ("", "") ]:
+            # second time from memo
+            assert trans_dict._map_single_pos(tag) == mapped
+            assert trans_dict._map_single_pos(tag) == mapped
+            
+        assert ( trans_dict._map_pos(u"γάτα/NoCmFeSgNm "
+                                     u"είναι/VbMnXx") 
+                 == u"γάτα/nocm "
+                 u"είναι/vbmn" )
+        assert trans_dict._pos_memo["PtFu"] == ""
+        assert "_pos_memo" not in trans_dict.__getstate__()
+        
+    def test_longest_match(self):
+        for items in [ [("No", "no"), ("NoCm", "nocm")],
+                       [("NoCm", "nocm"), ("No", "no")] ]:
+            trans_dict = TransDictGreek(pos_map=collections.OrderedDict(items))
+            assert trans_dict._map_single_pos("NoCmFeSgAc") == "nocm"
+            assert trans_dict._map_single_pos("NoPrFeSgAc") == "no"
+            assert trans_dict._map_single_pos("N") == ""
+        
+        
+        
+class TestFromXML:
+    
+    @classmethod
+    def setup_class(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.lex_fname = os.path.join(cls.tmp_dir, "lex.xml")
+        entries = []
+        
+        for i in range(200):
+            entries.append(
+                u'<entry id="{0}">\n'
+                u'<slLemma tag="n">Wort{1}</slLemma>\n'
+                u'<tlLemma tag="n">word{0}</tlLemma>\n'
+                u'</entry>\n'.format(i, i % 50))
+            
+        entries += [
+            u'<entry id="mwu"><slLemma tag="vv">hin</slLemma>'
+            u'<slLemma tag="vv">werfen</slLemma>'
+            u'<tlLemma tag="vv">throw</tlLemma></entry>\n',
+            # ill-formed
+            u'<entry id="bad"><slLemma tag="n"></slLemma>'
+            u'<tlLemma tag="n">x</tlLemma></entry>\n',
+            u'<entry id="amp"><slLemma tag="a/b">Größe &amp; Co</slLemma>'
+            u'<tlLemma tag="n">size</tlLemma></entry>\n' ]
+        
+        with open(cls.lex_fname, "w") as f:
+            f.write('<?xml version="1.0" encoding="utf-8"?>\n<lexicon>\n')
+            f.write(u"".join(entries).encode("utf-8"))
+            f.write("</lexicon>\n")
+        
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.tmp_dir)
+        
+    def entries(self, trans_dict):
+        return ( sorted( (k, sorted(v)) for k, v in 
+                         trans_dict._lempos_dict.iteritems() ), 
+                 sorted( (k, sorted(v)) for k, v in 
+                         trans_dict._lemma_dict.iteritems() ) )
+        
+    def test_from_xml(self):
+        trans_dict = TransDict.from_xml(self.lex_fname)
+        assert len(trans_dict._lempos_dict) == 51
+        assert sorted(trans_dict._lempos_dict[u"Wort3/n"]) == [
+            u"word103/n", u"word153/n", u"word3/n", u"word53/n"]
+        assert trans_dict._lemma_dict[u"hin werfen"] == (u"hin/vv werfen/vv",)
+        assert u"Größe" not in trans_dict._lemma_dict
+        
+        reverse_dict = TransDict.from_xml(self.lex_fname, reverse=True)
+        assert reverse_dict._lempos_dict[u"throw/vv"] == (u"hin/vv werfen/vv",)
+        
+        for workers in 2, 3, 8:
+            assert ( self.entries(TransDict.from_xml(self.lex_fname, 
+                                                     workers=workers)) ==
+                     self.entries(trans_dict) )
+            
+        pair = TransDict.from_xml_pair(self.lex_fname, workers=3)
+        assert self.entries(pair[0]) == self.entries(trans_dict)
+        assert self.entries(pair[1]) == self.entries(reverse_dict)
@@ -0,0 +1,213 @@
+"""
+test translation graphs
+"""
+
+from cPickle import load, loads, dumps, HIGHEST_PROTOCOL
+
+import numpy as np
+
+from tg.config import config
+from tg.exception import TGException
+from tg.transgraph import TransGraph
+
+
+class TestTransGraph:
+
+    @classmethod
+    def setup_class(cls):
+        # graphs pickled before the word order index was introduced
+        graphs_fname = config["test_data_dir"] + "/graphs_sample_out_de-en.pkl"
+        cls.graphs = load(open(graphs_fname))
+
+    def test_ordered_source_nodes(self):
+        for graph in self.graphs:
+            nodes = graph.source_nodes(ordered=True)
+            assert len(nodes) == len(graph.source_nodes())
+            assert nodes[0] == graph.source_start_node
+
+            for u, v in zip(nodes, nodes[1:]):
+                assert graph.edge[u][v]["name"] == "next"
+                assert graph.is_first_node(v) is False
+
+    def test_parts(self):
+        for graph in self.graphs:
+            order = dict( (u, i) for i, u in
+                          enumerate(graph.source_nodes(ordered=True)) )
+
+            for u in graph:
+                if graph.is_hyper_source_node(u):
+                    parts = list(graph.source_parts_iter(u))
+                    assert ( sorted(parts) ==
+                             sorted(graph.predecessors(u)) )
+                    positions = [ order[v] for v in parts ]
+                    assert positions == range(positions[0],
+                                              positions[0] + len(parts))
+
+    def test_hyper_source_node_mid_sentence(self):
+        graph = TransGraph()
+        nodes = [ graph.add_source_node(word=w, lemma=w, pos="NN")
+                  for w in "a b c d".split() ]
+        graph.set_source_start_node(nodes[0])
+
+        for u, v in zip(nodes, nodes[1:]):
+            graph.add_word_order_edge(u, v)
+
+        hs = graph.add_hyper_source_node(nodes[1:3])
+        assert list(graph.source_parts_iter(hs)) == nodes[1:3]
+        assert list(graph.ordered_nodes_iter(nodes[:0:-1])) == nodes[1:]
+        assert graph.lemma(hs) == "b c"
+
+    def test_typed_edges(self):
+        for graph in self.graphs:
+            edges = graph.edges(data=True)
+
+            for name, typed_edges in [
+                ("trans", graph.trans_edges_iter()),
+                ("next", graph.word_order_edges_iter()),
+                ("part", graph.part_edges_iter()) ]:
+                assert ( sorted(typed_edges) ==
+                         sorted( e for e in edges if e[2]["name"] == name ) )
+
+    def test_trans_edge_arrays(self):
+        for graph in self.graphs:
+            graph = loads(dumps(graph, HIGHEST_PROTOCOL))
+            sources, targets, data = graph.trans_edge_arrays()
+            assert ( zip(sources, targets, data) ==
+                     list(graph.trans_edges_iter()) )
+            # data are references rather than copies
+            for d in data:
+                d["test_score"] = 1.0
+            assert all( d["test_score"] == 1.0 for _, _, d in
+                        graph.trans_edges_iter() )
+            # edges from the same source node are contiguous
+            changes = (sources[1:] != sources[:-1]).sum()
+            assert changes + 1 == len(set(sources))
+
+    def test_score_column(self):
+        for graph in self.graphs:
+            graph = loads(dumps(graph, HIGHEST_PROTOCOL))
+            scores = graph.score_column("freq_score")
+            data = graph.trans_edge_arrays()[2]
+            assert len(scores) == len(data)
+
+            for score, d in zip(scores, data):
+                if "freq_score" in d:
+                    assert score == d["freq_score"]
+                else:
+                    assert np.isnan(score)
+
+            # NaN leaves scores untouched
+            graph.set_score_column("freq_score", scores * np.nan)
+            np.testing.assert_array_equal(graph.score_column("freq_score"),
+                                          scores)
+            graph.set_score_column("test_score", scores)
+            np.testing.assert_array_equal(graph.score_column("test_score"),
+                                          scores)
+
+    def test_max_score(self):
+        for graph in self.graphs:
+            graph = loads(dumps(graph, HIGHEST_PROTOCOL))
+            graph.clear_max_scores()
+
+            for u in graph.source_nodes():
+                max_score, max_node = None, None
+
+                # first max wins
+                for _, v, d in graph.trans_edges_iter(u):
+                    if d.get("freq_score") > max_score:
+                        max_score, max_node = d["freq_score"], v
+
+                assert graph.max_score(u, "freq_score") == (max_score,
+                                                            max_node)
+
+            assert graph.max_score(u, "no_score") == (None, None)
+
+    def test_max_score_cache(self):
+        graph = loads(dumps(self.graphs[0], HIGHEST_PROTOCOL))
+        # cached max scores from old pickles are dropped
+        assert all( graph.max_scores_cache not in data
+                    for data in graph.node.itervalues() )
+        u = graph.source_start_node
+        score, v = graph.max_score(u, "freq_score")
+        # writing a score invalidates the cache
+        graph.set_score(u, v, "freq_score", -1.0)
+        assert graph.max_score(u, "freq_score")[1] != v
+        graph.set_score(u, v, "freq_score", score + 1.0)
+        assert graph.max_score(u, "freq_score") == (score + 1.0, v)
+        # so does removing a translation edge
+        graph.remove_edge(u, v)
+        assert graph.max_score(u, "freq_score")[1] != v
+        # cached max scores are not pickled
+        graph2 = loads(dumps(graph, HIGHEST_PROTOCOL))
+        assert graph2._max_scores == {}
+        assert ( graph2.max_score(u, "freq_score") ==
+                 graph.max_score(u, "freq_score") )
+
+    def test_view(self):
+        graph = loads(dumps(self.graphs[0], HIGHEST_PROTOCOL))
+        scores = graph.score_column("freq_score")
+        view = graph.view()
+        view.set_score_column("freq_score", scores + 1.0)
+        u = graph.source_start_node
+        v = view.max_score(u, "freq_score")[1]
+        view.set_score(u, v, "test_score", 1.0)
+        data = view.trans_edge_arrays()[2]
+        view.set_scores("test_score", data, [2.0] * len(data))
+        # writes to the view do not affect the base graph
+        np.testing.assert_array_equal(graph.score_column("freq_score"),
+                                      scores)
+        assert np.isnan(graph.score_column("test_score")).all()
+        np.testing.assert_array_equal(view.score_column("freq_score"),
+                                      scores + 1.0)
+        assert (view.score_column("test_score") == 2.0).all()
+        assert view.edge[u][v] is view.pred[v][u]
+        assert ( view.max_score(u, "freq_score")[0] ==
+                 graph.max_score(u, "freq_score")[0] + 1.0 )
+        # but share everything else
+        assert view.node is graph.node
+        assert view.source_lempos() == graph.source_lempos()
+
+        try:
+            view.add_target_node(lemma="x", pos="y")
+        except TGException:
+            pass
+        else:
+            assert False, "view must be read-only"
+
+    def test_view_set_scores(self):
+        graph = self.graphs[0]
+        view = graph.view()
+        # edge data read before writing, as by the scorers
+        edge_data = [ (u, [ data for _, _, data in view.trans_edges_iter(u) ])
+                      for u in view.source_nodes() ]
+
+        for attr in "test_score", "test_score2":
+            for u, data in edge_data:
+                view.set_scores(attr, data, range(len(data)))
+
+        for u, _ in edge_data:
+            for k, (_, v, data) in enumerate(view.trans_edges_iter(u)):
+                assert data["test_score"] == data["test_score2"] == k
+                assert "test_score" not in graph.edge[u][v]
+
+        view2 = loads(dumps(view, HIGHEST_PROTOCOL))
+        assert view2._edge_ids is None
+
+    def test_remove_node(self):
+        graph = loads(dumps(self.graphs[0], HIGHEST_PROTOCOL))
+        nodes = graph.source_nodes(ordered=True)
+        graph.remove_node(nodes[1])
+        assert graph.source_nodes(ordered=True) == nodes[:1]
+        assert graph.is_first_node(nodes[2])
+
+        for u in graph.nodes():
+            if graph.is_hyper_source_node(u):
+                assert nodes[1] not in list(graph.source_parts_iter(u))
+
+    def test_pickle(self):
+        for graph in self.graphs:
+            graph2 = loads(dumps(graph, HIGHEST_PROTOCOL))
+            assert graph2._next == graph._next
+            assert graph2._prev == graph._prev
+            assert graph2._parts == graph._parts
+            assert graph2.source_lempos() == graph.source_lempos()